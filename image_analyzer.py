@@ -1,4 +1,7 @@
 # Importación de bibliotecas para un asistente de IA con Google Gemini usando LangChain
+# (langchain y el cliente de Gemini se importan en segundo plano para acelerar el arranque)
+import time
+_PROCESS_START = time.perf_counter()
 import os
 # Importación de bibliotecas para la interfaz gráfica
 import tkinter as tk
@@ -7,28 +10,603 @@ from PIL import Image, ImageTk
 import cv2
 import numpy as np
 import threading
-import os
 import json
+import re
 import base64
+import bisect
+import hashlib
+import random
+import uuid
+import math
+import argparse
+import platform
+import csv
+import queue
+import multiprocessing
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
 from datetime import datetime
 from dotenv import load_dotenv
-from langchain_core.messages import HumanMessage, AIMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
+import xxhash
 
 # Importación de variables de entorno
 load_dotenv()
 
-# Verificación de la clave API
-if 'GEMINI_API_KEY' not in os.environ:
-    raise ValueError("Error: La variable de entorno 'GEMINI_API_KEY' no está establecida.")
+# Backends del modelo: "gemini" (por defecto), "record" y "replay"
+MODEL_BACKEND = os.getenv('MODEL_BACKEND', 'gemini').lower()
+MODEL_CASSETTE_DIR = os.getenv('MODEL_CASSETTE_DIR', 'model_cassettes')
+
+def fingerprint_messages(messages):
+    """Calcula una huella estable (sha256) del contenido de una petición al modelo"""
+    payload = []
+    for message in messages:
+        payload.append({"type": message.type, "content": message.content})
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+class RecordingModel:
+    """Envuelve un modelo real y guarda cada respuesta en disco por huella"""
+    def __init__(self, inner, cassette_dir):
+        self.inner = inner
+        self.cassette_dir = cassette_dir
+        os.makedirs(cassette_dir, exist_ok=True)
+
+    def invoke(self, messages, **kwargs):
+        start = time.perf_counter()
+        response = self.inner.invoke(messages, **kwargs)
+        latency_ms = (time.perf_counter() - start) * 1000.0
+        self._save(fingerprint_messages(messages), response.content, latency_ms,
+                   getattr(response, "usage_metadata", None))
+        return response
+
+    def stream(self, messages, **kwargs):
+        start = time.perf_counter()
+        chunks = []
+        for chunk in self.inner.stream(messages, **kwargs):
+            chunks.append(chunk.content)
+            yield chunk
+        latency_ms = (time.perf_counter() - start) * 1000.0
+        self._save(fingerprint_messages(messages), "".join(chunks), latency_ms)
+
+    def _save(self, fingerprint, content, latency_ms, usage_metadata=None):
+        """Escribe la entrada de la grabación de forma atómica"""
+        entry = {
+            "fingerprint": fingerprint,
+            "content": content,
+            "latency_ms": round(latency_ms, 1),
+            "recorded_at": datetime.now().isoformat()
+        }
+        if usage_metadata:
+            entry["usage_metadata"] = dict(usage_metadata)
+        path = os.path.join(self.cassette_dir, f"{fingerprint}.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+class ReplayModel:
+    """Sirve respuestas grabadas con latencia sintética y streaming opcional, sin red"""
+    def __init__(self, cassette_dir, latency_ms=None, jitter_ms=0.0, chunk_chars=40,
+                 strict=False, seed=0):
+        self.cassette_dir = cassette_dir
+        self.latency_ms = latency_ms  # None = usar la latencia grabada
+        self.jitter_ms = jitter_ms
+        self.chunk_chars = max(1, chunk_chars)
+        self.strict = strict
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.isdir(cassette_dir):
+            for file_name in sorted(os.listdir(cassette_dir)):
+                if not file_name.endswith('.json'):
+                    continue
+                with open(os.path.join(cassette_dir, file_name), 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+                self.entries[entry["fingerprint"]] = entry
+        self._ordered = [self.entries[k] for k in sorted(self.entries)]
+
+    def _lookup(self, messages):
+        """Busca la respuesta por huella; fuera de modo estricto elige una de forma determinista"""
+        fingerprint = fingerprint_messages(messages)
+        entry = self.entries.get(fingerprint)
+        if entry is not None:
+            return entry
+        if self.strict or not self._ordered:
+            raise KeyError(f"No hay respuesta grabada para la petición {fingerprint[:12]}")
+        return self._ordered[int(fingerprint, 16) % len(self._ordered)]
+
+    def _latency_seconds(self, entry):
+        base = self.latency_ms if self.latency_ms is not None else entry.get("latency_ms", 0.0)
+        with self._lock:
+            jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, base + jitter) / 1000.0
+
+    def invoke(self, messages, **kwargs):
+        from langchain_core.messages import AIMessage
+        entry = self._lookup(messages)
+        time.sleep(self._latency_seconds(entry))
+        if entry.get("usage_metadata"):
+            return AIMessage(content=entry["content"], usage_metadata=entry["usage_metadata"])
+        return AIMessage(content=entry["content"])
+
+    def stream(self, messages, **kwargs):
+        from langchain_core.messages import AIMessageChunk
+        entry = self._lookup(messages)
+        content = entry["content"]
+        pieces = [content[i:i + self.chunk_chars] for i in range(0, len(content), self.chunk_chars)] or [""]
+        delay = self._latency_seconds(entry) / len(pieces)
+        for piece in pieces:
+            time.sleep(delay)
+            yield AIMessageChunk(content=piece)
+
+def _create_gemini_llm():
+    """Crea el cliente real de Gemini (requiere GEMINI_API_KEY)"""
+    # Verificación de la clave API
+    if 'GEMINI_API_KEY' not in os.environ:
+        raise ValueError("Error: La variable de entorno 'GEMINI_API_KEY' no está establecida.")
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash",
+        google_api_key=os.getenv('GEMINI_API_KEY'),
+        temperature=0.2
+    )
+
+# Cliente resistente: plazos, reintentos con backoff, limitador de tasa y peticiones cubiertas
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "BadGateway", "GatewayTimeout", "ServerError"
+}
+# Estados gRPC / Google API equivalentes a 429 y 5xx (campo status o code.name)
+RETRYABLE_STATUS_NAMES = {"RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED", "INTERNAL"}
+
+class ModelCallError(RuntimeError):
+    """Fallo definitivo de una llamada al modelo tras plazos y reintentos"""
+
+def _error_status(error):
+    """Código HTTP o nombre de estado declarado por la excepción (no se analiza el mensaje)"""
+    response = getattr(error, "response", None)
+    for status in (getattr(error, "status_code", None), getattr(error, "code", None),
+                   getattr(response, "status_code", None), getattr(error, "status", None)):
+        if isinstance(status, int) and not isinstance(status, bool):
+            return status
+        name = status if isinstance(status, str) else getattr(status, "name", None)
+        if isinstance(name, str):
+            return name.upper()
+    return None
+
+def is_retryable_error(error):
+    """Errores transitorios: plazos, conexión, 429 y 5xx (también si vienen envueltos en otra excepción)"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (TimeoutError, ConnectionError)):
+            return True
+        if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+            return True
+        status = _error_status(error)
+        if isinstance(status, int):
+            return status == 429 or 500 <= status < 600
+        if status in RETRYABLE_STATUS_NAMES:
+            return True
+        error = error.__cause__
+    return False
+
+class RateLimiter:
+    """Limitador de tasa del lado del cliente (token bucket)"""
+    def __init__(self, requests_per_minute, burst=None):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst or max(1, int(requests_per_minute // 10)))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline):
+        """Espera un token; lanza TimeoutError si la espera superaría el plazo"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                raise TimeoutError("Límite de peticiones: la espera supera el plazo de la llamada")
+            time.sleep(wait)
+
+class ResilientModel:
+    """Envuelve un backend con plazos por llamada, reintentos (tenacity) y peticiones cubiertas"""
+    def __init__(self, inner, timeout=60.0, max_retries=3, backoff_initial=1.0, backoff_max=20.0,
+                 rate_limit_rpm=0, hedge_percentile=0, hedge_min_samples=20, hedge_min_delay=0.5):
+        self.inner = inner
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.rate_limiter = RateLimiter(rate_limit_rpm) if rate_limit_rpm > 0 else None
+        self.hedge_percentile = hedge_percentile  # 0 = sin peticiones cubiertas
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.latencies = deque(maxlen=200)
+        self.counters = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "timeouts": 0, "failures": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def format_stats(self):
+        """Contadores en una línea para la superposición de rendimiento"""
+        c = self.stats()
+        return (f"modelo: {c['calls']} llamadas, {c['retries']} reintentos, {c['hedges']} cubiertas "
+                f"({c['hedge_wins']} ganadas), {c['timeouts']} plazos, {c['failures']} fallos")
+
+    def _hedge_delay(self):
+        """Retardo antes de lanzar el duplicado: percentil configurado de las latencias recientes"""
+        if not self.hedge_percentile:
+            return None
+        with self._lock:
+            samples = sorted(self.latencies)
+        if len(samples) < self.hedge_min_samples:
+            return None
+        index = min(len(samples) - 1, int(self.hedge_percentile / 100.0 * len(samples)))
+        return max(self.hedge_min_delay, samples[index])
+
+    def _run_attempt(self, messages, kwargs, deadline):
+        """Un intento (más su duplicado si tarda más que el percentil) limitado por el plazo"""
+        done = threading.Event()
+        results = []  # (es_duplicado, ok, valor o excepción, latencia)
+        results_lock = threading.Lock()
+        
+        def call(is_hedge):
+            start = time.perf_counter()
+            try:
+                outcome = (is_hedge, True, self.inner.invoke(messages, **kwargs), time.perf_counter() - start)
+            except Exception as e:
+                outcome = (is_hedge, False, e, None)
+            with results_lock:
+                results.append(outcome)
+            done.set()
+        
+        def launch(is_hedge):
+            # Hilos daemon: una llamada bloqueada no impide cerrar la aplicación
+            thread = threading.Thread(target=call, args=(is_hedge,))
+            thread.daemon = True
+            thread.start()
+        
+        if deadline - time.monotonic() <= 0:
+            self._count("timeouts")
+            raise TimeoutError(f"El modelo no respondió en {self.timeout:g} s")
+        launch(False)
+        launched = 1
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is not None:
+            wait = min(hedge_delay, max(deadline - time.monotonic(), 0.0))
+            if not done.wait(wait) and time.monotonic() < deadline:
+                self._count("hedges")
+                launch(True)
+                launched = 2
+        
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._count("timeouts")
+                raise TimeoutError(f"El modelo no respondió en {self.timeout:g} s")
+            done.wait(remaining)
+            with results_lock:
+                successes = [result for result in results if result[1]]
+                if successes:
+                    is_hedge, _, value, latency = successes[0]
+                    break
+                if len(results) == launched:
+                    raise results[0][2]
+                done.clear()
+        
+        if is_hedge:
+            self._count("hedge_wins")
+        with self._lock:
+            self.latencies.append(latency)
+        return value
+
+    def invoke(self, messages, **kwargs):
+        from tenacity import Retrying, stop_any, stop_after_attempt, wait_random_exponential, retry_if_exception
+        self._count("calls")
+        deadline = time.monotonic() + self.timeout
+        backoff = wait_random_exponential(multiplier=self.backoff_initial, max=self.backoff_max)
+        retrying = Retrying(
+            # El plazo acota también las esperas entre intentos
+            stop=stop_any(stop_after_attempt(self.max_retries + 1), lambda retry_state: time.monotonic() >= deadline),
+            wait=lambda retry_state: min(backoff(retry_state), max(0.0, deadline - time.monotonic())),
+            retry=retry_if_exception(is_retryable_error),
+            before_sleep=lambda retry_state: self._count("retries"),
+            reraise=True
+        )
+        last_error = None
+        try:
+            for attempt in retrying:
+                with attempt:
+                    # Sin tiempo para otro intento: se propaga el último error real, no un plazo vencido
+                    if last_error is not None and time.monotonic() >= deadline:
+                        raise last_error
+                    try:
+                        if self.rate_limiter is not None:
+                            self.rate_limiter.acquire(deadline)
+                        return self._run_attempt(messages, kwargs, deadline)
+                    except Exception as e:
+                        if not isinstance(e, TimeoutError):
+                            last_error = e
+                        raise
+        except Exception as e:
+            self._count("failures")
+            if isinstance(e, TimeoutError):
+                raise ModelCallError(f"El modelo no respondió a tiempo ({self.timeout:g} s)") from e
+            if is_retryable_error(e):
+                raise ModelCallError(f"El servicio del modelo no está disponible tras {self.max_retries + 1} intentos: {e}") from e
+            raise
+
+    def stream(self, messages, **kwargs):
+        """Streaming sin reintentos (no se puede repetir a mitad de respuesta) pero con el mismo plazo"""
+        self._count("calls")
+        deadline = time.monotonic() + self.timeout
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(deadline)
+        chunks = queue.Queue()
+        finished = object()
+        stop = threading.Event()
+        
+        def produce():
+            try:
+                for chunk in self.inner.stream(messages, **kwargs):
+                    if stop.is_set():
+                        return
+                    chunks.put((True, chunk))
+                chunks.put((True, finished))
+            except Exception as e:
+                chunks.put((False, e))
+        
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining <= 0:
+                        raise queue.Empty
+                    ok, item = chunks.get(timeout=remaining)
+                except queue.Empty:
+                    self._count("timeouts")
+                    self._count("failures")
+                    raise ModelCallError(f"El modelo no respondió a tiempo ({self.timeout:g} s)") from None
+                if not ok:
+                    self._count("failures")
+                    raise item
+                if item is finished:
+                    return
+                yield item
+        finally:
+            stop.set()
+
+def create_llm(backend=MODEL_BACKEND, cassette_dir=MODEL_CASSETTE_DIR):
+    """Construye el backend configurado envuelto en el cliente resistente"""
+    return ResilientModel(
+        _create_backend(backend, cassette_dir),
+        timeout=float(os.getenv('MODEL_TIMEOUT_S', '60')),
+        max_retries=int(os.getenv('MODEL_MAX_RETRIES', '3')),
+        rate_limit_rpm=float(os.getenv('MODEL_RATE_LIMIT_RPM', '0')),
+        hedge_percentile=float(os.getenv('MODEL_HEDGE_PERCENTILE', '0'))
+    )
+
+def _create_backend(backend, cassette_dir):
+    """Construye el backend del modelo indicado por configuración"""
+    if backend == 'gemini':
+        return _create_gemini_llm()
+    if backend == 'record':
+        return RecordingModel(_create_gemini_llm(), cassette_dir)
+    if backend == 'replay':
+        latency = os.getenv('REPLAY_LATENCY_MS')
+        return ReplayModel(
+            cassette_dir,
+            latency_ms=float(latency) if latency else None,
+            jitter_ms=float(os.getenv('REPLAY_JITTER_MS', '0')),
+            chunk_chars=int(os.getenv('REPLAY_CHUNK_CHARS', '40')),
+            strict=os.getenv('REPLAY_STRICT') == '1'
+        )
+    raise ValueError(f"Error: backend de modelo desconocido '{backend}' (use gemini, record o replay)")
+
+# Instrumentación de rendimiento por etapa
+class _NullStageTimer:
+    """Temporizador vacío usado cuando la instrumentación está desactivada"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_STAGE_TIMER = _NullStageTimer()
+
+class _StageTimer:
+    """Mide el tiempo de una etapa y lo registra al salir del bloque"""
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed_ms = (time.perf_counter() - self.start) * 1000.0
+        self.stats.record(self.name, elapsed_ms, error=exc_type is not None)
+        return False
+
+class PerfStats:
+    """Histogramas móviles de tiempos por etapa y registro en JSON lines"""
+    # Límites superiores (ms) de los cubos del histograma
+    BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+    def __init__(self, window=256, log_path=None, enabled=False):
+        self.enabled = enabled
+        self.window = window
+        self.log_path = log_path
+        self.samples = {}  # etapa -> deque con las últimas muestras (ms)
+        self._lock = threading.Lock()
+        self._log_file = None
+
+    def stage(self, name):
+        """Devuelve un context manager que mide la etapa indicada"""
+        if not self.enabled:
+            return _NULL_STAGE_TIMER
+        return _StageTimer(self, name)
+
+    def record(self, name, elapsed_ms, **extra):
+        """Registra una muestra de tiempo para una etapa"""
+        if not self.enabled:
+            return
+        with self._lock:
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = deque(maxlen=self.window)
+            samples.append(elapsed_ms)
+            if self.log_path:
+                self._write_log(name, elapsed_ms, extra)
+
+    def _write_log(self, name, elapsed_ms, extra):
+        """Escribe una línea JSON en el archivo de registro (con el lock tomado)"""
+        try:
+            if self._log_file is None:
+                self._log_file = open(self.log_path, 'a', encoding='utf-8')
+            entry = {"ts": datetime.now().isoformat(), "stage": name, "ms": round(elapsed_ms, 3)}
+            entry.update(extra)
+            self._log_file.write(json.dumps(entry) + "\n")
+            self._log_file.flush()
+        except OSError as e:
+            print(f"Error writing perf log: {e}")
+            self.log_path = None
+
+    def reset(self):
+        """Descarta todas las muestras acumuladas"""
+        with self._lock:
+            self.samples = {}
+
+    def summary(self):
+        """Resumen por etapa: conteo, media, percentiles e histograma"""
+        with self._lock:
+            snapshot = {name: sorted(samples) for name, samples in self.samples.items()}
+
+        result = {}
+        for name, values in snapshot.items():
+            if not values:
+                continue
+            histogram = [0] * (len(self.BUCKETS_MS) + 1)
+            for value in values:
+                histogram[bisect.bisect_left(self.BUCKETS_MS, value)] += 1
+            count = len(values)
+            result[name] = {
+                "count": count,
+                "mean": sum(values) / count,
+                "p50": values[int(0.50 * (count - 1))],
+                "p95": values[int(0.95 * (count - 1))],
+                "max": values[-1],
+                "histogram": histogram
+            }
+        return result
+
+    def format_summary(self):
+        """Resumen legible para la superposición de la interfaz"""
+        summary = self.summary()
+        if not summary:
+            return "Sin muestras todavía"
+        lines = [f"{'etapa (ms)':<26}{'n':>5}{'p50':>9}{'p95':>9}{'max':>9}"]
+        for name in sorted(summary):
+            s = summary[name]
+            lines.append(f"{name:<26}{s['count']:>5}{s['p50']:>9.1f}{s['p95']:>9.1f}{s['max']:>9.1f}")
+        return "\n".join(lines)
+
+    def close(self):
+        """Cierra el archivo de registro si está abierto"""
+        with self._lock:
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
 
-# Definición del modelo LangChain
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    google_api_key=os.getenv('GEMINI_API_KEY'),
-    temperature=0.2
+# Instancia global: PERF_STATS=1 o PERF_LOG_FILE la dejan siempre activa (el registro no depende de la superposición)
+PERF_STATS_ALWAYS_ON = os.getenv('PERF_STATS') == '1' or bool(os.getenv('PERF_LOG_FILE'))
+perf_stats = PerfStats(
+    log_path=os.getenv('PERF_LOG_FILE'),
+    enabled=PERF_STATS_ALWAYS_ON
 )
 
+class StartupTimer:
+    """Marca las fases del arranque para vigilar el tiempo hasta mostrar la ventana"""
+    def __init__(self, start):
+        self.start = start
+        self.phases = []  # Lista de (fase, ms desde el inicio del proceso)
+
+    def mark(self, phase):
+        elapsed_ms = (time.perf_counter() - self.start) * 1000.0
+        self.phases.append((phase, elapsed_ms))
+        perf_stats.record(f"startup.{phase}", elapsed_ms)
+
+    def report(self):
+        """Informe legible con el tiempo acumulado y el incremento de cada fase"""
+        lines = ["Tiempos de arranque:"]
+        previous = 0.0
+        for phase, elapsed_ms in self.phases:
+            lines.append(f"  {phase:<16}{elapsed_ms:>9.1f} ms  (+{elapsed_ms - previous:.1f} ms)")
+            previous = elapsed_ms
+        return "\n".join(lines)
+
+startup_timer = StartupTimer(_PROCESS_START)
+
+# Definición del modelo LangChain (se construye en segundo plano, ver get_llm)
+llm = None
+_llm_error = None
+_llm_ready = threading.Event()
+_llm_warm_up_started = False
+_llm_lock = threading.Lock()
+
+def _warm_up_llm():
+    """Importa la pila del modelo y construye el cliente"""
+    global llm, _llm_error
+    try:
+        import langchain_core.messages  # noqa: F401 - precarga de la pila de mensajes
+        startup_timer.mark("model_imports")
+        llm = create_llm()
+        startup_timer.mark("model_ready")
+    except Exception as e:
+        _llm_error = e
+        startup_timer.mark("model_failed")
+    finally:
+        _llm_ready.set()
+
+def start_llm_warm_up():
+    """Inicia (una sola vez) la construcción del modelo en un hilo en segundo plano"""
+    global _llm_warm_up_started
+    with _llm_lock:
+        if _llm_warm_up_started:
+            return
+        _llm_warm_up_started = True
+    thread = threading.Thread(target=_warm_up_llm)
+    thread.daemon = True
+    thread.start()
+
+def get_llm(timeout=None):
+    """Devuelve el cliente del modelo, esperando a que termine el calentamiento"""
+    start_llm_warm_up()
+    if not _llm_ready.wait(timeout):
+        raise TimeoutError("El modelo todavía se está inicializando")
+    if _llm_error is not None:
+        raise _llm_error
+    return llm
+
 # Prompts del sistema
 VISION_PROMPT = """
 Eres un asistente especializado en análisis y procesamiento de imágenes.
@@ -127,41 +705,98 @@ IMPORTANTE:
 Responde de manera conversacional y amigable.
 """
 
+# Política para volver a adjuntar imágenes en los turnos de conversación
+IMAGE_REATTACH_TURNS = 5  # Turnos máximos enviando solo el resumen estadístico
+STRUCTURAL_CONTROLS = ("rotation", "flip_h", "flip_v")  # Cambios que el resumen no describe
+VISUAL_KEYWORDS = ("mira", "observa", "compara", "fíjate", "fijate", "cómo se ve", "como se ve",
+                   "cómo quedó", "como quedo", "qué ves", "que ves", "adjunt")
+
+def content_id(data):
+    """Identificador del contenido (xxh3 de 128 bits) usado como clave de las conversaciones"""
+    return xxhash.xxh3_128_hexdigest(data)
+
+def video_content_id(path, sample_bytes=1 << 20):
+    """Identificador de un vídeo a partir de su tamaño y de su primer y último MiB"""
+    size = os.path.getsize(path)
+    digest = xxhash.xxh3_128(str(size).encode("utf-8"))
+    with open(path, "rb") as f:
+        digest.update(f.read(sample_bytes))
+        if size > sample_bytes:
+            f.seek(max(sample_bytes, size - sample_bytes))
+            digest.update(f.read(sample_bytes))
+    return digest.hexdigest()
+
 # Clase para manejar el contexto de diálogo con memoria por imagen
 class DialogContext:
     def __init__(self):
-        # Memoria separada por imagen (key: nombre_archivo)
+        # Memoria separada por imagen (key: hash del contenido; los nombres de archivo son alias)
         self.image_conversations = {}
+        self.current_image_id = None
         self.current_image_name = None
         self.current_image_data = None
         self.current_image_path = None
         
-    def set_current_image(self, image_data, image_path):
-        """Establece la imagen actual y crea/recupera su conversación"""
-        self.current_image_data = image_data
+    def set_current_image(self, image_data, image_path, image_id=None):
+        """Establece la imagen actual y crea/recupera su conversación; devuelve True si el contenido ya estaba en memoria"""
         self.current_image_path = image_path
         self.current_image_name = os.path.basename(image_path) if image_path else "unknown"
+        self.current_image_id = image_id or content_id(image_data)
         
-        # Crear nueva conversación para esta imagen si no existe
-        if self.current_image_name not in self.image_conversations:
-            self.image_conversations[self.current_image_name] = {
-                "messages": [],  # Lista simple de mensajes
-                "image_data": image_data,
-                "image_path": image_path,
-                "cv2_operations": [],  # Registro de operaciones aplicadas
-                "control_states": {},  # Estados de los controles
-                "processed_image": None  # Imagen procesada en base64
-            }
+        conv = self.image_conversations.get(self.current_image_id)
+        if conv is not None:
+            # Mismo contenido con otro nombre: se comparten los bytes y la conversación
+            if self.current_image_name not in conv["aliases"]:
+                conv["aliases"].append(self.current_image_name)
+            conv["image_path"] = image_path
+            self.current_image_data = image_data if image_id else conv["image_data"]
+            return True
+        
+        self.current_image_data = image_data
+        self.image_conversations[self.current_image_id] = {
+            "aliases": [self.current_image_name],  # Nombres de archivo con este contenido
+            "messages": [],  # Lista simple de mensajes
+            "image_data": image_data,
+            "image_path": image_path,
+            "cv2_operations": [],  # Registro de operaciones aplicadas
+            "control_states": {},  # Estados de los controles
+            "processed_image": None,  # Imagen procesada en base64
+            "image_attach_state": None,  # Controles y turnos desde el último envío de imágenes
+            "usage": []  # Tokens y latencia de cada llamada al modelo
+        }
+        return False
+    
+    def get_display_name(self, image_id):
+        """Nombre para mostrar; si otro contenido usa el mismo nombre se añade el inicio del hash"""
+        conv = self.image_conversations.get(image_id)
+        if conv is None:
+            return image_id
+        name = conv["aliases"][0]
+        if any(other_id != image_id and other["aliases"][0] == name
+               for other_id, other in self.image_conversations.items()):
+            stem, ext = os.path.splitext(name)
+            return f"{stem}~{image_id[:6]}{ext}"
+        return name
+    
+    def find_image(self, name_or_id):
+        """Clave de la conversación a partir de su hash o de cualquiera de sus nombres"""
+        if name_or_id in self.image_conversations:
+            return name_or_id
+        for image_id, conv in self.image_conversations.items():
+            if name_or_id in conv["aliases"]:
+                return image_id
+        return None
     
     def get_current_messages(self):
         """Obtiene la lista de mensajes de la imagen actual"""
-        if self.current_image_name in self.image_conversations:
-            return self.image_conversations[self.current_image_name]["messages"]
+        if self.current_image_id in self.image_conversations:
+            return self.image_conversations[self.current_image_id]["messages"]
         return []
     
-    def add_to_history(self, is_ai, entry):
-        """Añade mensaje al historial de la imagen actual"""
-        messages = self.get_current_messages()
+    def add_to_history(self, is_ai, entry, image_id=None):
+        """Añade mensaje al historial de la imagen indicada (por defecto, la actual)"""
+        from langchain_core.messages import HumanMessage, AIMessage
+        conv = self.image_conversations.get(image_id or self.current_image_id)
+        messages = conv["messages"] if conv is not None else None
         if messages is not None:
             if is_ai:
                 messages.append(AIMessage(content=entry))
@@ -170,32 +805,100 @@ class DialogContext:
     
     def add_cv2_operation(self, operation_data):
         """Registra una operación CV2 aplicada"""
-        if self.current_image_name in self.image_conversations:
-            self.image_conversations[self.current_image_name]["cv2_operations"].append({
+        if self.current_image_id in self.image_conversations:
+            self.image_conversations[self.current_image_id]["cv2_operations"].append({
                 "timestamp": datetime.now().isoformat(),
                 "operation": operation_data
             })
     
     def get_cv2_operations(self):
         """Obtiene operaciones CV2 de la imagen actual"""
-        if self.current_image_name in self.image_conversations:
-            return self.image_conversations[self.current_image_name]["cv2_operations"]
+        if self.current_image_id in self.image_conversations:
+            return self.image_conversations[self.current_image_id]["cv2_operations"]
         return []
     
-    def get_context_string(self):
-        """Obtiene el contexto de la imagen actual como string"""
-        messages = self.get_current_messages()
+    def should_attach_images(self, control_states, user_message, image_id=None):
+        """Decide si el turno necesita adjuntar imágenes o basta con el resumen estadístico"""
+        conv = self.image_conversations.get(image_id or self.current_image_id)
+        if conv is None or conv.get("image_attach_state") is None:
+            return True
+        
+        attach_state = conv["image_attach_state"]
+        if attach_state["turns"] >= IMAGE_REATTACH_TURNS:
+            return True
+        
+        last_states = attach_state["control_states"]
+        if any(last_states.get(key) != control_states.get(key) for key in STRUCTURAL_CONTROLS):
+            return True
+        
+        text = user_message.lower()
+        return any(keyword in text for keyword in VISUAL_KEYWORDS)
+    
+    def record_image_turn(self, control_states, attached, image_id=None):
+        """Registra si el último turno adjuntó imágenes"""
+        conv = self.image_conversations.get(image_id or self.current_image_id)
+        if conv is None:
+            return
+        if attached or conv.get("image_attach_state") is None:
+            conv["image_attach_state"] = {"control_states": dict(control_states), "turns": 0}
+        else:
+            conv["image_attach_state"]["turns"] += 1
+    
+    def record_usage(self, image_id, usage):
+        """Atribuye una llamada al modelo a la conversación de la imagen"""
+        conv = self.image_conversations.get(image_id)
+        if conv is not None:
+            conv.setdefault("usage", []).append(usage)
+    
+    def get_usage_summary(self):
+        """Totales de tokens, bytes de imagen y latencia por imagen y para toda la sesión"""
+        def summarize(records):
+            latencies = sorted(r["latency_ms"] for r in records)
+            return {
+                "calls": len(records),
+                "prompt_tokens": sum(r["prompt_tokens"] or 0 for r in records),
+                "response_tokens": sum(r["response_tokens"] or 0 for r in records),
+                "image_bytes": sum(r["image_bytes"] for r in records),
+                "latency_ms": round(sum(latencies), 1),
+                "latency_p50_ms": latencies[len(latencies) // 2] if latencies else 0.0,
+                "latency_max_ms": latencies[-1] if latencies else 0.0
+            }
+        
+        per_image = {self.get_display_name(image_id): summarize(conv.get("usage", []))
+                     for image_id, conv in self.image_conversations.items()}
+        all_records = [r for conv in self.image_conversations.values() for r in conv.get("usage", [])]
+        return {"images": per_image, "session": summarize(all_records)}
+    
+    def export_usage_csv(self, filename):
+        """Exporta cada llamada al modelo (una fila por llamada) en CSV"""
+        fields = ["image", "image_id", "timestamp", "kind", "prompt_tokens", "response_tokens", "prompt_chars", "image_bytes", "latency_ms"]
+        try:
+            with open(filename, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+                writer.writeheader()
+                for image_id, conv_data in self.image_conversations.items():
+                    image_name = self.get_display_name(image_id)
+                    for record in conv_data.get("usage", []):
+                        writer.writerow(dict(record, image=image_name, image_id=image_id))
+            return True, f"Consumo exportado en {filename}"
+        except Exception as e:
+            return False, f"Error al exportar el consumo: {str(e)}"
+    
+    def get_context_string(self, image_id=None):
+        """Obtiene el contexto de la imagen (por defecto, la actual) como string"""
+        conv = self.image_conversations.get(image_id or self.current_image_id)
+        messages = conv["messages"] if conv is not None else []
         if not messages:
             return ""
         
         formatted_messages = []
         
         for message in messages:
-            prefix = "Asistente: " if isinstance(message, AIMessage) else "Usuario: "
+            prefix = "Asistente: " if message.type == "ai" else "Usuario: "
             formatted_messages.append(f"{prefix}{message.content}")
         
         # Agregar información de operaciones CV2 aplicadas
-        ops = self.get_cv2_operations()
+        ops = conv["cv2_operations"]
         if ops:
             formatted_messages.append("\n[Operaciones CV2 aplicadas a esta imagen:]")
             for op in ops:
@@ -204,14 +907,15 @@ class DialogContext:
         return "\n".join(formatted_messages)
     
     def get_all_images(self):
-        """Obtiene lista de todas las imágenes en memoria"""
+        """Obtiene lista de todas las imágenes en memoria (sus claves de contenido)"""
         return list(self.image_conversations.keys())
     
-    def switch_to_image(self, image_name):
+    def switch_to_image(self, image_id):
         """Cambia el contexto a otra imagen en memoria"""
-        if image_name in self.image_conversations:
-            self.current_image_name = image_name
-            conv = self.image_conversations[image_name]
+        if image_id in self.image_conversations:
+            self.current_image_id = image_id
+            self.current_image_name = self.get_display_name(image_id)
+            conv = self.image_conversations[image_id]
             self.current_image_data = conv["image_data"]
             self.current_image_path = conv["image_path"]
             return True
@@ -222,26 +926,28 @@ class DialogContext:
         try:
             all_conversations = {}
             
-            for img_name, conv_data in self.image_conversations.items():
+            for image_id, conv_data in self.image_conversations.items():
                 messages = []
                 for message in conv_data["messages"]:
                     messages.append({
-                        "type": "ai" if isinstance(message, AIMessage) else "human",
+                        "type": "ai" if message.type == "ai" else "human",
                         "content": message.content
                     })
                 
-                all_conversations[img_name] = {
+                all_conversations[image_id] = {
+                    "aliases": conv_data["aliases"],
                     "messages": messages,
                     "image_data": base64.b64encode(conv_data["image_data"]).decode('utf-8') if conv_data["image_data"] else None,
                     "image_path": conv_data["image_path"],
                     "cv2_operations": conv_data["cv2_operations"],
                     "control_states": conv_data.get("control_states", {}),
-                    "processed_image": conv_data.get("processed_image")
+                    "processed_image": conv_data.get("processed_image"),
+                    "usage": conv_data.get("usage", [])
                 }
             
             conversation_data = {
                 "timestamp": datetime.now().isoformat(),
-                "current_image": self.current_image_name,
+                "current_image": self.current_image_id,
                 "conversations": all_conversations
             }
             
@@ -255,6 +961,7 @@ class DialogContext:
     
     def load_conversation_from_json(self, filename):
         """Carga conversaciones desde un archivo JSON"""
+        from langchain_core.messages import HumanMessage, AIMessage
         try:
             with open(filename, 'r', encoding='utf-8') as f:
                 conversation_data = json.load(f)
@@ -276,18 +983,41 @@ class DialogContext:
                 if conv_data.get("image_data"):
                     image_data = base64.b64decode(conv_data["image_data"])
                 
-                self.image_conversations[img_name] = {
+                # Las sesiones antiguas se indexaban por nombre de archivo: se vuelven a indexar por contenido
+                aliases = conv_data.get("aliases")
+                if aliases:
+                    image_id = img_name
+                else:
+                    aliases = [img_name]
+                    image_id = content_id(image_data) if image_data else img_name
+                
+                existing = self.image_conversations.get(image_id)
+                if existing is not None:
+                    # Copias del mismo contenido: se conserva la conversación más larga
+                    existing["aliases"].extend(alias for alias in aliases if alias not in existing["aliases"])
+                    existing["usage"].extend(conv_data.get("usage", []))
+                    if len(messages) > len(existing["messages"]):
+                        existing["messages"] = messages
+                        existing["cv2_operations"] = conv_data.get("cv2_operations", [])
+                        existing["control_states"] = conv_data.get("control_states", {})
+                        existing["processed_image"] = conv_data.get("processed_image")
+                    continue
+                
+                self.image_conversations[image_id] = {
+                    "aliases": list(aliases),
                     "messages": messages,
                     "image_data": image_data,
                     "image_path": conv_data.get("image_path"),
                     "cv2_operations": conv_data.get("cv2_operations", []),
                     "control_states": conv_data.get("control_states", {}),
-                    "processed_image": conv_data.get("processed_image")
+                    "processed_image": conv_data.get("processed_image"),
+                    "image_attach_state": None,
+                    "usage": conv_data.get("usage", [])
                 }
             
             # Restaurar imagen actual
-            current_img = conversation_data.get("current_image")
-            if current_img and current_img in self.image_conversations:
+            current_img = self.find_image(conversation_data.get("current_image"))
+            if current_img is not None:
                 self.switch_to_image(current_img)
             
             return True, f"Conversaciones cargadas exitosamente desde {filename}"
@@ -299,49 +1029,1770 @@ class DialogContext:
         except Exception as e:
             return False, f"Error al cargar la conversación: {str(e)}"
 
-# Clase principal de la aplicación GUI
-class ImageAnalyzerGUI:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Analizador de Imágenes con Gemini - Con Procesamiento CV2 Inteligente")
+# Estado por defecto de los controles de edición
+DEFAULT_CONTROL_STATES = {
+    "brightness": 0,
+    "contrast": 1.0,
+    "blur": 0,
+    "sharpen": 0.0,
+    "rotation": 0,
+    "grayscale": False,
+    "flip_h": False,
+    "flip_v": False
+}
+
+# Rangos válidos de los controles numéricos (mismos que los sliders)
+CONTROL_RANGES = {
+    "brightness": (-100, 100),
+    "contrast": (0.5, 3.0),
+    "blur": (0, 25),
+    "sharpen": (0.0, 3.0),
+    "rotation": (0, 360)
+}
+
+def normalize_control_states(control_states):
+    """Completa con valores por defecto, convierte tipos y limita a los rangos de los sliders"""
+    states = dict(DEFAULT_CONTROL_STATES)
+    for key, value in (control_states or {}).items():
+        if key not in DEFAULT_CONTROL_STATES:
+            raise ValueError(f"Control desconocido: {key}")
+        default = DEFAULT_CONTROL_STATES[key]
+        if isinstance(default, bool):
+            states[key] = bool(value)
+            continue
+        numeric = float(value)
+        low, high = CONTROL_RANGES[key]
+        numeric = min(max(numeric, low), high)
+        states[key] = int(round(numeric)) if isinstance(default, int) else numeric
+    return states
+
+# ===== REGISTRO DE OPERADORES Y AUTOAJUSTE =====
+# Implementaciones con resultado idéntico píxel a píxel; la más rápida se elige por máquina y tamaño
+
+def _scale_abs_convert(img, alpha, beta):
+    return cv2.convertScaleAbs(img, alpha=alpha, beta=beta)
+
+def _scale_abs_lut(img, alpha, beta):
+    # Misma aritmética que convertScaleAbs (float32, valor absoluto, redondeo y saturación)
+    values = np.abs(np.arange(256, dtype=np.float32) * np.float32(alpha) + np.float32(beta))
+    lut = np.clip(np.rint(values), 0, 255).astype(np.uint8)
+    return cv2.LUT(img, lut)
+
+def _rotation_warp(img, states):
+    h, w = img.shape[:2]
+    center = (w // 2, h // 2)
+    matrix = cv2.getRotationMatrix2D(center, states["rotation"], 1.0)
+    return cv2.warpAffine(img, matrix, (w, h))
+
+def _rotation_transpose(img, states):
+    """Ángulos rectos con cv2.rotate, recolocado en el mismo lienzo que warpAffine"""
+    angle = states["rotation"] % 360
+    if angle not in (90, 180, 270):
+        return _rotation_warp(img, states)
+    h, w = img.shape[:2]
+    cx, cy = w // 2, h // 2
+    if angle == 90:
+        rotated, oy, ox = cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE), cx + cy - w + 1, cx - cy
+    elif angle == 180:
+        rotated, oy, ox = cv2.rotate(img, cv2.ROTATE_180), 2 * cy - h + 1, 2 * cx - w + 1
+    else:
+        rotated, oy, ox = cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE), cy - cx, cx + cy - h + 1
+    out = np.zeros_like(img)
+    rh, rw = rotated.shape[:2]
+    y0, y1 = max(0, oy), min(h, oy + rh)
+    x0, x1 = max(0, ox), min(w, ox + rw)
+    if y0 < y1 and x0 < x1:
+        out[y0:y1, x0:x1] = rotated[y0 - oy:y1 - oy, x0 - ox:x1 - ox]
+    return out
+
+# etapa: {variante: función}; la primera variante es la de referencia y la usada por defecto
+OPERATOR_VARIANTS = {
+    "brightness": {
+        "convert_scale": lambda img, states: _scale_abs_convert(img, 1, states["brightness"]),
+        "lut": lambda img, states: _scale_abs_lut(img, 1, states["brightness"]),
+    },
+    "contrast": {
+        "convert_scale": lambda img, states: _scale_abs_convert(img, states["contrast"], 0),
+        "lut": lambda img, states: _scale_abs_lut(img, states["contrast"], 0),
+    },
+    "rotation": {"warp": _rotation_warp, "transpose": _rotation_transpose},
+}
+
+# Valores de control con los que se mide cada etapa
+AUTOTUNE_SAMPLE_STATES = {"brightness": 40, "contrast": 1.4, "rotation": 90}
+# Valores con los que se comprueba que cada variante da exactamente el mismo resultado que la de referencia
+AUTOTUNE_CHECK_STATES = {
+    "brightness": (-100, -37, -1, 1, 40, 100),
+    "contrast": (0.5, 0.77, 1.37, 2.0, 3.0),
+    "rotation": (90, 180, 270),
+}
+# Tamaños por número de píxeles: (límite superior, nombre, alto y ancho de la imagen de prueba).
+# La prueba del tamaño grande se limita a ~6 MP para no cargar el primer arranque.
+AUTOTUNE_SIZE_BUCKETS = (
+    (1_000_000, "small", (600, 800)),
+    (6_000_000, "medium", (1500, 2000)),
+    (float("inf"), "large", (2000, 3200)),
+)
+AUTOTUNE_REPEATS = 3
+AUTOTUNE_ENABLED = os.getenv('AUTOTUNE', '1') != '0'
+
+def user_config_dir(app_name="image_analyzer"):
+    """Directorio de configuración del usuario según la plataforma"""
+    if os.name == "nt":
+        base = os.getenv("APPDATA") or os.path.expanduser("~")
+    else:
+        base = os.getenv("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    return os.path.join(base, app_name)
+
+def user_cache_dir(app_name="image_analyzer"):
+    """Directorio de caché del usuario según la plataforma"""
+    if os.name == "nt":
+        base = os.getenv("LOCALAPPDATA") or os.getenv("APPDATA") or os.path.expanduser("~")
+    else:
+        base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, app_name)
+
+def size_bucket(img):
+    pixels = img.shape[0] * img.shape[1]
+    for limit, name, _ in AUTOTUNE_SIZE_BUCKETS:
+        if pixels <= limit:
+            return name
+    return AUTOTUNE_SIZE_BUCKETS[-1][1]
+
+def _autotune_sample_image(h, w):
+    """Imagen sintética con degradados, bordes y ruido (parecida a una foto)"""
+    y, x = np.mgrid[0:h, 0:w].astype(np.float32)
+    img = np.stack([x / w * 255, y / h * 255, (np.sin(x / 37) + np.cos(y / 23)) * 60 + 128], axis=2)
+    cv2.circle(img, (w // 3, h // 2), min(h, w) // 5, (30, 200, 90), -1)
+    cv2.rectangle(img, (w // 2, h // 5), (w * 4 // 5, h * 3 // 5), (220, 40, 160), -1)
+    img += np.random.default_rng(0).normal(0, 8, img.shape).astype(np.float32)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+class OperatorRegistry:
+    """Elige la implementación de cada etapa por tamaño de imagen a partir de un microbenchmark cacheado"""
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.choices = None  # {bucket: {etapa: variante}}; None = aún sin leer la caché
+        self.timings = {}
+        self.rejected = {}
+        self.tuned_at = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint():
+        """Lo que invalida la elección: librerías, CPU y variantes disponibles"""
+        return {
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "variants": {stage: list(variants) for stage, variants in OPERATOR_VARIANTS.items()}
+        }
+
+    def _load(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get("fingerprint") != self.fingerprint():
+            return False
+        self.timings = data.get("timings_ms", {})
+        self.rejected = data.get("rejected", {})
+        self.tuned_at = data.get("tuned_at")
+        self.choices = data.get("choices", {})
+        return True
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        data = {
+            "fingerprint": self.fingerprint(),
+            "tuned_at": self.tuned_at,
+            "choices": self.choices,
+            "timings_ms": self.timings,
+            "rejected": self.rejected
+        }
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.cache_path)
+
+    def is_tuned(self):
+        with self._lock:
+            if self.choices is None:
+                self._load()
+            return bool(self.choices)
+
+    def current_choices(self):
+        """Variantes elegidas por tamaño ({} si no hay ajuste)"""
+        with self._lock:
+            if self.choices is None and not self._load():
+                self.choices = {}
+            return self.choices
+
+    def resolve(self, stage, img):
+        """Función a usar para la etapa con esta imagen (la de referencia si no hay elección)"""
+        variants = OPERATOR_VARIANTS[stage]
+        choices = self.choices
+        if choices is None:
+            choices = self.current_choices()
+        name = choices.get(size_bucket(img), {}).get(stage)
+        return variants.get(name) or next(iter(variants.values()))
+
+    def tune(self, force=False):
+        """Mide cada variante en cada tamaño y guarda la elección; devuelve False si ya había una válida"""
+        if not force and self.is_tuned():
+            return False
         
-        # Iniciar en pantalla completa
-        self.root.state('zoomed')  # Windows: maximizar ventana
+        rejected = self._check_equivalence()
+        choices, timings = {}, {}
+        for _, bucket, (h, w) in AUTOTUNE_SIZE_BUCKETS:
+            img = _autotune_sample_image(h, w)
+            states = dict(DEFAULT_CONTROL_STATES)
+            states.update(AUTOTUNE_SAMPLE_STATES)
+            choices[bucket], timings[bucket] = {}, {}
+            for stage, variants in OPERATOR_VARIANTS.items():
+                best_name, best_ms = None, None
+                timings[bucket][stage] = {}
+                for name, fn in variants.items():
+                    if name in rejected.get(stage, ()):
+                        continue
+                    fn(img, states)  # Calentamiento
+                    samples = []
+                    for _ in range(AUTOTUNE_REPEATS):
+                        start = time.perf_counter()
+                        fn(img, states)
+                        samples.append((time.perf_counter() - start) * 1000.0)
+                    elapsed_ms = min(samples)
+                    timings[bucket][stage][name] = round(elapsed_ms, 3)
+                    if best_ms is None or elapsed_ms < best_ms:
+                        best_name, best_ms = name, elapsed_ms
+                choices[bucket][stage] = best_name
         
-        # Contexto del diálogo con memoria por imagen
-        self.dialog_context = DialogContext()
+        with self._lock:
+            self.choices, self.timings, self.rejected = choices, timings, rejected
+            self.tuned_at = datetime.now().isoformat()
+        self._save()
+        return True
+
+    @staticmethod
+    def _check_equivalence():
+        """Variantes que no reproducen exactamente la de referencia en todos los valores de prueba"""
+        img = _autotune_sample_image(*AUTOTUNE_SIZE_BUCKETS[0][2])
+        rejected = {}
+        for stage, variants in OPERATOR_VARIANTS.items():
+            reference_fn = next(iter(variants.values()))
+            for value in AUTOTUNE_CHECK_STATES[stage]:
+                states = dict(DEFAULT_CONTROL_STATES, **{stage: value})
+                reference = reference_fn(img, states)
+                for name, fn in list(variants.items())[1:]:
+                    if name not in rejected.get(stage, ()) and not np.array_equal(fn(img, states), reference):
+                        rejected.setdefault(stage, []).append(name)
+        return rejected
+
+    def describe(self):
+        """Elecciones actuales con sus tiempos, para mostrar al usuario"""
+        if not self.is_tuned():
+            return "Operadores: sin ajustar (se usan las implementaciones de referencia)"
+        lines = [f"Operadores ajustados el {self.tuned_at} ({self.cache_path})"]
+        for _, bucket, (h, w) in AUTOTUNE_SIZE_BUCKETS:
+            parts = []
+            for stage, name in self.choices.get(bucket, {}).items():
+                options = self.timings.get(bucket, {}).get(stage, {})
+                detail = " / ".join(f"{variant} {ms:.1f}" for variant, ms in options.items())
+                parts.append(f"{stage}={name} ({detail} ms)")
+            lines.append(f"  {bucket} ({w}x{h}): " + ", ".join(parts))
+        for stage, names in self.rejected.items():
+            lines.append(f"  descartadas en {stage} (resultado distinto): {', '.join(names)}")
+        return "\n".join(lines)
+
+operator_registry = OperatorRegistry(
+    os.getenv('OPERATOR_TUNING_FILE') or os.path.join(user_config_dir(), "operator_tuning.json")
+)
+
+def start_operator_autotune(force=False):
+    """Ajusta los operadores en segundo plano si no hay una elección válida para esta máquina"""
+    def tune():
+        try:
+            with perf_stats.stage("startup.autotune"):
+                operator_registry.tune(force=force)
+        except Exception as e:
+            print(f"No se pudo ajustar los operadores: {e}")
+    thread = threading.Thread(target=tune, name="operator-autotune", daemon=True)
+    thread.start()
+    return thread
+
+def _edit_brightness(img, states):
+    return operator_registry.resolve("brightness", img)(img, states)
+
+def _edit_contrast(img, states):
+    return operator_registry.resolve("contrast", img)(img, states)
+
+def _edit_blur(img, states):
+    ksize = states["blur"] * 2 + 1  # Debe ser impar
+    return cv2.GaussianBlur(img, (ksize, ksize), 0)
+
+def _edit_sharpen(img, states):
+    # Crear versión desenfocada
+    gaussian = cv2.GaussianBlur(img, (0, 0), 3)
+    # Mezclar original con desenfocada para aumentar nitidez
+    # amount controla la intensidad (valores típicos: 0.5 a 2.0)
+    sharpen_amount = states["sharpen"]
+    return cv2.addWeighted(img, 1.0 + sharpen_amount * 0.5, gaussian, -sharpen_amount * 0.5, 0)
+
+def _edit_grayscale(img, states):
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)  # Convertir de vuelta a 3 canales
+
+def _edit_rotation(img, states):
+    return operator_registry.resolve("rotation", img)(img, states)
+
+def _edit_flip(img, states):
+    if states["flip_h"]:
+        img = cv2.flip(img, 1)
+    if states["flip_v"]:
+        img = cv2.flip(img, 0)
+    return img
+
+# Cadena de ediciones en orden: (nombre, controles que usa, condición de activación, función)
+EDIT_STAGES = (
+    ("brightness", ("brightness",), lambda s: s["brightness"] != 0, _edit_brightness),
+    ("contrast", ("contrast",), lambda s: s["contrast"] != 1.0, _edit_contrast),
+    ("blur", ("blur",), lambda s: s["blur"] > 0, _edit_blur),
+    ("sharpen", ("sharpen",), lambda s: s["sharpen"] > 0, _edit_sharpen),
+    ("grayscale", ("grayscale",), lambda s: s["grayscale"], _edit_grayscale),
+    ("rotation", ("rotation",), lambda s: s["rotation"] != 0, _edit_rotation),
+    ("flip", ("flip_h", "flip_v"), lambda s: s["flip_h"] or s["flip_v"], _edit_flip),
+)
+
+def run_edit_stages(img, states, start=0, stop=len(EDIT_STAGES)):
+    """Aplica las etapas [start, stop) de la cadena; states debe estar completo"""
+    for name, _, is_active, apply_stage in EDIT_STAGES[start:stop]:
+        if is_active(states):
+            with perf_stats.stage(f"edits.{name}"):
+                img = apply_stage(img, states)
+    return img
+
+def render_edits(image, control_states):
+    """Aplica la cadena de ediciones (brillo → contraste → blur → nitidez → grises → rotación → volteos)"""
+    states = dict(DEFAULT_CONTROL_STATES)
+    states.update(control_states)
+    # Comenzar con la imagen original
+    with perf_stats.stage("edits.copy"):
+        img = image.copy()
+    return run_edit_stages(img, states)
+
+RENDER_CHECKPOINT_MB = int(os.getenv('RENDER_CHECKPOINT_MB', '256'))
+
+class RenderCheckpoints:
+    """Renders intermedios acotados (LRU por bytes) para re-renderizar desde el punto de control más cercano"""
+    # Límites de etapa donde se guarda un punto de control: tras los filtros tonales y al final
+    BOUNDARIES = (5, len(EDIT_STAGES))
+
+    def __init__(self, max_bytes=RENDER_CHECKPOINT_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        # Clave: (límite, valores de los controles de las etapas anteriores al límite). El render final
+        # se indexa por el estado completo, así que volver a un paso ya visitado del historial no re-renderiza.
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._source = None  # Imagen original a la que pertenecen los puntos de control
+
+    @staticmethod
+    def _key(boundary, states):
+        return (boundary,) + tuple(states[key] for stage in EDIT_STAGES[:boundary] for key in stage[1])
+
+    def clear(self):
+        self.entries.clear()
+
+    def current_bytes(self):
+        # Si las etapas finales están inactivas, los dos puntos de control comparten la misma matriz
+        return sum({id(img): img.nbytes for img in self.entries.values()}.values())
+
+    def render(self, image, control_states):
+        """Renderiza reutilizando el punto de control más profundo compatible con el estado"""
+        states = dict(DEFAULT_CONTROL_STATES)
+        states.update(control_states)
+        if image is not self._source:
+            self.clear()
+            self._source = image
         
-        # Variables de estado
-        self.original_image = None
-        self.processed_image = None
-        self.flip_h = False
-        self.flip_v = False
+        start, img = 0, None
+        for boundary in reversed(self.BOUNDARIES):
+            key = self._key(boundary, states)
+            cached = self.entries.get(key)
+            if cached is not None:
+                self.entries.move_to_end(key)
+                start, img = boundary, cached
+                break
         
-        # Configurar la interfaz
-        self.setup_ui()
+        if img is None:
+            self.misses += 1
+            with perf_stats.stage("edits.copy"):
+                img = image.copy()
+        else:
+            self.hits += 1
         
-    def setup_ui(self):
-        # Crear canvas con scrollbars para scroll vertical y horizontal
-        canvas_container = tk.Canvas(self.root, highlightthickness=0)
-        scrollbar_v = ttk.Scrollbar(self.root, orient="vertical", command=canvas_container.yview)
-        scrollbar_h = ttk.Scrollbar(self.root, orient="horizontal", command=canvas_container.xview)
+        for boundary in self.BOUNDARIES:
+            if boundary <= start:
+                continue
+            img = run_edit_stages(img, states, start, boundary)
+            self.entries[self._key(boundary, states)] = img
+            start = boundary
         
-        # Frame principal dentro del canvas
-        main_frame = ttk.Frame(canvas_container, padding="10")
+        # Se conserva siempre el render recién hecho aunque supere el límite
+        while len(self.entries) > 1 and self.current_bytes() > self.max_bytes:
+            oldest_key = next(iter(self.entries))
+            if self.entries[oldest_key] is img:
+                break
+            self.entries.popitem(last=False)
+        return img
+
+class EditTimeline:
+    """Historial deshacer/rehacer guardado como deltas de controles (no copias de la imagen)"""
+    COALESCE_SECONDS = 0.6  # Movimientos seguidos del mismo slider forman un solo paso
+
+    def __init__(self, base_states):
+        self.steps = []  # Cada paso: tupla de (control, valor anterior, valor nuevo)
+        self.position = 0  # Pasos aplicados actualmente
+        self._current = dict(base_states)
+        self._last_push = 0.0
+
+    def __len__(self):
+        return len(self.steps)
+
+    def current_states(self):
+        return dict(self._current)
+
+    def push(self, states):
+        """Registra un nuevo estado; devuelve False si no hay cambios"""
+        delta = tuple((key, self._current.get(key), value) for key, value in states.items()
+                      if self._current.get(key) != value)
+        if not delta:
+            return False
         
-        # Crear ventana en el canvas
-        canvas_window = canvas_container.create_window((0, 0), window=main_frame, anchor="nw")
+        # Un cambio nuevo descarta los pasos rehacibles
+        del self.steps[self.position:]
         
-        # Configurar scrollbars
-        canvas_container.configure(yscrollcommand=scrollbar_v.set, xscrollcommand=scrollbar_h.set)
+        now = time.monotonic()
+        last = self.steps[-1] if self.steps else None
+        if (last is not None and now - self._last_push < self.COALESCE_SECONDS
+                and {key for key, _, _ in last} == {key for key, _, _ in delta}):
+            previous = {key: old for key, old, _ in last}
+            merged = tuple((key, previous[key], new) for key, _, new in delta if previous[key] != new)
+            if merged:
+                self.steps[-1] = merged
+            else:
+                self.steps.pop()
+        else:
+            self.steps.append(delta)
         
-        # Posicionar canvas y scrollbars
-        canvas_container.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        scrollbar_v.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        scrollbar_h.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        self.position = len(self.steps)
+        for key, _, new in delta:
+            self._current[key] = new
+        self._last_push = now
+        return True
+
+    def undo(self):
+        """Retrocede un paso y devuelve el estado resultante (None si no hay pasos)"""
+        if self.position == 0:
+            return None
+        self.position -= 1
+        for key, old, _ in self.steps[self.position]:
+            self._current[key] = old
+        self._last_push = 0.0
+        return self.current_states()
+
+    def redo(self):
+        """Avanza un paso y devuelve el estado resultante (None si no hay pasos)"""
+        if self.position >= len(self.steps):
+            return None
+        for key, _, new in self.steps[self.position]:
+            self._current[key] = new
+        self.position += 1
+        self._last_push = 0.0
+        return self.current_states()
+
+    def jump(self, target):
+        """Va directamente al paso indicado aplicando los deltas intermedios"""
+        target = min(max(int(target), 0), len(self.steps))
+        while self.position > target:
+            self.undo()
+        while self.position < target:
+            self.redo()
+        return self.current_states()
+
+# Resumen estadístico local de la imagen (se envía en lugar de los píxeles cuando basta)
+DIGEST_PROXY_SIZE = 512
+DIGEST_HIST_BINS = 8
+_NOISE_KERNEL = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+
+def make_proxy(image, max_size=DIGEST_PROXY_SIZE):
+    """Reduce la imagen (INTER_AREA) para que su lado mayor no supere max_size"""
+    h, w = image.shape[:2]
+    scale = min(1.0, max_size / max(h, w))
+    if scale >= 1.0:
+        return image
+    return cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+def estimate_noise(gray):
+    """Desviación estándar del ruido por el método de Immerkær"""
+    gh, gw = gray.shape
+    if gh <= 2 or gw <= 2:
+        return 0.0
+    response = cv2.filter2D(gray.astype(np.float32), -1, _NOISE_KERNEL)[1:-1, 1:-1]
+    return float(math.sqrt(math.pi / 2) * np.abs(response).sum() / (6.0 * (gw - 2) * (gh - 2)))
+
+def compute_image_digest(image):
+    """Histogramas, luminancia, recorte, nitidez y ruido calculados sobre un proxy reducido"""
+    h, w = image.shape[:2]
+    proxy = make_proxy(image)
+    gray = cv2.cvtColor(proxy, cv2.COLOR_BGR2GRAY)
+    
+    # Histogramas normalizados por canal
+    histograms = {}
+    for index, channel in enumerate(("b", "g", "r")):
+        hist = cv2.calcHist([proxy], [index], None, [DIGEST_HIST_BINS], [0, 256]).ravel()
+        histograms[channel] = (hist / max(hist.sum(), 1)).round(3).tolist()
+    
+    # Percentiles de luminancia a partir de la distribución acumulada
+    cdf = np.cumsum(np.bincount(gray.ravel(), minlength=256)) / gray.size
+    percentiles = {p: int(np.searchsorted(cdf, p / 100.0)) for p in (1, 5, 50, 95, 99)}
+    
+    # Nitidez (varianza del Laplaciano) y ruido (método de Immerkær)
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    noise = estimate_noise(gray)
+    
+    channel_means = cv2.mean(proxy)[:3]
+    return {
+        "size": [w, h],
+        "histograms": histograms,
+        "channel_means": {"b": round(channel_means[0], 1), "g": round(channel_means[1], 1), "r": round(channel_means[2], 1)},
+        "luminance_mean": round(float(gray.mean()), 1),
+        "luminance_percentiles": percentiles,
+        "clipped_shadows": round(float(cdf[2]), 4),
+        "clipped_highlights": round(float(1.0 - cdf[252]), 4),
+        "sharpness": round(sharpness, 1),
+        "noise_sigma": round(noise, 2)
+    }
+
+def format_image_digest(digest):
+    """Texto compacto del resumen estadístico para el prompt"""
+    p = digest["luminance_percentiles"]
+    means = digest["channel_means"]
+    lines = [
+        f"- Tamaño: {digest['size'][0]}x{digest['size'][1]} px",
+        f"- Luminancia media: {digest['luminance_mean']} (0-255); percentiles p1={p[1]} p5={p[5]} p50={p[50]} p95={p[95]} p99={p[99]}",
+        f"- Media por canal: R={means['r']} G={means['g']} B={means['b']}",
+        f"- Píxeles recortados: sombras {digest['clipped_shadows'] * 100:.2f}%, luces {digest['clipped_highlights'] * 100:.2f}%",
+        f"- Nitidez (varianza del Laplaciano): {digest['sharpness']}",
+        f"- Ruido estimado (sigma): {digest['noise_sigma']}"
+    ]
+    for channel, label in (("r", "R"), ("g", "G"), ("b", "B")):
+        values = " ".join(f"{v:.2f}" for v in digest["histograms"][channel])
+        lines.append(f"- Histograma {label} ({DIGEST_HIST_BINS} tramos): {values}")
+    return "\n".join(lines)
+
+# Ajuste automático local (sin llamada al modelo)
+AUTO_TARGET_LOW = 5      # Valor de destino para el percentil oscuro
+AUTO_TARGET_HIGH = 250   # Valor de destino para el percentil claro
+AUTO_SHARPNESS_TARGET = 150.0  # Varianza del Laplaciano considerada nítida en el proxy
+AUTO_MAX_TILT = 15.0     # Inclinación máxima (grados) que se intenta enderezar
+
+def _estimate_tilt(gray):
+    """Inclinación dominante (grados, convención de cv2) a partir de segmentos casi horizontales/verticales"""
+    edges = cv2.Canny(gray, 50, 150)
+    min_length = max(20, min(gray.shape[:2]) // 8)
+    lines = cv2.HoughLinesP(edges, 1, np.pi / 180, threshold=60, minLineLength=min_length, maxLineGap=5)
+    if lines is None:
+        return 0.0, 0
+    
+    segments = lines.reshape(-1, 4).astype(np.float64)
+    dx = segments[:, 2] - segments[:, 0]
+    dy = segments[:, 3] - segments[:, 1]
+    angles = np.degrees(np.arctan2(dy, dx))
+    angles = (angles + 90.0) % 180.0 - 90.0  # Rango [-90, 90)
+    lengths = np.hypot(dx, dy)
+    
+    # Desviación respecto a la horizontal o a la vertical más cercana
+    deviation = np.where(np.abs(angles) <= 45.0, angles, angles - np.sign(angles) * 90.0)
+    mask = np.abs(deviation) <= AUTO_MAX_TILT
+    if not mask.any():
+        return 0.0, 0
+    
+    # Mediana ponderada por longitud
+    deviation, lengths = deviation[mask], lengths[mask]
+    order = np.argsort(deviation)
+    cumulative = np.cumsum(lengths[order])
+    median = deviation[order][np.searchsorted(cumulative, cumulative[-1] / 2.0)]
+    return float(median), int(mask.sum())
+
+def estimate_auto_adjustments(image):
+    """Estima brillo, contraste, nitidez y enderezado dentro de los rangos de los sliders"""
+    gray = cv2.cvtColor(make_proxy(image), cv2.COLOR_BGR2GRAY)
+    
+    # Estiramiento de histograma: (p + brillo) × contraste lleva p1→AUTO_TARGET_LOW y p99→AUTO_TARGET_HIGH
+    cdf = np.cumsum(np.bincount(gray.ravel(), minlength=256)) / gray.size
+    p_low = int(np.searchsorted(cdf, 0.01))
+    p_high = int(np.searchsorted(cdf, 0.99))
+    contrast_low, contrast_high = CONTROL_RANGES["contrast"]
+    contrast = (AUTO_TARGET_HIGH - AUTO_TARGET_LOW) / max(p_high - p_low, 1)
+    contrast = min(max(contrast, contrast_low), contrast_high)
+    brightness = AUTO_TARGET_LOW / contrast - p_low
+    brightness_low, brightness_high = CONTROL_RANGES["brightness"]
+    brightness = min(max(brightness, brightness_low), brightness_high)
+    
+    # Exposición resultante: si la media queda muy oscura o clara, corregir solo con brillo
+    mean = float(gray.mean())
+    expected_mean = (mean + brightness) * contrast
+    if expected_mean < 90 or expected_mean > 170:
+        brightness = min(max(128.0 / contrast - mean, brightness_low), brightness_high)
+    
+    # Cambios mínimos no compensan: se dejan en su valor neutro
+    if abs(contrast - 1.0) < 0.05:
+        contrast = 1.0
+    if abs(brightness) < 3:
+        brightness = 0
+    
+    # Nitidez según la varianza del Laplaciano, atenuada si hay ruido
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    noise = estimate_noise(gray)
+    sharpen = 0.0
+    if sharpness < AUTO_SHARPNESS_TARGET:
+        sharpen = (AUTO_SHARPNESS_TARGET - sharpness) / AUTO_SHARPNESS_TARGET * 2.0
+        if noise > 8.0:
+            sharpen *= 0.5
+    sharpen = round(min(max(sharpen, 0.0), CONTROL_RANGES["sharpen"][1]), 1)
+    
+    # Enderezado por análisis de bordes (el slider solo admite grados enteros de 0 a 360)
+    tilt, line_count = _estimate_tilt(gray)
+    rotation = int(round(tilt)) % 360 if line_count >= 3 and abs(tilt) >= 0.5 else 0
+    
+    return {
+        "brightness": int(round(brightness)),
+        "contrast": round(contrast, 2),
+        "sharpen": sharpen,
+        "rotation": rotation,
+        "metrics": {
+            "p1": p_low,
+            "p99": p_high,
+            "luminance_mean": round(mean, 1),
+            "sharpness": round(sharpness, 1),
+            "noise_sigma": round(noise, 2),
+            "tilt": round(tilt, 2),
+            "lines": line_count
+        }
+    }
+
+def format_auto_adjustments(adjustments):
+    """Descripción de los valores automáticos y sus métricas"""
+    m = adjustments["metrics"]
+    rotation = adjustments["rotation"]
+    rotation_text = f"{rotation}°" if rotation <= 180 else f"{rotation}° ({rotation - 360}°)"
+    return (
+        f"Brillo {adjustments['brightness']:+d}, contraste {adjustments['contrast']:.2f}, "
+        f"nitidez {adjustments['sharpen']:.1f}, rotación {rotation_text}\n"
+        f"Métricas: p1={m['p1']}, p99={m['p99']}, luminancia media={m['luminance_mean']}, "
+        f"nitidez={m['sharpness']}, ruido={m['noise_sigma']}, inclinación={m['tilt']}° ({m['lines']} líneas)"
+    )
+
+# Sugerencias del asistente: valores concretos que se pre-renderizan como chips
+SUGGESTION_MAX_CHIPS = 4
+SUGGESTION_PROXY_SIZE = 1024
+SUGGESTION_CHIP_SIZE = 56
+SUGGESTION_FULL_RENDERS = 2  # Chips que se pre-renderizan a resolución completa (acota la memoria retenida)
+SUGGESTION_KEYWORDS = (
+    ("brightness", r"brillo"),
+    ("contrast", r"contraste"),
+    ("blur", r"desenfoque|difuminado"),
+    ("sharpen", r"nitidez"),
+    ("rotation", r"rot(?:a|ar|ación|acion|ándola|andola)"),
+)
+_SUGGESTION_KEYWORD_PATTERNS = tuple((key, re.compile(rf"\b(?:{keywords})\b")) for key, keywords in SUGGESTION_KEYWORDS)
+_SUGGESTION_ANY_KEYWORD = re.compile("|".join(rf"\b(?:{keywords})\b" for _, keywords in SUGGESTION_KEYWORDS))
+_SUGGESTION_NUMBER = re.compile(r"(?<![\w.,+\-−])[+\-−]?\s?\d+(?:[.,]\d+)?(?![\w])")
+_SUGGESTION_SCOPE_CHARS = 80
+# Cómo se introduce el número: objetivo ("a 60", "hasta 1.3", "+40"), relativo ("en 20") o valor actual ("está en 100")
+_SUGGESTION_CURRENT_INTRO = re.compile(r"(?:\b(?:está|esta|es|son|tiene|tienes)\s+(?:en\s+|de\s+)?|\bactual(?:mente)?\s*(?:es\s+|en\s+|de\s+)?[:=]?\s*)$")
+_SUGGESTION_TARGET_INTRO = re.compile(r"\b(?:a|hasta|alrededor\s+de|en\s+torno\s+a)\s*$")
+_SUGGESTION_RELATIVE_INTRO = re.compile(r"\ben\s*$")
+_SUGGESTION_WEAK_INTRO = re.compile(r"^[\s:*=()\"'«»]*(?:de\s*)?$")
+_SUGGESTION_UNIT = re.compile(r"\s*(?:°|º|grados?\b)")
+_SUGGESTION_DECREASE = re.compile(r"\b(?:baja|bájal[oa]|bajar|reduce|redúcel[oa]|reducir|disminuye|disminuir|oscurece|quita|quitar|resta)\b")
+_SUGGESTION_SENTENCES = re.compile(r"(?<=[.!?])\s+|\n+")
+_SUGGESTION_GRAYSCALE_ON = re.compile(r"\b(?:activa|activar|aplica|aplicar|convierte|convertir|usa|usar)\b[^.!?;\n]{0,30}escala de grises")
+_SUGGESTION_GRAYSCALE_OFF = re.compile(r"\bdesactiva\w*[^.!?;\n]{0,30}escala de grises")
+_SUGGESTION_FLIP_H = re.compile(r"\bvolte(?:a|ar|o)\w*[^.!?;\n]{0,20}horizontal")
+_SUGGESTION_FLIP_V = re.compile(r"\bvolte(?:a|ar|o)\w*[^.!?;\n]{0,20}vertical")
+
+def _suggested_value(text, key, pattern, base_states):
+    """Valor sugerido para un control: prioriza objetivos, luego cambios relativos y por último números sueltos"""
+    match = pattern.search(text)
+    if match is None:
+        return None
+    # El alcance termina en la siguiente palabra clave de otro control ("brillo a 40 y el contraste a 1.3")
+    end = min(len(text), match.end() + _SUGGESTION_SCOPE_CHARS)
+    following = _SUGGESTION_ANY_KEYWORD.search(text, match.end(), end)
+    if following is not None:
+        end = following.start()
+    
+    best = None  # (prioridad, valor)
+    for number in _SUGGESTION_NUMBER.finditer(text, match.end(), end):
+        raw = number.group().replace("−", "-").replace(" ", "").replace(",", ".")
+        prefix = text[match.end():number.start()]
+        value = float(raw)
+        if _SUGGESTION_CURRENT_INTRO.search(prefix):
+            continue  # Repite el valor actual
+        if raw[0] in "+-" or _SUGGESTION_TARGET_INTRO.search(prefix):
+            priority = 0
+        elif _SUGGESTION_RELATIVE_INTRO.search(prefix):
+            # "sube el brillo en 20" es relativo al valor actual
+            sign = -1 if _SUGGESTION_DECREASE.search(text[max(0, match.start() - 30):number.start()]) else 1
+            value, priority = base_states[key] + sign * value, 1
+        elif _SUGGESTION_WEAK_INTRO.search(prefix) or _SUGGESTION_UNIT.match(text, number.end()):
+            priority = 2
+        else:
+            continue  # Número sin relación con el control ("buen brillo y 3 personas")
+        if key == "rotation":
+            value %= 360  # "rota -5 grados" equivale a 355°
+        if value == base_states[key]:
+            continue
+        if best is None or priority < best[0]:
+            best = (priority, value)
+    return best[1] if best else None
+
+def _sentence_adjustments(sentence, base_states):
+    """Cambios de controles sugeridos en una frase ("sube el brillo a +40 y el contraste a 1.3")"""
+    text = sentence.lower()
+    changes = {}
+    for key, pattern in _SUGGESTION_KEYWORD_PATTERNS:
+        value = _suggested_value(text, key, pattern, base_states)
+        if value is not None:
+            changes[key] = value
+    if _SUGGESTION_GRAYSCALE_OFF.search(text):
+        changes["grayscale"] = False
+    elif _SUGGESTION_GRAYSCALE_ON.search(text):
+        changes["grayscale"] = True
+    # Objetivo absoluto: si el volteo ya está aplicado la variante coincide con la actual y no genera chip
+    if _SUGGESTION_FLIP_H.search(text):
+        changes["flip_h"] = True
+    if _SUGGESTION_FLIP_V.search(text):
+        changes["flip_v"] = True
+    return changes
+
+def extract_suggested_adjustments(response_text, base_states):
+    """Variantes de controles sugeridas en la respuesta: una por frase y, si hay varias, la combinación"""
+    base = normalize_control_states(base_states)
+    groups = [changes for changes in (_sentence_adjustments(sentence, base)
+                                      for sentence in _SUGGESTION_SENTENCES.split(response_text)) if changes]
+    if len(groups) > 1:
+        combined = {}
+        for changes in groups:
+            combined.update(changes)
+        groups.append(combined)
+    
+    suggestions = []
+    seen = {tuple(sorted(base.items()))}
+    for changes in groups:
+        states = normalize_control_states(dict(base, **changes))
+        key = tuple(sorted(states.items()))
+        if key in seen:
+            continue
+        seen.add(key)
+        suggestions.append({"changes": changes, "states": states})
+    # La combinación es la más útil cuando hay demasiadas
+    if len(suggestions) > SUGGESTION_MAX_CHIPS:
+        suggestions = suggestions[:SUGGESTION_MAX_CHIPS - 1] + suggestions[-1:]
+    return suggestions
+
+def format_adjustment_label(changes, states):
+    """Texto corto del chip con los controles que cambia la sugerencia"""
+    parts = []
+    if "brightness" in changes:
+        parts.append(f"Brillo {states['brightness']:+d}")
+    if "contrast" in changes:
+        parts.append(f"Contraste {states['contrast']:.2f}")
+    if "blur" in changes:
+        parts.append(f"Desenfoque {states['blur']}")
+    if "sharpen" in changes:
+        parts.append(f"Nitidez {states['sharpen']:.1f}")
+    if "rotation" in changes:
+        parts.append(f"Rotación {states['rotation']}°")
+    if "grayscale" in changes:
+        parts.append("Grises" if states["grayscale"] else "Color")
+    if "flip_h" in changes:
+        parts.append("Volteo H")
+    if "flip_v" in changes:
+        parts.append("Volteo V")
+    return " · ".join(parts)
+
+def format_control_info(control_states):
+    """Texto con los valores actuales de los controles para el prompt"""
+    return f"""\n\nVALORES ACTUALES DE LOS CONTROLES DEL EDITOR:
+- Brillo: {control_states['brightness']}
+- Contraste: {control_states['contrast']:.2f}
+- Desenfoque: {control_states['blur']}
+- Nitidez: {control_states['sharpen']:.1f}
+- Rotación: {control_states['rotation']}°
+- Escala de grises: {'Activada' if control_states['grayscale'] else 'Desactivada'}
+- Volteo horizontal: {'Sí' if control_states['flip_h'] else 'No'}
+- Volteo vertical: {'Sí' if control_states['flip_v'] else 'No'}
+"""
+
+def _image_part(img_base64):
+    """Parte de contenido con una imagen JPEG en base64"""
+    return {
+        "type": "image_url",
+        "image_url": {
+            "url": f"data:image/jpeg;base64,{img_base64}"
+        }
+    }
+
+def _processed_image_b64(processed_image):
+    """Codifica la imagen procesada como JPEG en base64"""
+    with perf_stats.stage("payload.processed_jpeg"):
+        _, buffer = cv2.imencode('.jpg', processed_image)
+    with perf_stats.stage("payload.processed_b64"):
+        return base64.b64encode(buffer).decode('utf-8')
+
+def build_vision_content(image_bytes, processed_image, control_states):
+    """Contenido de la petición de análisis inicial (VISION_PROMPT + imágenes)"""
+    # Codificar imagen original
+    with perf_stats.stage("payload.original_b64"):
+        img_base64_original = base64.b64encode(image_bytes).decode('utf-8')
+    
+    content_parts = [{"type": "text", "text": VISION_PROMPT + format_control_info(control_states)}]
+    content_parts.append(_image_part(img_base64_original))
+    
+    # Agregar imagen procesada si existe
+    if processed_image is not None:
+        content_parts.append({
+            "type": "text",
+            "text": "Esta es la imagen después de las ediciones del usuario:"
+        })
+        content_parts.append(_image_part(_processed_image_b64(processed_image)))
+    
+    return content_parts
+
+def build_dialog_content(image_bytes, processed_image, control_states, context_string, user_message,
+                         attach_images=True, digest_text=None):
+    """Contenido de un turno de conversación (DIALOG_PROMPT + contexto + imágenes o resumen)"""
+    # Usar replace en lugar de format para evitar problemas con llaves {} en el contexto
+    prompt_with_context = DIALOG_PROMPT.replace("{context}", context_string).replace("{user_input}", user_message)
+    prompt_with_context += format_control_info(control_states)
+    
+    if digest_text:
+        prompt_with_context += "\nRESUMEN ESTADÍSTICO DE LA IMAGEN EDITADA ACTUAL:\n" + digest_text + "\n"
+    
+    if not attach_images:
+        # Las imágenes ya se enviaron en turnos anteriores; el resumen describe el estado actual
+        prompt_with_context += "\n(No se adjuntan imágenes en este turno: ya las viste antes y el resumen refleja los cambios.)\n"
+        return [{"type": "text", "text": prompt_with_context}]
+    
+    # Codificar imagen original
+    with perf_stats.stage("payload.original_b64"):
+        img_base64_original = base64.b64encode(image_bytes).decode('utf-8')
+    
+    content_parts = [{"type": "text", "text": prompt_with_context}]
+    content_parts.append(_image_part(img_base64_original))
+    
+    # Agregar imagen procesada si existe
+    if processed_image is not None:
+        content_parts.append({
+            "type": "text",
+            "text": "Esta es la versión editada actual:"
+        })
+        content_parts.append(_image_part(_processed_image_b64(processed_image)))
+    
+    return content_parts
+
+def extract_token_usage(response):
+    """Tokens de entrada y salida según los metadatos de la respuesta (None si no vienen)"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens"), usage.get("output_tokens")
+    # Formato nativo de Gemini en response_metadata
+    metadata = (getattr(response, "response_metadata", None) or {}).get("usage_metadata") or {}
+    if metadata:
+        return metadata.get("prompt_token_count"), metadata.get("candidates_token_count")
+    return None, None
+
+def _attached_image_bytes(content_parts):
+    """Bytes de imagen (decodificados) adjuntos en las partes de la petición"""
+    total = 0
+    for part in content_parts:
+        if isinstance(part, dict) and part.get("type") == "image_url":
+            url = part["image_url"]["url"]
+            data = url.split(",", 1)[1] if "," in url else url
+            total += len(data) * 3 // 4 - data.count("=", len(data) - 2)
+    return total
+
+def _prompt_chars(content_parts):
+    return sum(len(part.get("text", "")) for part in content_parts if isinstance(part, dict))
+
+def invoke_model_with_usage(content_parts, model=None, kind="chat"):
+    """Como invoke_model, pero devuelve también el registro de consumo de la llamada"""
+    from langchain_core.messages import HumanMessage
+    message = HumanMessage(content=content_parts)
+    if model is None:
+        model = get_llm()
+    start = time.perf_counter()
+    with perf_stats.stage("llm.invoke"):
+        response = model.invoke([message])
+    latency_ms = (time.perf_counter() - start) * 1000.0
+    prompt_tokens, response_tokens = extract_token_usage(response)
+    usage = {
+        "timestamp": datetime.now().isoformat(),
+        "kind": kind,
+        "prompt_tokens": prompt_tokens,
+        "response_tokens": response_tokens,
+        "prompt_chars": _prompt_chars(content_parts),
+        "image_bytes": _attached_image_bytes(content_parts),
+        "latency_ms": round(latency_ms, 1)
+    }
+    return response.content, usage
+
+def invoke_model(content_parts, model=None):
+    """Envía una petición de un solo mensaje al modelo y devuelve el texto de la respuesta"""
+    return invoke_model_with_usage(content_parts, model)[0]
+
+# Visor con zoom: límites y pirámide de resoluciones
+VIEW_MIN_ZOOM = 0.02
+VIEW_MAX_ZOOM = 16.0
+VIEW_ZOOM_STEP = 1.25
+
+class ImagePyramid:
+    """Pirámide cv2.pyrDown construida bajo demanda para renderizar solo el área visible"""
+    def __init__(self, image):
+        self.base = image
+        self.levels = [image]
+
+    def level(self, index):
+        """Nivel index (escala 0.5^index); construye los niveles que falten"""
+        while len(self.levels) <= index:
+            with perf_stats.stage("canvas.pyramid"):
+                self.levels.append(cv2.pyrDown(self.levels[-1]))
+        return self.levels[index]
+
+    def _level_for_zoom(self, zoom):
+        """Nivel más reducido cuya resolución sigue siendo suficiente para el zoom"""
+        index = 0
+        h, w = self.base.shape[:2]
+        while 0.5 ** (index + 1) >= zoom and min(h, w) * 0.5 ** (index + 1) >= 2:
+            index += 1
+        return index
+
+    def render_viewport(self, view_w, view_h, zoom, center):
+        """Devuelve (imagen RGB visible, x, y) para dibujar en el canvas, o None si no hay área visible"""
+        h, w = self.base.shape[:2]
+        level = self.level(self._level_for_zoom(zoom))
+        level_sx = level.shape[1] / w
+        level_sy = level.shape[0] / h
         
-        # Configurar el grid para que se expanda
-        self.root.columnconfigure(0, weight=1)
+        # Región visible en coordenadas de la imagen original
+        src_x0 = center[0] * w - view_w / (2.0 * zoom)
+        src_y0 = center[1] * h - view_h / (2.0 * zoom)
+        vis_x0, vis_y0 = max(0.0, src_x0), max(0.0, src_y0)
+        vis_x1 = min(float(w), src_x0 + view_w / zoom)
+        vis_y1 = min(float(h), src_y0 + view_h / zoom)
+        if vis_x1 <= vis_x0 or vis_y1 <= vis_y0:
+            return None
+        
+        # Recorte en el nivel elegido
+        lx0 = min(int(math.floor(vis_x0 * level_sx)), level.shape[1] - 1)
+        ly0 = min(int(math.floor(vis_y0 * level_sy)), level.shape[0] - 1)
+        lx1 = max(int(math.ceil(vis_x1 * level_sx)), lx0 + 1)
+        ly1 = max(int(math.ceil(vis_y1 * level_sy)), ly0 + 1)
+        crop = level[ly0:ly1, lx0:lx1]
+        
+        # Tamaño y posición en el canvas
+        out_w = max(1, int(round((vis_x1 - vis_x0) * zoom)))
+        out_h = max(1, int(round((vis_y1 - vis_y0) * zoom)))
+        if zoom >= 2.0:
+            interpolation = cv2.INTER_NEAREST  # Píxeles nítidos para inspeccionar al 200% o más
+        elif crop.shape[1] > out_w:
+            interpolation = cv2.INTER_AREA
+        else:
+            interpolation = cv2.INTER_LINEAR
+        with perf_stats.stage("canvas.resize"):
+            resized = cv2.resize(crop, (out_w, out_h), interpolation=interpolation)
+        with perf_stats.stage("canvas.cvt_color"):
+            rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+        
+        x = int(round((vis_x0 - src_x0) * zoom))
+        y = int(round((vis_y0 - src_y0) * zoom))
+        return rgb, x, y
+
+# ===== VÍDEO Y SECUENCIAS DE IMÁGENES =====
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tif", ".tiff")
+VIDEO_PROXY_SIZE = 960      # Lado mayor de los fotogramas de vista previa
+VIDEO_PROXY_CACHE = 32      # Fotogramas de vista previa en memoria
+SEQUENCE_DEFAULT_FPS = 24.0 # Secuencias de imágenes no tienen fps propios
+
+def open_frame_capture(path):
+    """Abre un vídeo o una secuencia numerada (img_0001.png → img_%04d.png) con cv2.VideoCapture"""
+    if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+        # OpenCV deduce el patrón y el índice inicial a partir del primer archivo
+        capture = cv2.VideoCapture(path, cv2.CAP_IMAGES)
+    else:
+        capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"No se pudo abrir el vídeo o la secuencia: {path}")
+    return capture
+
+def _capture_fps(capture):
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    return fps if fps and fps > 0 else SEQUENCE_DEFAULT_FPS
+
+def _put_until(target_queue, item, stop_event):
+    """Encola respetando la cancelación; devuelve False si se canceló"""
+    while not stop_event.is_set():
+        try:
+            target_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get_until(source_queue, stop_event):
+    """Desencola respetando la cancelación; devuelve None si se canceló"""
+    while not stop_event.is_set():
+        try:
+            return source_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
+
+class VideoScrubber:
+    """Acceso aleatorio a fotogramas reducidos (proxies) sin decodificar todo el archivo"""
+    def __init__(self, path, proxy_size=VIDEO_PROXY_SIZE, cache_size=VIDEO_PROXY_CACHE):
+        self.path = path
+        self.content_id = video_content_id(path)  # Clave de la conversación del vídeo
+        self.capture = open_frame_capture(path)
+        self.proxy_size = proxy_size
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fps = _capture_fps(self.capture)
+        self._next_index = 0  # Posición de lectura actual (evita buscar en avance secuencial)
+
+    def frame(self, index):
+        """Proxy del fotograma index; solo busca y decodifica ese fotograma"""
+        cached = self.cache.get(index)
+        if cached is not None:
+            self.cache.move_to_end(index)
+            return cached
+        
+        if index != self._next_index:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+        with perf_stats.stage("video.seek_decode"):
+            ok, frame = self.capture.read()
+        if not ok:
+            return None
+        self._next_index = index + 1
+        
+        proxy = make_proxy(frame, self.proxy_size)
+        self.cache[index] = proxy
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return proxy
+
+    def close(self):
+        self.capture.release()
+        self.cache.clear()
+
+class VideoPipeline:
+    """Decodificación → edición en paralelo (conservando el orden) → codificación, con colas acotadas"""
+    _SENTINEL = object()
+
+    def __init__(self, input_path, output_path, control_states, workers=None, queue_size=8, fps=None):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.control_states = dict(DEFAULT_CONTROL_STATES)
+        self.control_states.update(control_states)
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.fps = fps
+        self.decode_queue = queue.Queue(maxsize=queue_size)
+        self.encode_queue = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.done_event = threading.Event()
+        self.error = None
+        self.total_frames = 0
+        self.decoded = 0
+        self.edited = 0
+        self.encoded = 0
+        self.pending = 0  # Fotogramas editados esperando a su turno de codificación
+        self._counter_lock = threading.Lock()
+        self._start_time = None
+        self._threads = []
+
+    def start(self):
+        capture = open_frame_capture(self.input_path)
+        self.total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        if self.fps is None:
+            self.fps = _capture_fps(capture)
+        self._start_time = time.perf_counter()
+        
+        self._threads = [threading.Thread(target=self._decode, args=(capture,), name="video-decode", daemon=True)]
+        for index in range(self.workers):
+            self._threads.append(threading.Thread(target=self._edit, name=f"video-edit-{index}", daemon=True))
+        self._threads.append(threading.Thread(target=self._encode, name="video-encode", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def cancel(self):
+        self.stop_event.set()
+
+    def _fail(self, error):
+        if self.error is None:
+            self.error = error
+        self.stop_event.set()
+
+    def _decode(self, capture):
+        """Hilo productor: lee fotogramas en orden"""
+        try:
+            index = 0
+            while not self.stop_event.is_set():
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                if not _put_until(self.decode_queue, (index, frame), self.stop_event):
+                    break
+                index += 1
+                self.decoded = index
+        except Exception as e:
+            self._fail(e)
+        finally:
+            capture.release()
+            for _ in range(self.workers):
+                _put_until(self.decode_queue, self._SENTINEL, self.stop_event)
+
+    def _edit(self):
+        """Hilos de edición: aplican el estado de los controles a cada fotograma"""
+        try:
+            while True:
+                item = _get_until(self.decode_queue, self.stop_event)
+                if item is None:
+                    return
+                if item is self._SENTINEL:
+                    _put_until(self.encode_queue, self._SENTINEL, self.stop_event)
+                    return
+                index, frame = item
+                with perf_stats.stage("video.edit"):
+                    edited = run_edit_stages(frame, self.control_states)
+                with self._counter_lock:
+                    self.edited += 1
+                if not _put_until(self.encode_queue, (index, edited), self.stop_event):
+                    return
+        except Exception as e:
+            self._fail(e)
+
+    def _create_writer(self, frame):
+        h, w = frame.shape[:2]
+        if "%" in self.output_path:
+            # Secuencia de imágenes numeradas: el backend de imágenes codifica cada fotograma según la extensión
+            writer = cv2.VideoWriter(self.output_path, cv2.CAP_IMAGES, 0, self.fps, (w, h))
+        else:
+            if self.output_path.lower().endswith(".avi"):
+                fourcc = cv2.VideoWriter_fourcc(*"MJPG")
+            else:
+                fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+            writer = cv2.VideoWriter(self.output_path, fourcc, self.fps, (w, h))
+        if not writer.isOpened():
+            raise ValueError(f"No se pudo crear el archivo de salida: {self.output_path}")
+        return writer
+
+    def _encode(self):
+        """Hilo consumidor: reordena y escribe los fotogramas"""
+        writer = None
+        pending = {}
+        next_index = 0
+        finished_workers = 0
+        try:
+            while finished_workers < self.workers:
+                item = _get_until(self.encode_queue, self.stop_event)
+                if item is None:
+                    return
+                if item is self._SENTINEL:
+                    finished_workers += 1
+                    continue
+                index, frame = item
+                pending[index] = frame
+                while next_index in pending:
+                    frame = pending.pop(next_index)
+                    if writer is None:
+                        writer = self._create_writer(frame)
+                    with perf_stats.stage("video.encode"):
+                        writer.write(frame)
+                    next_index += 1
+                    self.encoded = next_index
+                self.pending = len(pending)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            if writer is not None:
+                writer.release()
+            self.done_event.set()
+
+    def stats(self):
+        """Progreso, profundidad de colas y fotogramas por segundo de cada etapa"""
+        elapsed = time.perf_counter() - self._start_time if self._start_time else 0.0
+        
+        def rate(count):
+            return count / elapsed if elapsed > 0 else 0.0
+        
+        return {
+            "total": self.total_frames,
+            "decoded": self.decoded,
+            "edited": self.edited,
+            "encoded": self.encoded,
+            "decode_queue": self.decode_queue.qsize(),
+            "encode_queue": self.encode_queue.qsize(),
+            "reorder_pending": self.pending,
+            "fps": {"decode": rate(self.decoded), "edit": rate(self.edited), "encode": rate(self.encoded)},
+            "elapsed": elapsed,
+            "done": self.done_event.is_set(),
+            "cancelled": self.stop_event.is_set() and self.error is None,
+            "error": str(self.error) if self.error else None
+        }
+
+def format_video_stats(stats):
+    """Línea de estado del pipeline de vídeo"""
+    total = stats["total"] if stats["total"] > 0 else "?"
+    fps = stats["fps"]
+    return (
+        f"Fotogramas {stats['encoded']}/{total} | fps dec {fps['decode']:.1f} · ed {fps['edit']:.1f} · "
+        f"cod {fps['encode']:.1f} | colas {stats['decode_queue']}/{stats['encode_queue']} "
+        f"(+{stats['reorder_pending']} en espera) | {stats['elapsed']:.1f} s"
+    )
+
+# ===== EXPORTACIÓN MASIVA =====
+# formato: (extensión, parámetro de OpenCV, valor por defecto, mínimo, máximo)
+EXPORT_FORMATS = {
+    "png": (".png", cv2.IMWRITE_PNG_COMPRESSION, 3, 0, 9),
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, 92, 0, 100),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, 90, 1, 100),
+}
+EXPORT_MANIFEST = ".export_manifest.json"
+
+def export_source_hash(image_bytes, control_states, fmt, quality):
+    """Hash de todo lo que determina el archivo exportado (bytes originales, controles y codificador)"""
+    # Las variantes de operadores dan resultados idénticos, así que un nuevo ajuste no invalida lo exportado
+    digest = hashlib.sha256(image_bytes)
+    digest.update(json.dumps(normalize_control_states(control_states), sort_keys=True).encode("utf-8"))
+    digest.update(f"{fmt}:{quality}".encode("utf-8"))
+    return digest.hexdigest()
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _init_export_worker():
+    # Cada proceso usa un hilo de OpenCV; el paralelismo lo da el pool
+    cv2.setNumThreads(1)
+
+def export_edited_image(image_bytes, control_states, output_path, fmt, quality):
+    """Renderiza a resolución completa y codifica una imagen (se ejecuta en un proceso del pool)"""
+    # Sin caché en disco: la exportación en lote no debe desplazar las imágenes de la sesión interactiva
+    image = decode_image_bytes(image_bytes, cache=False)
+    if image is None:
+        raise ValueError("No se pudo decodificar la imagen original")
+    states = dict(DEFAULT_CONTROL_STATES)
+    states.update(control_states or {})
+    edited = render_edits(image, states)
+    ext, param, _, _, _ = EXPORT_FORMATS[fmt]
+    ok, buffer = cv2.imencode(ext, edited, [param, int(quality)])
+    if not ok:
+        raise ValueError(f"No se pudo codificar en formato {fmt}")
+    data = buffer.tobytes()
+    with open(output_path, "wb") as f:
+        f.write(data)
+    return hashlib.sha256(data).hexdigest()
+
+class BulkExporter:
+    """Exporta todas las imágenes de la sesión en un pool de procesos, omitiendo las ya actualizadas"""
+
+    def __init__(self, items, output_dir, fmt="png", quality=None, workers=None):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Formato no soportado: {fmt}")
+        _, _, default_quality, low, high = EXPORT_FORMATS[fmt]
+        self.items = items  # lista de (id de contenido, nombre, bytes originales, control_states)
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.quality = min(high, max(low, int(default_quality if quality is None else quality)))
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.stop_event = threading.Event()
+        self.done_event = threading.Event()
+        self.error = None
+        self.exported = 0
+        self.skipped = 0
+        self.failed = []
+        self._start_time = None
+        self._thread = None
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="bulk-export", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self.stop_event.set()
+
+    def _manifest_key(self, image_id):
+        return f"{image_id}:{self.fmt}"
+
+    def _output_names(self, manifest):
+        """Nombre de salida por id de contenido: se conserva el de exportaciones anteriores y se evitan colisiones"""
+        ext = EXPORT_FORMATS[self.fmt][0]
+        names = {}
+        taken = set()
+        for entry in manifest.values():
+            if isinstance(entry, dict) and entry.get("file"):
+                taken.add(entry["file"].lower())
+        for image_id, _, _, _ in self.items:
+            entry = manifest.get(self._manifest_key(image_id))
+            if isinstance(entry, dict) and entry.get("file"):
+                names[image_id] = entry["file"]
+        for image_id, image_name, _, _ in self.items:
+            if image_id in names:
+                continue
+            stem = os.path.splitext(image_name)[0] or "imagen"
+            candidate, suffix = stem + ext, 2
+            while candidate.lower() in taken:  # "a.jpg" y "a.png" no pueden compartir "a.png"
+                candidate, suffix = f"{stem}_{suffix}{ext}", suffix + 1
+            taken.add(candidate.lower())
+            names[image_id] = candidate
+        return names
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.output_dir, EXPORT_MANIFEST), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, manifest):
+        path = os.path.join(self.output_dir, EXPORT_MANIFEST)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def _is_up_to_date(self, manifest, image_id, output_name, source_hash):
+        """La salida está al día si su receta no cambió y el archivo no se modificó desde fuera"""
+        entry = manifest.get(self._manifest_key(image_id))
+        output_path = os.path.join(self.output_dir, output_name)
+        if not entry or entry.get("source") != source_hash or not os.path.exists(output_path):
+            return False
+        return _file_sha256(output_path) == entry.get("output")
+
+    def _run(self):
+        manifest = self._load_manifest()
+        executor = None
+        try:
+            jobs = []
+            output_names = self._output_names(manifest)
+            for image_id, image_name, image_bytes, control_states in self.items:
+                output_name = output_names[image_id]
+                source_hash = export_source_hash(image_bytes, control_states, self.fmt, self.quality)
+                if self._is_up_to_date(manifest, image_id, output_name, source_hash):
+                    self.skipped += 1
+                else:
+                    jobs.append((image_id, image_name, image_bytes, control_states, output_name, source_hash))
+            if not jobs or self.stop_event.is_set():
+                return
+            
+            # "spawn": un fork desde el proceso de Tk heredaría candados tomados y el archivo de registro abierto
+            executor = ProcessPoolExecutor(max_workers=min(self.workers, len(jobs)), initializer=_init_export_worker,
+                                           mp_context=multiprocessing.get_context("spawn"))
+            futures = {}
+            for image_id, image_name, image_bytes, control_states, output_name, source_hash in jobs:
+                output_path = os.path.join(self.output_dir, output_name)
+                future = executor.submit(export_edited_image, image_bytes, control_states, output_path, self.fmt, self.quality)
+                futures[future] = (image_id, image_name, output_name, source_hash)
+            
+            pending = set(futures)
+            while pending and not self.stop_event.is_set():
+                for future in [f for f in pending if f.done()]:
+                    pending.discard(future)
+                    image_id, image_name, output_name, source_hash = futures[future]
+                    try:
+                        manifest[self._manifest_key(image_id)] = {
+                            "file": output_name, "source": source_hash, "output": future.result()
+                        }
+                        self.exported += 1
+                    except Exception as e:
+                        self.failed.append((image_name, str(e)))
+                if pending:
+                    self.stop_event.wait(0.1)
+        except Exception as e:
+            self.error = e
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+            try:
+                self._save_manifest(manifest)
+            except OSError as e:
+                if self.error is None:
+                    self.error = e
+            self.done_event.set()
+
+    def stats(self):
+        elapsed = time.perf_counter() - self._start_time if self._start_time else 0.0
+        return {
+            "total": len(self.items),
+            "exported": self.exported,
+            "skipped": self.skipped,
+            "failed": list(self.failed),
+            "processed": self.exported + self.skipped + len(self.failed),
+            "elapsed": elapsed,
+            "done": self.done_event.is_set(),
+            "cancelled": self.stop_event.is_set() and self.error is None,
+            "error": str(self.error) if self.error else None
+        }
+
+def format_export_stats(stats):
+    """Línea de estado de la exportación masiva"""
+    failed = f" · {len(stats['failed'])} con error" if stats["failed"] else ""
+    return (
+        f"Exportadas {stats['exported']} · al día {stats['skipped']}{failed} · "
+        f"{stats['processed']}/{stats['total']} | {stats['elapsed']:.1f} s"
+    )
+
+# ===== GALERÍA Y CACHÉ DE IMÁGENES DECODIFICADAS =====
+GALLERY_THUMB_SIZE = 96
+IMAGE_CACHE_MB = int(os.getenv('IMAGE_CACHE_MB', '512'))
+
+class DecodedImageCache:
+    """LRU de imágenes decodificadas (original y última vista previa) con límite de memoria"""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entry_bytes(entry):
+        total = entry["original"].nbytes
+        if entry["preview"] is not None:
+            total += entry["preview"].nbytes
+        return total
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, original, preview=None, preview_states=None):
+        """Guarda (o reemplaza) una entrada y expulsa las menos usadas si se supera el límite"""
+        entry = {"original": original, "preview": preview, "preview_states": preview_states}
+        with self._lock:
+            self._discard(key)
+            size = self._entry_bytes(entry)
+            if size > self.max_bytes:
+                return
+            self.entries[key] = entry
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                self._discard(next(iter(self.entries)))
+
+    def _discard(self, key):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.current_bytes -= self._entry_bytes(old)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+# ===== CACHÉ EN DISCO DE IMÁGENES DECODIFICADAS =====
+DECODE_CACHE_DIR = os.getenv('DECODE_CACHE_DIR') or os.path.join(user_cache_dir(), "decoded")
+DECODE_CACHE_MB = int(os.getenv('DECODE_CACHE_MB', '2048'))  # 0 = desactivada
+
+class DiskDecodeCache:
+    """Matrices BGR decodificadas en archivos .npy (abiertos con mmap), indexadas por hash del contenido"""
+    INDEX_FILE = "index.json"
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = None  # ruta de origen -> hash del último contenido visto
+        self._pending_removal = set()  # Entradas que no se pudieron borrar (aún mapeadas en Windows)
+
+    @staticmethod
+    def content_key(image_bytes):
+        return content_id(image_bytes)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def _load_index(self):
+        if self._index is None:
+            try:
+                with open(os.path.join(self.cache_dir, self.INDEX_FILE), "r", encoding="utf-8") as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _save_index(self):
+        path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, path)
+
+    def _remove(self, key):
+        """Borra una entrada; si sigue mapeada se reintenta en la siguiente expulsión"""
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+        except OSError:
+            self._pending_removal.add(key)
+            return False
+        self._pending_removal.discard(key)
+        return True
+
+    def _track_source(self, source_path, key):
+        """Si el archivo de origen cambió, borra la entrada de su contenido anterior"""
+        index = self._load_index()
+        source_path = os.path.abspath(source_path)
+        old_key = index.get(source_path)
+        if old_key == key:
+            return
+        index[source_path] = key
+        if old_key is not None and old_key not in index.values():
+            self._remove(old_key)
+        self._save_index()
+
+    def _read(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            image = np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            self._remove(key)  # Archivo truncado o dañado
+            return None
+        if image.dtype != np.uint8 or image.ndim != 3:
+            self._remove(key)
+            return None
+        try:
+            os.utime(path)  # La fecha de modificación hace de marca LRU
+        except OSError:
+            pass
+        self._pending_removal.discard(key)  # Vuelve a usarse: ya no se borra
+        return image
+
+    def _write(self, key, image):
+        tmp_path = os.path.join(self.cache_dir, f"{key}.{uuid.uuid4().hex}.tmp.npy")
+        np.save(tmp_path, image)
+        os.replace(tmp_path, self._path(key))
+        self._pending_removal.discard(key)
+
+    def _evict(self, keep_key):
+        """Borra los .npy menos usados hasta volver al límite de tamaño"""
+        for key in list(self._pending_removal):
+            if key != keep_key:
+                self._remove(key)
+        entries = []
+        total = 0
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(".npy") or ".tmp" in file_name:
+                continue
+            path = os.path.join(self.cache_dir, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, file_name[:-4]))
+            total += stat.st_size
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            # Solo cuenta como liberado lo que de verdad se borró
+            if key != keep_key and self._remove(key):
+                total -= size
+
+    def decode(self, image_bytes, source_path=None):
+        """Devuelve la imagen decodificada (mapeada en memoria, de solo lectura) o None si no se puede decodificar"""
+        key = self.content_key(image_bytes)
+        with self._lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            if source_path:
+                self._track_source(source_path, key)
+            with perf_stats.stage("load.decode_cache"):
+                image = self._read(key)
+            if image is not None:
+                self.hits += 1
+                return image
+            self.misses += 1
+        
+        with perf_stats.stage("load.decode"):
+            image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return None
+        if image.nbytes > self.max_bytes:
+            return image
+        with self._lock:
+            try:
+                self._write(key, image)
+                self._evict(key)
+                cached = self._read(key)
+            except OSError:
+                cached = None
+        return cached if cached is not None else image
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+decode_cache = DiskDecodeCache(DECODE_CACHE_DIR, DECODE_CACHE_MB * 1024 * 1024) if DECODE_CACHE_MB > 0 else None
+
+def decode_image_bytes(image_bytes, source_path=None, cache=True):
+    """Decodifica una imagen a BGR usando la caché en disco cuando está activada"""
+    if cache and decode_cache is not None:
+        try:
+            return decode_cache.decode(image_bytes, source_path)
+        except OSError:
+            pass  # Directorio de caché no disponible: se decodifica sin caché
+    with perf_stats.stage("load.decode"):
+        return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+def make_thumbnail(image_bytes, size=GALLERY_THUMB_SIZE):
+    """Miniatura RGB a partir de los bytes del archivo (decodificación reducida)"""
+    buffer = np.frombuffer(image_bytes, np.uint8)
+    image = cv2.imdecode(buffer, cv2.IMREAD_REDUCED_COLOR_4)
+    if image is None:
+        image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    return cv2.cvtColor(make_proxy(image, size), cv2.COLOR_BGR2RGB)
+
+# Mensajes del chat que se mantienen en el widget y tamaño de página al subir
+CHAT_SCROLLBACK = 150
+CHAT_PAGE_SIZE = 50
+
+# Clase principal de la aplicación GUI
+class ImageAnalyzerGUI:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("Analizador de Imágenes con Gemini - Con Procesamiento CV2 Inteligente")
+        
+        # Iniciar en pantalla completa
+        self.root.state('zoomed')  # Windows: maximizar ventana
+        
+        # Contexto del diálogo con memoria por imagen
+        self.dialog_context = DialogContext()
+        
+        # Variables de estado
+        self.original_image = None
+        self.processed_image = None
+        self.flip_h = False
+        self.flip_v = False
+        self.stats_overlay_visible = False
+        self.model_ready = False
+        self._requests_in_flight = 0  # Análisis y mensajes enviados al modelo sin respuesta todavía
+        self._deferred_analysis = None  # Id de contenido cuyo análisis automático espera al modelo
+        self._digest = None
+        self._digest_key = None
+        
+        # Vista con zoom compartida por ambos canvas (None = ajustar a la ventana)
+        self.view_zoom = None
+        self.view_center = (0.5, 0.5)
+        self._pan_anchor = None
+        self._pyramids = {}
+        
+        # Modo vídeo: acceso a fotogramas de vista previa y exportación en curso
+        self.video_scrubber = None
+        self.video_pipeline = None
+        
+        # Galería: miniaturas generadas en segundo plano y LRU de imágenes decodificadas
+        self.image_cache = DecodedImageCache(IMAGE_CACHE_MB * 1024 * 1024)
+        self.thumbnail_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thumbnail")
+        self.gallery_thumbnails = {}
+        self.gallery_buttons = {}
+        self._thumbnails_pending = set()
+        self.bulk_exporter = None
+        self._pending_analyses = set()  # Ids de contenido con un análisis en curso
+        
+        # Sugerencias del asistente pre-renderizadas en segundo plano
+        self.suggestion_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="suggestion")
+        self.suggestions = []
+        self._suggestion_generation = 0
+        
+        # Historial de ediciones por imagen y puntos de control de render
+        self.timelines = {}
+        self.render_checkpoints = RenderCheckpoints()
+        self._restoring_timeline = False
+        
+        # Historial completo del chat y primer mensaje visible en el widget
+        self.chat_entries = []
+        self.chat_first_shown = 0  # Ventana de chat_entries mostrada en el widget: [first, last)
+        self.chat_last_shown = 0
+        self.chat_loading_older = False
+        
+        # Configurar la interfaz
+        self.setup_ui()
+        startup_timer.mark("ui_built")
+        
+        if os.getenv('PERF_STATS') == '1':
+            self.toggle_stats_overlay()
+        
+        # Construir el modelo en segundo plano una vez que la ventana está visible
+        self.root.after_idle(self._start_model_warm_up)
+        
+    def setup_ui(self):
+        # Crear canvas con scrollbars para scroll vertical y horizontal
+        canvas_container = tk.Canvas(self.root, highlightthickness=0)
+        scrollbar_v = ttk.Scrollbar(self.root, orient="vertical", command=canvas_container.yview)
+        scrollbar_h = ttk.Scrollbar(self.root, orient="horizontal", command=canvas_container.xview)
+        
+        # Frame principal dentro del canvas
+        main_frame = ttk.Frame(canvas_container, padding="10")
+        
+        # Crear ventana en el canvas
+        canvas_window = canvas_container.create_window((0, 0), window=main_frame, anchor="nw")
+        
+        # Configurar scrollbars
+        canvas_container.configure(yscrollcommand=scrollbar_v.set, xscrollcommand=scrollbar_h.set)
+        
+        # Posicionar canvas y scrollbars
+        canvas_container.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        scrollbar_v.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        scrollbar_h.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        
+        # Configurar el grid para que se expanda
+        self.root.columnconfigure(0, weight=1)
         self.root.rowconfigure(0, weight=1)
         main_frame.columnconfigure(0, weight=1)
         main_frame.columnconfigure(1, weight=1)
@@ -395,9 +2846,45 @@ class ImageAnalyzerGUI:
         self.processed_canvas = tk.Canvas(processed_frame, bg='#2b2b2b', width=400, height=400, highlightthickness=0)
         self.processed_canvas.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
+        # Zoom (rueda) y desplazamiento (arrastrar) sincronizados en ambos canvas
+        for canvas in (self.original_canvas, self.processed_canvas):
+            canvas.bind("<MouseWheel>", lambda e, c=canvas: self._on_canvas_wheel(e, c))
+            canvas.bind("<Button-4>", lambda e, c=canvas: self._on_canvas_wheel(e, c))
+            canvas.bind("<Button-5>", lambda e, c=canvas: self._on_canvas_wheel(e, c))
+            canvas.bind("<ButtonPress-1>", self._on_canvas_press)
+            canvas.bind("<B1-Motion>", lambda e, c=canvas: self._on_canvas_drag(e, c))
+            canvas.bind("<Double-Button-1>", lambda e: self.fit_view())
+        
+        view_frame = ttk.Frame(images_container)
+        view_frame.grid(row=1, column=0, columnspan=2, pady=(5, 0))
+        ttk.Button(view_frame, text="🔍 Ajustar", command=self.fit_view).pack(side=tk.LEFT, padx=5)
+        ttk.Button(view_frame, text="100%", command=self.actual_size_view).pack(side=tk.LEFT, padx=5)
+        self.zoom_label = ttk.Label(view_frame, text="Ajustar", width=8, font=('Arial', 9))
+        self.zoom_label.pack(side=tk.LEFT, padx=5)
+        
+        # Superposición de estadísticas de rendimiento (oculta por defecto)
+        self.stats_overlay = tk.Label(processed_frame, text="", justify=tk.LEFT, anchor=tk.NW,
+                                      font=("Consolas", 8), bg='#000000', fg='#00FF66')
+        
         # Panel de controles
         controls_frame = ttk.LabelFrame(left_frame, text="🎨 Controles de Edición", padding="10")
         controls_frame.grid(row=1, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
+        
+        # Panel de vídeo / secuencia (visible solo con un vídeo cargado)
+        self.video_frame = ttk.LabelFrame(left_frame, text="🎞️ Vídeo / Secuencia", padding="10")
+        self.video_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
+        self.video_frame.columnconfigure(0, weight=1)
+        self.video_frame_var = tk.IntVar(value=0)
+        self.video_slider = ttk.Scale(self.video_frame, from_=0, to=0, variable=self.video_frame_var,
+                                      orient=tk.HORIZONTAL, command=self._on_video_scrub)
+        self.video_slider.grid(row=0, column=0, sticky=(tk.W, tk.E), padx=5)
+        self.video_frame_label = ttk.Label(self.video_frame, text="0/0", width=14, anchor=tk.W, font=('Arial', 9))
+        self.video_frame_label.grid(row=0, column=1, padx=5)
+        ttk.Button(self.video_frame, text="💾 Exportar vídeo", command=self.export_video).grid(row=0, column=2, padx=5)
+        ttk.Button(self.video_frame, text="⏹ Cancelar", command=self.cancel_video_export).grid(row=0, column=3, padx=5)
+        self.video_status_label = ttk.Label(self.video_frame, text="", font=('Consolas', 9))
+        self.video_status_label.grid(row=1, column=0, columnspan=4, sticky=tk.W, padx=5, pady=(5, 0))
+        self.video_frame.grid_remove()
         controls_frame.columnconfigure(1, weight=1)
         
         # Variables de control
@@ -469,6 +2956,27 @@ class ImageAnalyzerGUI:
         ttk.Button(button_frame, text="↔️ Volteo Horizontal", command=self.flip_horizontal).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="↕️ Volteo Vertical", command=self.flip_vertical).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="🔄 Resetear", command=self.reset_image).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="✨ Auto", command=self.auto_adjust).pack(side=tk.LEFT, padx=5)
+        self.auto_explain_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(button_frame, text="Explicar con IA", variable=self.auto_explain_var).pack(side=tk.LEFT, padx=5)
+        
+        # Historial de ediciones (deshacer/rehacer)
+        row += 1
+        ttk.Label(controls_frame, text="🕘 Historial:", font=('Arial', 9, 'bold')).grid(row=row, column=0, sticky=tk.W, padx=5, pady=3)
+        history_frame = ttk.Frame(controls_frame)
+        history_frame.grid(row=row, column=1, columnspan=2, sticky=(tk.W, tk.E))
+        history_frame.columnconfigure(2, weight=1)
+        ttk.Button(history_frame, text="↶ Deshacer", command=self.undo_edit).grid(row=0, column=0, padx=5)
+        ttk.Button(history_frame, text="↷ Rehacer", command=self.redo_edit).grid(row=0, column=1, padx=5)
+        self.history_var = tk.IntVar(value=0)
+        self.history_slider = ttk.Scale(history_frame, from_=0, to=0, variable=self.history_var,
+                                        orient=tk.HORIZONTAL, command=self.jump_to_edit)
+        self.history_slider.grid(row=0, column=2, padx=5, sticky=(tk.W, tk.E))
+        self.history_label = ttk.Label(history_frame, text="0/0", width=9, anchor=tk.W, font=('Arial', 9))
+        self.history_label.grid(row=0, column=3, padx=5)
+        
+        self.root.bind("<Control-z>", lambda e: self.undo_edit())
+        self.root.bind("<Control-y>", lambda e: self.redo_edit())
         
         # ===== PANEL DERECHO: Chat =====
         right_frame = ttk.LabelFrame(main_frame, text="Chat con el Agente", padding="10")
@@ -487,7 +2995,15 @@ class ImageAnalyzerGUI:
             fg='#ffffff'
         )
         self.chat_display.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
-        self.chat_display.config(state=tk.DISABLED)
+        self.chat_display.config(state=tk.DISABLED, yscrollcommand=self._on_chat_scroll)
+        
+        # Configurar tags de colores (una sola vez)
+        self.chat_display.tag_config("system_tag", foreground="#FFD700", font=("Consolas", 10, "bold"))
+        self.chat_display.tag_config("system_msg", foreground="#CCCCCC")
+        self.chat_display.tag_config("user_tag", foreground="#4CAF50", font=("Consolas", 10, "bold"))
+        self.chat_display.tag_config("user_msg", foreground="#E0E0E0")
+        self.chat_display.tag_config("ai_tag", foreground="#2196F3", font=("Consolas", 10, "bold"))
+        self.chat_display.tag_config("ai_msg", foreground="#FFFFFF")
         
         # Frame para entrada de texto
         input_frame = ttk.Frame(right_frame)
@@ -498,17 +3014,58 @@ class ImageAnalyzerGUI:
         self.message_entry.grid(row=0, column=0, sticky=(tk.W, tk.E), padx=(0, 5))
         self.message_entry.bind("<Return>", lambda e: self.send_message())
         
-        self.send_button = ttk.Button(input_frame, text="Enviar", command=self.send_message)
+        self.send_button = ttk.Button(input_frame, text="Enviar", command=self.send_message, state=tk.DISABLED)
         self.send_button.grid(row=0, column=1)
         
+        # Chips con los valores sugeridos por el asistente (oculto si no hay)
+        self.suggestion_frame = ttk.Frame(right_frame)
+        self.suggestion_frame.grid(row=2, column=0, sticky=(tk.W, tk.E))
+        ttk.Label(self.suggestion_frame, text="💡 Sugerencias:", font=('Arial', 9)).pack(side=tk.LEFT, padx=(0, 5))
+        self.suggestion_chips_frame = ttk.Frame(self.suggestion_frame)
+        self.suggestion_chips_frame.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.suggestion_frame.grid_remove()
+        
+        # ===== GALERÍA DE LA SESIÓN =====
+        gallery_frame = ttk.LabelFrame(main_frame, text="🖼️ Galería de la sesión", padding="5")
+        gallery_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), padx=5, pady=5)
+        gallery_frame.columnconfigure(0, weight=1)
+        
+        self.gallery_canvas = tk.Canvas(gallery_frame, height=GALLERY_THUMB_SIZE + 40, bg='#2b2b2b', highlightthickness=0)
+        self.gallery_canvas.grid(row=0, column=0, sticky=(tk.W, tk.E))
+        gallery_scrollbar = ttk.Scrollbar(gallery_frame, orient=tk.HORIZONTAL, command=self.gallery_canvas.xview)
+        gallery_scrollbar.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        self.gallery_canvas.configure(xscrollcommand=gallery_scrollbar.set)
+        
+        self.gallery_inner = ttk.Frame(self.gallery_canvas)
+        self.gallery_canvas.create_window((0, 0), window=self.gallery_inner, anchor="nw")
+        self.gallery_inner.bind("<Configure>", lambda e: self.gallery_canvas.configure(scrollregion=self.gallery_canvas.bbox("all")))
+        
+        self.gallery_stats_label = ttk.Label(gallery_frame, text="", font=('Arial', 8), foreground="gray")
+        self.gallery_stats_label.grid(row=2, column=0, sticky=tk.W)
+        
+        export_row = ttk.Frame(gallery_frame)
+        export_row.grid(row=3, column=0, sticky=(tk.W, tk.E), pady=(5, 0))
+        export_row.columnconfigure(1, weight=1)
+        ttk.Button(export_row, text="📦 Exportar todas", command=self.export_all_images).grid(row=0, column=0, padx=(0, 5))
+        self.export_progress = ttk.Progressbar(export_row, mode="determinate")
+        self.export_progress.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=5)
+        ttk.Button(export_row, text="⏹ Cancelar", command=self.cancel_bulk_export).grid(row=0, column=2, padx=5)
+        self.export_status_label = ttk.Label(export_row, text="", font=('Consolas', 9))
+        self.export_status_label.grid(row=1, column=0, columnspan=3, sticky=tk.W)
+        
         # ===== BARRA DE HERRAMIENTAS SUPERIOR =====
         toolbar = ttk.Frame(main_frame)
         toolbar.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 10))
         
         ttk.Button(toolbar, text="📂 Cargar Imagen", command=self.load_image).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="🎞️ Cargar Vídeo", command=self.load_video).pack(side=tk.LEFT, padx=5)
         ttk.Button(toolbar, text="💾 Guardar Imagen Editada", command=self.save_edited_image).pack(side=tk.LEFT, padx=5)
         ttk.Button(toolbar, text="💬 Guardar Conversación", command=self.save_conversation).pack(side=tk.LEFT, padx=5)
         ttk.Button(toolbar, text="📥 Cargar Conversación", command=self.load_conversation).pack(side=tk.LEFT, padx=5)
+        self.analyze_button = ttk.Button(toolbar, text="🔍 Analizar", command=self.analyze_image, state=tk.DISABLED)
+        self.analyze_button.pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="📊 Rendimiento", command=self.toggle_stats_overlay).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="💰 Consumo", command=self.show_usage_summary).pack(side=tk.LEFT, padx=5)
         
         # Indicador de imagen actual
         self.image_label = ttk.Label(toolbar, text="Sin imagen cargada", foreground="gray")
@@ -517,90 +3074,498 @@ class ImageAnalyzerGUI:
         # Mensaje inicial
         self.add_message("Sistema", "Bienvenido al Editor de Imágenes con Asistente IA\n\nCARACTERÍSTICAS:\n- Carga una imagen y edítala usando los controles\n- El asistente te dará SUGERENCIAS de mejora\n- Guarda tu imagen editada cuando termines\n\nCarga una imagen para comenzar...", "system")
     
-    def add_message(self, sender, message, msg_type="user"):
-        """Añade un mensaje al chat"""
-        self.chat_display.config(state=tk.NORMAL)
+    def _start_model_warm_up(self):
+        """Inicia la construcción del modelo tras mostrar la ventana"""
+        startup_timer.mark("window_shown")
+        start_llm_warm_up()
+        
+        def wait_for_model():
+            try:
+                get_llm()
+                error_text = None
+            except Exception as e:
+                error_text = str(e)
+            self.root.after(0, lambda: self._on_model_ready(error_text))
         
+        thread = threading.Thread(target=wait_for_model)
+        thread.daemon = True
+        thread.start()
+    
+    def _on_model_ready(self, error_text):
+        """Habilita los botones del asistente cuando el modelo está listo"""
+        print(startup_timer.report())
+        if error_text:
+            self.add_message("Sistema", f"❌ Error al inicializar el asistente: {error_text}", "system")
+            return
+        self.model_ready = True
+        self._enable_model_buttons()
+        self._run_deferred_analysis()
+    
+    def _model_available(self):
+        return self.model_ready and self._requests_in_flight == 0
+    
+    def _enable_model_buttons(self):
+        """Rehabilita Enviar y Analizar solo si el modelo está listo y no hay otra petición en curso"""
+        state = tk.NORMAL if self._model_available() else tk.DISABLED
+        self.send_button.config(state=state)
+        self.analyze_button.config(state=state)
+    
+    def _begin_request(self):
+        self._requests_in_flight += 1
+        self._enable_model_buttons()
+    
+    def _finish_request(self):
+        """Se llama en el hilo de la UI al terminar una petición al modelo"""
+        self._requests_in_flight = max(0, self._requests_in_flight - 1)
+        self._enable_model_buttons()
+        self._run_deferred_analysis()
+    
+    def _run_deferred_analysis(self):
+        """Lanza el análisis automático aplazado si su imagen sigue activa y sin conversación"""
+        image_id = self._deferred_analysis
+        if image_id is None or not self._model_available():
+            return
+        self._deferred_analysis = None
+        if image_id == self.dialog_context.current_image_id and not self.dialog_context.get_current_messages():
+            self.analyze_image()
+    
+    @staticmethod
+    def _chat_entry_parts(sender, message, msg_type):
+        """Texto y tags de un mensaje del chat: (prefijo, tag, cuerpo, tag)"""
         if msg_type == "system":
-            self.chat_display.insert(tk.END, f"[{sender}] ", "system_tag")
-            self.chat_display.insert(tk.END, f"{message}\n\n", "system_msg")
+            return f"[{sender}] ", "system_tag", f"{message}\n\n", "system_msg"
         elif msg_type == "user":
-            self.chat_display.insert(tk.END, f"👤 {sender}: ", "user_tag")
-            self.chat_display.insert(tk.END, f"{message}\n\n", "user_msg")
+            return f"👤 {sender}: ", "user_tag", f"{message}\n\n", "user_msg"
         else:  # assistant
-            self.chat_display.insert(tk.END, f"🤖 {sender}: ", "ai_tag")
-            self.chat_display.insert(tk.END, f"{message}\n\n", "ai_msg")
+            return f"🤖 {sender}: ", "ai_tag", f"{message}\n\n", "ai_msg"
+    
+    @staticmethod
+    def _chat_entry_lines(entry):
+        """Líneas lógicas que ocupa un mensaje en el widget"""
+        return entry[1].count("\n") + entry[0].count("\n") + 2
+    
+    def _chat_insert(self, index, entries):
+        """Inserta varios mensajes en una sola llamada a Text.insert"""
+        args = []
+        for sender, message, msg_type in entries:
+            args.extend(self._chat_entry_parts(sender, message, msg_type))
+        if args:
+            self.chat_display.insert(index, *args)
+    
+    def add_message(self, sender, message, msg_type="user"):
+        """Añade un mensaje al chat"""
+        self.add_messages([(sender, message, msg_type)])
+    
+    def add_messages(self, entries):
+        """Añade un lote de mensajes (remitente, mensaje, tipo) con una sola actualización del widget"""
+        if not entries:
+            return
+        at_tail = self.chat_last_shown == len(self.chat_entries)
+        self.chat_entries.extend(entries)
         
-        # Configurar tags de colores
-        self.chat_display.tag_config("system_tag", foreground="#FFD700", font=("Consolas", 10, "bold"))
-        self.chat_display.tag_config("system_msg", foreground="#CCCCCC")
-        self.chat_display.tag_config("user_tag", foreground="#4CAF50", font=("Consolas", 10, "bold"))
-        self.chat_display.tag_config("user_msg", foreground="#E0E0E0")
-        self.chat_display.tag_config("ai_tag", foreground="#2196F3", font=("Consolas", 10, "bold"))
-        self.chat_display.tag_config("ai_msg", foreground="#FFFFFF")
+        self.chat_display.config(state=tk.NORMAL)
+        
+        # Solo se insertan los últimos CHAT_SCROLLBACK mensajes; si la ventana estaba en mensajes
+        # antiguos, se vuelve al final de la conversación
+        visible = entries[-CHAT_SCROLLBACK:]
+        if len(visible) < len(entries) or not at_tail:
+            visible = self.chat_entries[-CHAT_SCROLLBACK:]
+            self.chat_display.delete("1.0", tk.END)
+            self.chat_first_shown = len(self.chat_entries) - len(visible)
+        
+        self._chat_insert(tk.END, visible)
+        self.chat_last_shown = len(self.chat_entries)
+        self._trim_chat_scrollback()
         
         self.chat_display.see(tk.END)
         self.chat_display.config(state=tk.DISABLED)
     
-    def load_image(self):
-        """Carga una imagen desde el sistema de archivos"""
-        file_path = filedialog.askopenfilename(
-            title="Seleccionar Imagen",
+    def _trim_chat_scrollback(self):
+        """Elimina del widget los mensajes más antiguos por encima del límite (siguen en memoria); devuelve las líneas borradas"""
+        excess = self.chat_last_shown - self.chat_first_shown - CHAT_SCROLLBACK
+        if excess <= 0:
+            return 0
+        removed = self.chat_entries[self.chat_first_shown:self.chat_first_shown + excess]
+        lines = sum(self._chat_entry_lines(entry) for entry in removed)
+        self.chat_display.delete("1.0", f"{lines + 1}.0")
+        self.chat_first_shown += excess
+        return lines
+    
+    def _trim_chat_bottom(self):
+        """Elimina del widget los mensajes más recientes por encima del límite al leer mensajes antiguos"""
+        excess = self.chat_last_shown - self.chat_first_shown - CHAT_SCROLLBACK
+        if excess <= 0:
+            return
+        removed = self.chat_entries[self.chat_last_shown - excess:self.chat_last_shown]
+        lines = sum(self._chat_entry_lines(entry) for entry in removed)
+        last_line = int(self.chat_display.index("end-1c").split(".")[0])
+        self.chat_display.delete(f"{last_line - lines}.0", "end-1c")
+        self.chat_last_shown -= excess
+    
+    def _on_chat_scroll(self, first, last):
+        """Actualiza la barra y carga mensajes anteriores o posteriores al llegar a un extremo"""
+        self.chat_display.vbar.set(first, last)
+        if self.chat_loading_older:
+            return
+        if float(first) <= 0.0 and self.chat_first_shown > 0:
+            self.chat_loading_older = True
+            self.root.after_idle(self._load_older_messages)
+        elif float(last) >= 1.0 and self.chat_last_shown < len(self.chat_entries):
+            self.chat_loading_older = True
+            self.root.after_idle(self._load_newer_messages)
+    
+    def _load_older_messages(self):
+        """Inserta la página anterior de mensajes manteniendo la posición de lectura"""
+        try:
+            count = min(CHAT_PAGE_SIZE, self.chat_first_shown)
+            if count <= 0:
+                return
+            older = self.chat_entries[self.chat_first_shown - count:self.chat_first_shown]
+            lines = sum(self._chat_entry_lines(entry) for entry in older)
+            
+            self.chat_display.config(state=tk.NORMAL)
+            self._chat_insert("1.0", older)
+            self.chat_first_shown -= count
+            self._trim_chat_bottom()  # La ventana no crece al retroceder
+            self.chat_display.config(state=tk.DISABLED)
+            
+            # Mantener visible el mensaje que el usuario estaba leyendo
+            self.chat_display.yview(f"{lines + 1}.0")
+        finally:
+            self.chat_loading_older = False
+    
+    def _load_newer_messages(self):
+        """Vuelve a insertar al final la página siguiente tras haber recortado los mensajes recientes"""
+        try:
+            count = min(CHAT_PAGE_SIZE, len(self.chat_entries) - self.chat_last_shown)
+            if count <= 0:
+                return
+            newer = self.chat_entries[self.chat_last_shown:self.chat_last_shown + count]
+            top_line = int(self.chat_display.index("@0,0").split(".")[0])
+            
+            self.chat_display.config(state=tk.NORMAL)
+            self._chat_insert(tk.END, newer)
+            self.chat_last_shown += count
+            removed_lines = self._trim_chat_scrollback()
+            self.chat_display.config(state=tk.DISABLED)
+            
+            # Mantener visible el mensaje que el usuario estaba leyendo
+            self.chat_display.yview(f"{max(1, top_line - removed_lines)}.0")
+        finally:
+            self.chat_loading_older = False
+    
+    def load_image(self):
+        """Carga una imagen desde el sistema de archivos"""
+        file_path = filedialog.askopenfilename(
+            title="Seleccionar Imagen",
+            filetypes=[
+                ("Imágenes", "*.jpg *.jpeg *.png *.bmp *.gif"),
+                ("Todos los archivos", "*.*")
+            ]
+        )
+        
+        if file_path:
+            try:
+                # Leer bytes de la imagen (para el agente y para la caché de decodificación)
+                with open(file_path, 'rb') as f:
+                    img_bytes = f.read()
+                
+                image = decode_image_bytes(img_bytes, file_path)
+                if image is None:
+                    messagebox.showerror("Error", "No se pudo cargar la imagen")
+                    return
+                
+                self._remember_current_image()
+                self._close_video()
+                self.original_image = image
+                
+                # Establecer imagen actual en el contexto (crea/recupera su memoria por contenido)
+                known_content = self.dialog_context.set_current_image(img_bytes, file_path)
+                
+                # Resetear variables de control
+                self.brightness_var.set(0)
+                self.contrast_var.set(1.0)
+                self.blur_var.set(0)
+                self.sharpen_var.set(0)
+                self.rotation_var.set(0)
+                self.grayscale_var.set(False)
+                self.flip_h = False
+                self.flip_v = False
+                
+                self.processed_image = self.original_image.copy()
+                
+                # Mostrar imagen
+                self.display_images()
+                
+                # Actualizar etiqueta
+                self.image_label.config(text=f"Imagen actual: {os.path.basename(file_path)}", foreground="blue")
+                
+                # Añadir mensaje al chat
+                image_name = os.path.basename(file_path)
+                messages = self.dialog_context.get_current_messages()
+                self.add_message("Sistema", f"Imagen cargada: {image_name}\nMemoria de esta imagen: {len(messages)} mensajes", "system")
+                
+                aliases = self.dialog_context.image_conversations[self.dialog_context.current_image_id]["aliases"]
+                if known_content and len(aliases) > 1:
+                    others = ", ".join(alias for alias in aliases if alias != image_name)
+                    self.add_message("Sistema", f"Contenido idéntico a: {others}. Se reutiliza su conversación y su análisis.", "system")
+                
+                # Analizar automáticamente si no hay memoria, salvo que ya haya un análisis en curso para este contenido
+                if len(messages) == 0 and self.dialog_context.current_image_id not in self._pending_analyses:
+                    self.analyze_image()
+                elif len(messages) == 0:
+                    self.add_message("Sistema", "El análisis de este contenido ya está en curso.", "system")
+                else:
+                    self.add_message("Sistema", "Conversación previa encontrada para esta imagen. Puedes continuar donde lo dejaste.", "system")
+                    # Cargar estados de controles guardados
+                    self.load_control_states()
+                
+                self._start_edit_session()
+                self.image_cache.put(self.dialog_context.current_image_id, self.original_image)
+                self.refresh_gallery()
+                
+            except Exception as e:
+                messagebox.showerror("Error", f"Error al cargar la imagen: {str(e)}")
+    
+    def refresh_gallery(self):
+        """Sincroniza la galería con las imágenes de la sesión y lanza las miniaturas que falten"""
+        image_ids = self.dialog_context.get_all_images()
+        
+        for image_id in list(self.gallery_buttons):
+            if image_id not in image_ids:
+                self.gallery_buttons.pop(image_id).destroy()
+                self.gallery_thumbnails.pop(image_id, None)
+        
+        for image_id in image_ids:
+            if image_id not in self.gallery_buttons:
+                button = tk.Button(self.gallery_inner, compound=tk.TOP, width=GALLERY_THUMB_SIZE + 10,
+                                   height=GALLERY_THUMB_SIZE + 20, font=('Arial', 8),
+                                   command=lambda i=image_id: self.switch_image(i))
+                button.pack(side=tk.LEFT, padx=3)
+                self.gallery_buttons[image_id] = button
+            if image_id not in self.gallery_thumbnails and image_id not in self._thumbnails_pending:
+                image_data = self.dialog_context.image_conversations[image_id]["image_data"]
+                if image_data:
+                    self._thumbnails_pending.add(image_id)
+                    future = self.thumbnail_pool.submit(make_thumbnail, image_data)
+                    future.add_done_callback(lambda f, i=image_id: self.root.after(0, lambda: self._on_thumbnail_ready(i, f)))
+        
+        for image_id, button in self.gallery_buttons.items():
+            # El nombre puede cambiar si aparece otro contenido con el mismo nombre de archivo
+            name = self.dialog_context.get_display_name(image_id)
+            label = name if len(name) <= 16 else name[:13] + "..."
+            relief = tk.SUNKEN if image_id == self.dialog_context.current_image_id else tk.RAISED
+            button.config(text=label, relief=relief)
+        self._update_gallery_stats()
+    
+    def _on_thumbnail_ready(self, image_id, future):
+        """Crea el PhotoImage de la miniatura en el hilo de la interfaz"""
+        self._thumbnails_pending.discard(image_id)
+        button = self.gallery_buttons.get(image_id)
+        if button is None or future.exception() is not None or future.result() is None:
+            return
+        photo = ImageTk.PhotoImage(Image.fromarray(future.result()))
+        self.gallery_thumbnails[image_id] = photo
+        button.config(image=photo, width=0, height=0)
+    
+    def _update_gallery_stats(self):
+        stats = self.image_cache.stats()
+        text = (f"Caché: {stats['entries']} imágenes · {stats['bytes'] / 1e6:.0f}/{stats['max_bytes'] / 1e6:.0f} MB · "
+                f"aciertos {stats['hit_rate'] * 100:.0f}% ({stats['hits']}/{stats['hits'] + stats['misses']})")
+        if decode_cache is not None:
+            disk = decode_cache.stats()
+            text += f" | Disco: aciertos {disk['hits']}/{disk['hits'] + disk['misses']}"
+        self.gallery_stats_label.config(text=text)
+    
+    def _remember_current_image(self):
+        """Guarda la imagen actual y su última vista previa en la caché antes de cambiar"""
+        image_id = self.dialog_context.current_image_id
+        if self.original_image is None or image_id is None or self.video_scrubber is not None:
+            return
+        self.image_cache.put(image_id, self.original_image, self.processed_image, self.get_control_states())
+    
+    def switch_image(self, image_id):
+        """Cambia a otra imagen de la sesión usando la caché de imágenes decodificadas"""
+        if image_id == self.dialog_context.current_image_id and self.video_scrubber is None:
+            return
+        
+        self._remember_current_image()
+        if not self.dialog_context.switch_to_image(image_id):
+            return
+        self._close_video()
+        image_name = self.dialog_context.current_image_name
+        
+        conv_data = self.dialog_context.image_conversations[image_id]
+        control_states = dict(DEFAULT_CONTROL_STATES)
+        control_states.update(conv_data.get("control_states") or {})
+        
+        entry = self.image_cache.get(image_id)
+        preview = None
+        if entry is not None:
+            self.original_image = entry["original"]
+            if entry["preview_states"] == control_states:
+                preview = entry["preview"]
+        else:
+            original = decode_image_bytes(self.dialog_context.current_image_data)
+            if original is None:
+                messagebox.showerror("Error", f"No se pudo decodificar la imagen {image_name}")
+                return
+            self.original_image = original
+        
+        self._set_control_vars(control_states)
+        if preview is not None:
+            # Vista previa ya renderizada: se muestra sin volver a aplicar las ediciones
+            self.processed_image = preview
+            self.display_images()
+        else:
+            self._restoring_timeline = True
+            try:
+                self.apply_all_edits()
+            finally:
+                self._restoring_timeline = False
+        
+        self._start_edit_session()
+        self.image_cache.put(image_id, self.original_image, self.processed_image, control_states)
+        self.image_label.config(text=f"Imagen actual: {image_name}", foreground="blue")
+        messages = self.dialog_context.get_current_messages()
+        self.add_message("Sistema", f"Imagen activa: {image_name}\nMemoria de esta imagen: {len(messages)} mensajes", "system")
+        self.refresh_gallery()
+    
+    def load_video(self):
+        """Abre un vídeo o una secuencia numerada; la vista previa usa fotogramas reducidos"""
+        file_path = filedialog.askopenfilename(
+            title="Seleccionar Vídeo o primer archivo de una secuencia",
+            filetypes=[
+                ("Vídeos", "*.mp4 *.avi *.mov *.mkv *.webm"),
+                ("Secuencia de imágenes", "*.jpg *.jpeg *.png *.bmp *.tif *.tiff"),
+                ("Todos los archivos", "*.*")
+            ]
+        )
+        if not file_path:
+            return
+        
+        try:
+            scrubber = VideoScrubber(file_path)
+            first_frame = scrubber.frame(0)
+            if first_frame is None:
+                scrubber.close()
+                messagebox.showerror("Error", "No se pudo leer ningún fotograma")
+                return
+        except Exception as e:
+            messagebox.showerror("Error", f"Error al abrir el vídeo: {str(e)}")
+            return
+        
+        self._remember_current_image()
+        self._close_video()
+        self.video_scrubber = scrubber
+        self.video_slider.config(to=max(scrubber.frame_count - 1, 0))
+        self.video_frame_var.set(0)
+        self.video_status_label.config(text=f"{scrubber.frame_count} fotogramas · {scrubber.fps:.2f} fps")
+        self.video_frame.grid()
+        
+        # El fotograma visible actúa como imagen actual (para editar y para el asistente)
+        self._show_video_frame(0, first_frame)
+        self.brightness_var.set(0)
+        self.contrast_var.set(1.0)
+        self.blur_var.set(0)
+        self.sharpen_var.set(0)
+        self.rotation_var.set(0)
+        self.grayscale_var.set(False)
+        self.flip_h = False
+        self.flip_v = False
+        self.refresh_control_labels()
+        self.processed_image = self.original_image.copy()
+        self.display_images()
+        
+        image_name = os.path.basename(file_path)
+        self.image_label.config(text=f"Vídeo actual: {image_name}", foreground="blue")
+        messages = self.dialog_context.get_current_messages()
+        self.add_message("Sistema", f"Vídeo cargado: {image_name} ({scrubber.frame_count} fotogramas)\nLa vista previa usa fotogramas reducidos; la exportación procesa la resolución completa.", "system")
+        if len(messages) == 0 and self.dialog_context.current_image_id not in self._pending_analyses:
+            self.analyze_image()
+        elif len(messages) > 0:
+            self.load_control_states()
+        self._start_edit_session()
+        self.refresh_gallery()
+    
+    def _show_video_frame(self, index, frame):
+        """Usa un fotograma de vista previa como imagen original"""
+        self.original_image = frame
+        _, buffer = cv2.imencode('.jpg', frame)
+        self.dialog_context.set_current_image(buffer.tobytes(), self.video_scrubber.path, self.video_scrubber.content_id)
+        total = self.video_scrubber.frame_count
+        self.video_frame_label.config(text=f"{index + 1}/{total}")
+    
+    def _on_video_scrub(self, value):
+        """Muestra el fotograma elegido decodificando solo ese fotograma"""
+        if self.video_scrubber is None:
+            return
+        index = int(round(float(value)))
+        frame = self.video_scrubber.frame(index)
+        if frame is None:
+            return
+        self._show_video_frame(index, frame)
+        self.apply_all_edits()
+    
+    def _close_video(self):
+        """Cierra el vídeo actual y cancela una exportación en curso"""
+        self.cancel_video_export()
+        if self.video_scrubber is not None:
+            self.video_scrubber.close()
+            self.video_scrubber = None
+        self.video_frame.grid_remove()
+    
+    def export_video(self):
+        """Aplica los controles actuales a todos los fotogramas en segundo plano"""
+        if self.video_scrubber is None:
+            return
+        if self.video_pipeline is not None and not self.video_pipeline.done_event.is_set():
+            messagebox.showwarning("Advertencia", "Ya hay una exportación en curso")
+            return
+        
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".mp4",
             filetypes=[
-                ("Imágenes", "*.jpg *.jpeg *.png *.bmp *.gif"),
-                ("Todos los archivos", "*.*")
-            ]
+                ("MP4 files", "*.mp4"),
+                ("AVI files", "*.avi"),
+                ("All files", "*.*")
+            ],
+            title="Exportar Vídeo Editado"
         )
+        if not file_path:
+            return
         
-        if file_path:
-            try:
-                # Leer imagen con OpenCV
-                self.original_image = cv2.imread(file_path)
-                
-                if self.original_image is None:
-                    messagebox.showerror("Error", "No se pudo cargar la imagen")
-                    return
-                
-                # Leer bytes de la imagen para el agente
-                with open(file_path, 'rb') as f:
-                    img_bytes = f.read()
-                
-                # Establecer imagen actual en el contexto (crea/recupera su memoria)
-                self.dialog_context.set_current_image(img_bytes, file_path)
-                
-                # Resetear variables de control
-                self.brightness_var.set(0)
-                self.contrast_var.set(1.0)
-                self.blur_var.set(0)
-                self.sharpen_var.set(0)
-                self.rotation_var.set(0)
-                self.grayscale_var.set(False)
-                self.flip_h = False
-                self.flip_v = False
-                
-                self.processed_image = self.original_image.copy()
-                
-                # Mostrar imagen
-                self.display_images()
-                
-                # Actualizar etiqueta
-                self.image_label.config(text=f"Imagen actual: {os.path.basename(file_path)}", foreground="blue")
-                
-                # Añadir mensaje al chat
-                image_name = os.path.basename(file_path)
-                messages = self.dialog_context.get_current_messages()
-                self.add_message("Sistema", f"Imagen cargada: {image_name}\nMemoria de esta imagen: {len(messages)} mensajes", "system")
-                
-                # Analizar imagen automáticamente solo si es nueva (sin memoria)
-                if len(messages) == 0:
-                    self.analyze_image()
-                else:
-                    self.add_message("Sistema", "Conversación previa encontrada para esta imagen. Puedes continuar donde lo dejaste.", "system")
-                    # Cargar estados de controles guardados
-                    self.load_control_states()
-                
-            except Exception as e:
-                messagebox.showerror("Error", f"Error al cargar la imagen: {str(e)}")
+        try:
+            self.video_pipeline = VideoPipeline(self.video_scrubber.path, file_path, self.get_control_states())
+            self.video_pipeline.start()
+        except Exception as e:
+            self.video_pipeline = None
+            messagebox.showerror("Error", f"Error al iniciar la exportación: {str(e)}")
+            return
+        self.add_message("Sistema", f"Exportando vídeo con {self.video_pipeline.workers} hilos de edición...", "system")
+        self._poll_video_export()
+    
+    def cancel_video_export(self):
+        if self.video_pipeline is not None and not self.video_pipeline.done_event.is_set():
+            self.video_pipeline.cancel()
+    
+    def _poll_video_export(self):
+        """Actualiza el estado de la exportación hasta que termina"""
+        pipeline = self.video_pipeline
+        if pipeline is None:
+            return
+        stats = pipeline.stats()
+        self.video_status_label.config(text=format_video_stats(stats))
+        if not stats["done"]:
+            self.root.after(500, self._poll_video_export)
+            return
+        
+        if stats["error"]:
+            self.add_message("Sistema", f"❌ Error al exportar el vídeo: {stats['error']}", "system")
+        elif stats["cancelled"]:
+            self.add_message("Sistema", "Exportación de vídeo cancelada", "system")
+        else:
+            self.add_message("Sistema", f"✓ Vídeo exportado: {os.path.basename(pipeline.output_path)} ({stats['encoded']} fotogramas en {stats['elapsed']:.1f} s)", "system")
     
     def display_images(self):
         """Muestra la imagen original y la procesada en sus respectivos canvas"""
@@ -614,29 +3579,122 @@ class ImageAnalyzerGUI:
         if self.processed_image is not None:
             self.display_image_in_canvas(self.processed_image, self.processed_canvas)
     
-    def display_image_in_canvas(self, cv_image, canvas):
-        """Muestra una imagen de OpenCV en un canvas específico"""
-        # Convertir de BGR a RGB
-        image_rgb = cv2.cvtColor(cv_image, cv2.COLOR_BGR2RGB)
-        
-        # Redimensionar para ajustar al canvas
+    @staticmethod
+    def _canvas_size(canvas):
         canvas_width = canvas.winfo_width() if canvas.winfo_width() > 1 else 400
         canvas_height = canvas.winfo_height() if canvas.winfo_height() > 1 else 400
+        return canvas_width, canvas_height
+    
+    def _current_view(self, canvas_width, canvas_height, image_width, image_height):
+        """Zoom y centro (normalizado) actuales; en modo ajustar se calcula el encaje"""
+        if self.view_zoom is None:
+            return min(canvas_width / image_width, canvas_height / image_height, 1), (0.5, 0.5)
+        return self.view_zoom, self.view_center
+    
+    def display_image_in_canvas(self, cv_image, canvas):
+        """Muestra una imagen de OpenCV en un canvas específico (solo el área visible)"""
+        canvas_width, canvas_height = self._canvas_size(canvas)
         
-        h, w = image_rgb.shape[:2]
-        scale = min(canvas_width/w, canvas_height/h, 1)
-        new_w, new_h = int(w*scale), int(h*scale)
-        
-        resized = cv2.resize(image_rgb, (new_w, new_h))
+        # Pirámide cacheada por canvas mientras la imagen no cambie
+        pyramid = self._pyramids.get(str(canvas))
+        if pyramid is None or pyramid.base is not cv_image:
+            pyramid = self._pyramids[str(canvas)] = ImagePyramid(cv_image)
         
-        # Convertir a PIL Image y luego a PhotoImage
-        pil_image = Image.fromarray(resized)
-        photo = ImageTk.PhotoImage(pil_image)
+        h, w = cv_image.shape[:2]
+        zoom, center = self._current_view(canvas_width, canvas_height, w, h)
+        viewport = pyramid.render_viewport(canvas_width, canvas_height, zoom, center)
         
         # Limpiar canvas y mostrar imagen
         canvas.delete("all")
+        if viewport is None:
+            return
+        image_rgb, x, y = viewport
+        
+        # Convertir a PIL Image y luego a PhotoImage
+        with perf_stats.stage("canvas.photo_image"):
+            pil_image = Image.fromarray(image_rgb)
+            photo = ImageTk.PhotoImage(pil_image)
+        
         canvas.image = photo  # Guardar referencia
-        canvas.create_image(canvas_width//2, canvas_height//2, image=photo, anchor=tk.CENTER)
+        canvas.create_image(x, y, image=photo, anchor=tk.NW)
+    
+    def _set_view(self, zoom, center):
+        """Aplica zoom/centro a ambos canvas a la vez (comparación antes/después)"""
+        self.view_zoom = min(max(zoom, VIEW_MIN_ZOOM), VIEW_MAX_ZOOM)
+        self.view_center = (min(max(center[0], 0.0), 1.0), min(max(center[1], 0.0), 1.0))
+        self.zoom_label.config(text=f"{self.view_zoom * 100:.0f}%")
+        self.display_images()
+    
+    def fit_view(self):
+        """Vuelve al modo ajustar a la ventana"""
+        self.view_zoom = None
+        self.view_center = (0.5, 0.5)
+        self.zoom_label.config(text="Ajustar")
+        self.display_images()
+    
+    def actual_size_view(self):
+        """Muestra la imagen al 100% manteniendo el centro actual"""
+        if self.original_image is None:
+            return
+        self._set_view(1.0, self.view_center)
+    
+    def _on_canvas_wheel(self, event, canvas):
+        """Zoom con la rueda del ratón centrado en el cursor"""
+        if self.original_image is None:
+            return "break"
+        factor = VIEW_ZOOM_STEP if (getattr(event, "delta", 0) > 0 or getattr(event, "num", None) == 4) else 1 / VIEW_ZOOM_STEP
+        
+        canvas_width, canvas_height = self._canvas_size(canvas)
+        h, w = self.original_image.shape[:2]
+        zoom, (cx, cy) = self._current_view(canvas_width, canvas_height, w, h)
+        
+        # Punto de la imagen bajo el cursor, que debe quedar fijo tras el zoom
+        offset_x = event.x - canvas_width / 2.0
+        offset_y = event.y - canvas_height / 2.0
+        source_x = cx * w + offset_x / zoom
+        source_y = cy * h + offset_y / zoom
+        new_zoom = min(max(zoom * factor, VIEW_MIN_ZOOM), VIEW_MAX_ZOOM)
+        self._set_view(new_zoom, ((source_x - offset_x / new_zoom) / w, (source_y - offset_y / new_zoom) / h))
+        return "break"
+    
+    def _on_canvas_press(self, event):
+        self._pan_anchor = (event.x, event.y)
+    
+    def _on_canvas_drag(self, event, canvas):
+        """Desplaza la vista arrastrando con el botón izquierdo"""
+        if self.original_image is None or self._pan_anchor is None:
+            return
+        canvas_width, canvas_height = self._canvas_size(canvas)
+        h, w = self.original_image.shape[:2]
+        zoom, (cx, cy) = self._current_view(canvas_width, canvas_height, w, h)
+        dx = event.x - self._pan_anchor[0]
+        dy = event.y - self._pan_anchor[1]
+        self._pan_anchor = (event.x, event.y)
+        self._set_view(zoom, (cx - dx / (zoom * w), cy - dy / (zoom * h)))
+    
+    def toggle_stats_overlay(self):
+        """Muestra u oculta la superposición de estadísticas"""
+        self.stats_overlay_visible = not self.stats_overlay_visible
+        # Sin PERF_STATS ni PERF_LOG_FILE la instrumentación solo se mide mientras la superposición está visible
+        perf_stats.enabled = self.stats_overlay_visible or PERF_STATS_ALWAYS_ON
+        
+        if self.stats_overlay_visible:
+            self.stats_overlay.place(relx=0, rely=0, anchor=tk.NW)
+            self.stats_overlay.lift()
+            self._refresh_stats_overlay()
+        else:
+            self.stats_overlay.place_forget()
+    
+    def _refresh_stats_overlay(self):
+        """Actualiza periódicamente el texto de la superposición"""
+        if not self.stats_overlay_visible:
+            return
+        text = perf_stats.format_summary()
+        if self.model_ready and hasattr(llm, "format_stats"):
+            text += "\n" + llm.format_stats()
+        text += "\n" + operator_registry.describe()
+        self.stats_overlay.config(text=text)
+        self.root.after(500, self._refresh_stats_overlay)
     
     def update_slider_label(self, control_name, value):
         """Actualiza el texto de la etiqueta del slider y aplica cambios"""
@@ -667,58 +3725,96 @@ class ImageAnalyzerGUI:
         if self.original_image is None:
             return
         
-        # Comenzar con la imagen original
-        img = self.original_image.copy()
-        
-        # Aplicar brillo
-        brightness = self.brightness_var.get()
-        if brightness != 0:
-            img = cv2.convertScaleAbs(img, alpha=1, beta=brightness)
-        
-        # Aplicar contraste
-        contrast = self.contrast_var.get()
-        if contrast != 1.0:
-            img = cv2.convertScaleAbs(img, alpha=contrast, beta=0)
-        
-        # Aplicar desenfoque
-        blur_amount = self.blur_var.get()
-        if blur_amount > 0:
-            ksize = blur_amount * 2 + 1  # Debe ser impar
-            img = cv2.GaussianBlur(img, (ksize, ksize), 0)
-        
-        # Aplicar nitidez (método más suave y controlado)
-        sharpen_amount = self.sharpen_var.get()
-        if sharpen_amount > 0:
-            # Crear versión desenfocada
-            gaussian = cv2.GaussianBlur(img, (0, 0), 3)
-            # Mezclar original con desenfocada para aumentar nitidez
-            # amount controla la intensidad (valores típicos: 0.5 a 2.0)
-            img = cv2.addWeighted(img, 1.0 + sharpen_amount * 0.5, gaussian, -sharpen_amount * 0.5, 0)
-        
-        # Aplicar escala de grises
-        if self.grayscale_var.get():
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)  # Convertir de vuelta a 3 canales
-        
-        # Aplicar rotación
-        rotation = self.rotation_var.get()
-        if rotation != 0:
-            h, w = img.shape[:2]
-            center = (w // 2, h // 2)
-            matrix = cv2.getRotationMatrix2D(center, rotation, 1.0)
-            img = cv2.warpAffine(img, matrix, (w, h))
-        
-        # Aplicar volteos
-        if self.flip_h:
-            img = cv2.flip(img, 1)
-        if self.flip_v:
-            img = cv2.flip(img, 0)
-        
-        self.processed_image = img
-        self.display_images()
+        with perf_stats.stage("edits.total"):
+            control_states = self.get_control_states()
+            self.processed_image = self.render_checkpoints.render(self.original_image, control_states)
+            if not self._restoring_timeline:
+                self._record_edit(control_states)
+            with perf_stats.stage("edits.display"):
+                self.display_images()
+            
+            # Guardar estado actual
+            with perf_stats.stage("edits.save_state"):
+                self.save_control_states()
+    
+    def _current_timeline(self):
+        """Historial de la imagen actual (se crea con el estado actual de los controles)"""
+        image_id = self.dialog_context.current_image_id
+        timeline = self.timelines.get(image_id)
+        if timeline is None:
+            timeline = self.timelines[image_id] = EditTimeline(self.get_control_states())
+        return timeline
+    
+    def _start_edit_session(self):
+        """Prepara el historial y la vista al cambiar de imagen"""
+        self._clear_suggestions()
+        self._current_timeline()
+        self.fit_view()
+        self._update_history_widgets()
+    
+    def _record_edit(self, control_states):
+        """Añade el estado actual al historial si cambió"""
+        timeline = self._current_timeline()
+        if timeline.push(control_states):
+            self._update_history_widgets()
+    
+    def _update_history_widgets(self):
+        timeline = self._current_timeline()
+        self.history_slider.config(to=max(len(timeline), 0))
+        self.history_var.set(timeline.position)
+        self.history_label.config(text=f"{timeline.position}/{len(timeline)}")
+    
+    def _set_control_vars(self, control_states):
+        """Asigna los controles (sin renderizar) y actualiza sus etiquetas"""
+        self.brightness_var.set(control_states["brightness"])
+        self.contrast_var.set(control_states["contrast"])
+        self.blur_var.set(control_states["blur"])
+        self.sharpen_var.set(control_states["sharpen"])
+        self.rotation_var.set(control_states["rotation"])
+        self.grayscale_var.set(control_states["grayscale"])
+        self.flip_h = control_states["flip_h"]
+        self.flip_v = control_states["flip_v"]
+        self.refresh_control_labels()
+    
+    def _restore_edit_states(self, control_states):
+        """Aplica un estado del historial sin registrarlo como edición nueva"""
+        self._set_control_vars(control_states)
         
-        # Guardar estado actual
-        self.save_control_states()
+        self._restoring_timeline = True
+        try:
+            self.apply_all_edits()
+        finally:
+            self._restoring_timeline = False
+        self._update_history_widgets()
+    
+    def _edit_shortcut_allowed(self):
+        """Los atajos de historial no actúan mientras se escribe en el chat"""
+        return self.original_image is not None and self.root.focus_get() is not self.message_entry
+    
+    def undo_edit(self):
+        """Deshace el último cambio de los controles"""
+        if not self._edit_shortcut_allowed():
+            return
+        control_states = self._current_timeline().undo()
+        if control_states is not None:
+            self._restore_edit_states(control_states)
+    
+    def redo_edit(self):
+        """Rehace el último cambio deshecho"""
+        if not self._edit_shortcut_allowed():
+            return
+        control_states = self._current_timeline().redo()
+        if control_states is not None:
+            self._restore_edit_states(control_states)
+    
+    def jump_to_edit(self, value):
+        """Salta a un paso del historial desde el slider"""
+        if self.original_image is None or self._restoring_timeline:
+            return
+        timeline = self._current_timeline()
+        target = int(round(float(value)))
+        if target != timeline.position:
+            self._restore_edit_states(timeline.jump(target))
     
     def flip_horizontal(self):
         """Voltea la imagen horizontalmente"""
@@ -759,8 +3855,42 @@ class ImageAnalyzerGUI:
         # Resetear imagen procesada
         self.processed_image = self.original_image.copy()
         self.display_images()
+        self._record_edit(self.get_control_states())
         self.add_message("Sistema", "Imagen y controles reseteados a estado original", "system")
     
+    def auto_adjust(self):
+        """Calcula ajustes automáticos localmente y los aplica a los controles"""
+        if self.original_image is None:
+            return
+        
+        with perf_stats.stage("auto.estimate"):
+            adjustments = estimate_auto_adjustments(self.original_image)
+        
+        self.brightness_var.set(adjustments["brightness"])
+        self.contrast_var.set(adjustments["contrast"])
+        self.sharpen_var.set(adjustments["sharpen"])
+        self.rotation_var.set(adjustments["rotation"])
+        self.refresh_control_labels()
+        self.apply_all_edits()
+        
+        summary = format_auto_adjustments(adjustments)
+        self.add_message("Sistema", f"✨ Ajuste automático aplicado:\n{summary}", "system")
+        
+        # Opcionalmente pedir al asistente que explique los valores en lugar de calcularlos
+        if self.auto_explain_var.get():
+            if not self.model_ready:
+                self.add_message("Sistema", "⏳ El asistente aún se está inicializando, no se puede pedir la explicación", "system")
+                return
+            if self._requests_in_flight:
+                self.add_message("Sistema", "⏳ Hay una respuesta en curso, no se puede pedir la explicación ahora", "system")
+                return
+            request = (
+                "Apliqué un ajuste automático local con estos valores:\n"
+                f"{summary}\n"
+                "Explica brevemente por qué estos ajustes mejoran (o no) la imagen y si cambiarías alguno."
+            )
+            self._dispatch_message(request)
+    
     def save_edited_image(self):
         """Guarda la imagen editada"""
         if self.processed_image is None:
@@ -785,32 +3915,160 @@ class ImageAnalyzerGUI:
             except Exception as e:
                 messagebox.showerror("Error", f"Error al guardar la imagen: {str(e)}")
     
+    def _ask_export_settings(self):
+        """Diálogo con el formato y la calidad de la exportación masiva"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Exportar todas las imágenes")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        fmt_var = tk.StringVar(value="png")
+        quality_var = tk.IntVar(value=EXPORT_FORMATS["png"][2])
+        result = {}
+        
+        ttk.Label(dialog, text="Formato:").grid(row=0, column=0, sticky=tk.W, padx=10, pady=5)
+        fmt_combo = ttk.Combobox(dialog, textvariable=fmt_var, values=list(EXPORT_FORMATS), state="readonly", width=8)
+        fmt_combo.grid(row=0, column=1, sticky=tk.W, padx=10, pady=5)
+        quality_text = ttk.Label(dialog, text="")
+        quality_text.grid(row=1, column=0, sticky=tk.W, padx=10, pady=5)
+        quality_spin = ttk.Spinbox(dialog, textvariable=quality_var, width=6)
+        quality_spin.grid(row=1, column=1, sticky=tk.W, padx=10, pady=5)
+        
+        def on_format_change(event=None):
+            _, _, default, low, high = EXPORT_FORMATS[fmt_var.get()]
+            quality_spin.config(from_=low, to=high)
+            quality_var.set(default)
+            label = "Compresión PNG (0-9):" if fmt_var.get() == "png" else f"Calidad ({low}-{high}):"
+            quality_text.config(text=label)
+        
+        def accept():
+            try:
+                result["settings"] = (fmt_var.get(), quality_var.get())
+            except tk.TclError:
+                messagebox.showerror("Error", "Valor de calidad no válido", parent=dialog)
+                return
+            dialog.destroy()
+        
+        fmt_combo.bind("<<ComboboxSelected>>", on_format_change)
+        on_format_change()
+        buttons = ttk.Frame(dialog)
+        buttons.grid(row=2, column=0, columnspan=2, pady=10)
+        ttk.Button(buttons, text="Exportar", command=accept).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Cancelar", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+        
+        self.root.wait_window(dialog)
+        return result.get("settings")
+    
+    def export_all_images(self):
+        """Exporta en segundo plano todas las imágenes de la sesión con sus controles guardados"""
+        if self.bulk_exporter is not None and not self.bulk_exporter.done_event.is_set():
+            messagebox.showwarning("Advertencia", "Ya hay una exportación en curso")
+            return
+        if not self.dialog_context.image_conversations:
+            messagebox.showwarning("Advertencia", "No hay imágenes en la sesión")
+            return
+        
+        settings = self._ask_export_settings()
+        if settings is None:
+            return
+        output_dir = filedialog.askdirectory(title="Carpeta de destino")
+        if not output_dir:
+            return
+        
+        # Los controles de la imagen activa pueden no estar guardados todavía
+        if self.video_scrubber is None:
+            self.save_control_states()
+        items = [
+            (image_id, self.dialog_context.get_display_name(image_id), conv["image_data"], conv.get("control_states") or {})
+            for image_id, conv in self.dialog_context.image_conversations.items()
+            if conv["image_data"]
+        ]
+        
+        fmt, quality = settings
+        try:
+            self.bulk_exporter = BulkExporter(items, output_dir, fmt, quality)
+            self.bulk_exporter.start()
+        except Exception as e:
+            self.bulk_exporter = None
+            messagebox.showerror("Error", f"Error al iniciar la exportación: {str(e)}")
+            return
+        self.export_progress.config(maximum=max(1, len(items)), value=0)
+        self.add_message("Sistema", f"Exportando {len(items)} imágenes ({fmt}, calidad {self.bulk_exporter.quality}) con {self.bulk_exporter.workers} procesos...", "system")
+        self._poll_bulk_export()
+    
+    def cancel_bulk_export(self):
+        if self.bulk_exporter is not None and not self.bulk_exporter.done_event.is_set():
+            self.bulk_exporter.cancel()
+    
+    def _poll_bulk_export(self):
+        """Actualiza la barra de progreso hasta que termina la exportación"""
+        exporter = self.bulk_exporter
+        if exporter is None:
+            return
+        stats = exporter.stats()
+        self.export_progress.config(value=stats["processed"])
+        self.export_status_label.config(text=format_export_stats(stats))
+        if not stats["done"]:
+            self.root.after(250, self._poll_bulk_export)
+            return
+        
+        if stats["error"]:
+            self.add_message("Sistema", f"❌ Error en la exportación: {stats['error']}", "system")
+        elif stats["cancelled"]:
+            self.add_message("Sistema", "Exportación cancelada", "system")
+        else:
+            summary = f"✓ Exportación terminada en {exporter.output_dir}: {stats['exported']} nuevas, {stats['skipped']} ya al día"
+            for name, error in stats["failed"]:
+                summary += f"\n  ❌ {name}: {error}"
+            self.add_message("Sistema", summary, "system")
+    
+    def get_control_states(self):
+        """Devuelve el estado actual de los controles como diccionario"""
+        return {
+            "brightness": self.brightness_var.get(),
+            "contrast": self.contrast_var.get(),
+            "blur": self.blur_var.get(),
+            "sharpen": self.sharpen_var.get(),
+            "rotation": self.rotation_var.get(),
+            "grayscale": self.grayscale_var.get(),
+            "flip_h": self.flip_h,
+            "flip_v": self.flip_v
+        }
+    
+    def get_image_digest(self, image_id, image, control_states):
+        """Resumen estadístico de la imagen editada; solo se recalcula si cambian la imagen o los controles"""
+        key = (image_id, tuple(sorted(control_states.items())))
+        if self._digest_key != key:
+            with perf_stats.stage("digest.compute"):
+                self._digest = compute_image_digest(image)
+            self._digest_key = key
+        return self._digest
+    
     def save_control_states(self):
         """Guarda el estado actual de los controles y la imagen procesada"""
-        if self.dialog_context.current_image_name in self.dialog_context.image_conversations:
+        if self.dialog_context.current_image_id in self.dialog_context.image_conversations:
             # Guardar estados de controles
-            control_states = {
-                "brightness": self.brightness_var.get(),
-                "contrast": self.contrast_var.get(),
-                "blur": self.blur_var.get(),
-                "sharpen": self.sharpen_var.get(),
-                "rotation": self.rotation_var.get(),
-                "grayscale": self.grayscale_var.get(),
-                "flip_h": self.flip_h,
-                "flip_v": self.flip_v
-            }
-            self.dialog_context.image_conversations[self.dialog_context.current_image_name]["control_states"] = control_states
+            control_states = self.get_control_states()
+            self.dialog_context.image_conversations[self.dialog_context.current_image_id]["control_states"] = control_states
             
             # Guardar imagen procesada en base64
             if self.processed_image is not None:
                 _, buffer = cv2.imencode('.jpg', self.processed_image)
                 img_base64 = base64.b64encode(buffer).decode('utf-8')
-                self.dialog_context.image_conversations[self.dialog_context.current_image_name]["processed_image"] = img_base64
+                self.dialog_context.image_conversations[self.dialog_context.current_image_id]["processed_image"] = img_base64
+    
+    def refresh_control_labels(self):
+        """Sincroniza las etiquetas de los sliders con sus variables"""
+        self.brightness_label.config(text=f"Brillo: {self.brightness_var.get()}")
+        self.contrast_label.config(text=f"Contraste: {self.contrast_var.get():.2f}")
+        self.blur_label.config(text=f"Desenfoque: {self.blur_var.get()}")
+        self.sharpen_label.config(text=f"Nitidez: {self.sharpen_var.get():.1f}")
+        self.rotation_label.config(text=f"Rotación: {self.rotation_var.get()}°")
     
     def load_control_states(self):
         """Carga el estado de los controles y la imagen procesada"""
-        if self.dialog_context.current_image_name in self.dialog_context.image_conversations:
-            conv_data = self.dialog_context.image_conversations[self.dialog_context.current_image_name]
+        if self.dialog_context.current_image_id in self.dialog_context.image_conversations:
+            conv_data = self.dialog_context.image_conversations[self.dialog_context.current_image_id]
             control_states = conv_data.get("control_states", {})
             
             if control_states:
@@ -825,11 +4083,7 @@ class ImageAnalyzerGUI:
                 self.flip_v = control_states.get("flip_v", False)
                 
                 # Actualizar labels
-                self.brightness_label.config(text=f"Brillo: {self.brightness_var.get()}")
-                self.contrast_label.config(text=f"Contraste: {self.contrast_var.get():.2f}")
-                self.blur_label.config(text=f"Desenfoque: {self.blur_var.get()}")
-                self.sharpen_label.config(text=f"Nitidez: {self.sharpen_var.get():.1f}")
-                self.rotation_label.config(text=f"Rotación: {self.rotation_var.get()}°")
+                self.refresh_control_labels()
             
             # Cargar imagen procesada si existe
             processed_img_b64 = conv_data.get("processed_image")
@@ -847,66 +4101,42 @@ class ImageAnalyzerGUI:
             messagebox.showwarning("Advertencia", "Primero debes cargar una imagen")
             return
         
+        image_id = self.dialog_context.current_image_id
+        if not self._model_available():
+            # Se lanza en cuanto el modelo esté listo o termine la petición en curso
+            self._deferred_analysis = image_id
+            reason = "el asistente esté listo" if not self.model_ready else "termine la petición en curso"
+            self.add_message("Sistema", f"⏳ El análisis comenzará cuando {reason}", "system")
+            return
+        
         self.add_message("Sistema", "Analizando imagen...", "system")
-        self.send_button.config(state=tk.DISABLED)
+        self._pending_analyses.add(image_id)
+        self._begin_request()
         
-        # Ejecutar en un hilo separado para no bloquear la UI
-        thread = threading.Thread(target=self._analyze_image_thread)
+        # Ejecutar en un hilo separado para no bloquear la UI; la petición usa una instantánea de la imagen actual
+        request = (image_id, self.dialog_context.current_image_data, self.processed_image, self.get_control_states())
+        thread = threading.Thread(target=self._analyze_image_thread, args=request)
         thread.daemon = True
         thread.start()
     
-    def _analyze_image_thread(self):
-        """Hilo para analizar la imagen"""
+    def _finish_analysis(self, image_id):
+        """Marca el análisis de ese contenido como terminado y rehabilita los botones"""
+        self._pending_analyses.discard(image_id)
+        self._finish_request()
+    
+    def _analyze_image_thread(self, image_id, image_data, processed_image, control_states):
+        """Hilo para analizar la imagen; la respuesta se guarda en la conversación de image_id"""
         try:
-            # Codificar imagen original
-            img_base64_original = base64.b64encode(self.dialog_context.current_image_data).decode('utf-8')
-            
-            # Obtener valores actuales de los controles
-            control_info = f"""\n\nVALORES ACTUALES DE LOS CONTROLES DEL EDITOR:
-- Brillo: {self.brightness_var.get()}
-- Contraste: {self.contrast_var.get():.2f}
-- Desenfoque: {self.blur_var.get()}
-- Nitidez: {self.sharpen_var.get():.1f}
-- Rotación: {self.rotation_var.get()}°
-- Escala de grises: {'Activada' if self.grayscale_var.get() else 'Desactivada'}
-- Volteo horizontal: {'Sí' if self.flip_h else 'No'}
-- Volteo vertical: {'Sí' if self.flip_v else 'No'}
-"""
-            
-            # Codificar imagen procesada si existe y es diferente
-            content_parts = [{"type": "text", "text": VISION_PROMPT + control_info}]
-            
-            # Agregar imagen original
-            content_parts.append({
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/jpeg;base64,{img_base64_original}"
-                }
-            })
+            # Construir petición con los valores de los controles al pulsar Analizar
+            content_parts = build_vision_content(image_data, processed_image, control_states)
             
-            # Agregar imagen procesada si existe
-            if self.processed_image is not None:
-                # Convertir imagen procesada a bytes
-                _, buffer = cv2.imencode('.jpg', self.processed_image)
-                img_base64_processed = base64.b64encode(buffer).decode('utf-8')
-                content_parts.append({
-                    "type": "text",
-                    "text": "Esta es la imagen después de las ediciones del usuario:"
-                })
-                content_parts.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{img_base64_processed}"
-                    }
-                })
-            
-            message = HumanMessage(content=content_parts)
-            
-            response = llm.invoke([message])
+            response_content, usage = invoke_model_with_usage(content_parts, kind="analysis")
+            self.dialog_context.record_usage(image_id, usage)
+            self.dialog_context.record_image_turn(control_states, attached=True, image_id=image_id)
             
-            if response.content:
-                self.dialog_context.add_to_history(True, response.content)
-                self.root.after(0, lambda: self._process_agent_response(response.content))
+            if response_content:
+                self.dialog_context.add_to_history(True, response_content, image_id=image_id)
+                self.root.after(0, lambda: self._on_model_reply(image_id, response_content))
             else:
                 self.root.after(0, lambda: self.add_message("Sistema", "No se pudo generar una descripción", "system"))
         
@@ -916,12 +4146,105 @@ class ImageAnalyzerGUI:
             self.root.after(0, lambda err=error_text: self.add_message("Sistema", f"❌ Error: {err}", "system"))
         
         finally:
-            self.root.after(0, lambda: self.send_button.config(state=tk.NORMAL))
+            self.root.after(0, lambda: self._finish_analysis(image_id))
+    
+    def _on_model_reply(self, image_id, response_text):
+        """Muestra la respuesta solo si su imagen sigue activa; si no, queda en su conversación"""
+        if image_id == self.dialog_context.current_image_id:
+            self._process_agent_response(response_text)
+        else:
+            name = self.dialog_context.get_display_name(image_id)
+            self.add_message("Sistema", f"Respuesta recibida para {name}; se verá al volver a esa imagen.", "system")
     
     def _process_agent_response(self, response_text):
         """Procesa la respuesta del agente (solo muestra sugerencias)"""
         # Mostrar respuesta del agente
         self.add_message("Asistente", response_text, "assistant")
+        self._prepare_suggestions(response_text)
+    
+    def _clear_suggestions(self):
+        """Descarta los chips actuales; los renders en curso de la generación anterior se ignoran"""
+        self._suggestion_generation += 1
+        self.suggestions = []
+        for child in self.suggestion_chips_frame.winfo_children():
+            child.destroy()
+        self.suggestion_frame.grid_remove()
+    
+    def _prepare_suggestions(self, response_text):
+        """Extrae los valores sugeridos y renderiza sus miniaturas en segundo plano"""
+        self._clear_suggestions()
+        if self.original_image is None:
+            return
+        suggestions = extract_suggested_adjustments(response_text, self.get_control_states())
+        if not suggestions:
+            return
+        
+        generation = self._suggestion_generation
+        source = self.original_image
+        for index, suggestion in enumerate(suggestions):
+            suggestion["source"] = source
+            suggestion["full"] = None
+            suggestion["button"] = tk.Button(
+                self.suggestion_chips_frame, text=format_adjustment_label(suggestion["changes"], suggestion["states"]),
+                compound=tk.LEFT, font=('Arial', 8), command=lambda i=index: self.apply_suggestion(i)
+            )
+            suggestion["button"].pack(side=tk.LEFT, padx=3)
+        self.suggestions = suggestions
+        self.suggestion_frame.grid()
+        
+        states_list = [suggestion["states"] for suggestion in suggestions]
+        self.suggestion_pool.submit(self._render_suggestions, generation, source, states_list)
+    
+    def _render_suggestions(self, generation, source, states_list):
+        """Hilo de fondo: miniaturas sobre un proxy y, para los primeros chips, la imagen a resolución completa"""
+        try:
+            with perf_stats.stage("suggestions.proxy"):
+                proxy = make_proxy(source, SUGGESTION_PROXY_SIZE)
+                for index, states in enumerate(states_list):
+                    if generation != self._suggestion_generation:
+                        return
+                    preview = render_edits(proxy, states)
+                    chip = cv2.cvtColor(make_proxy(preview, SUGGESTION_CHIP_SIZE), cv2.COLOR_BGR2RGB)
+                    self.root.after(0, lambda i=index, c=chip: self._on_suggestion_preview(generation, i, c))
+            # El resto de chips se renderiza al aplicarlos
+            for index, states in enumerate(states_list[:SUGGESTION_FULL_RENDERS]):
+                if generation != self._suggestion_generation:
+                    return
+                with perf_stats.stage("suggestions.full"):
+                    full = render_edits(source, states)
+                self.root.after(0, lambda i=index, f=full: self._on_suggestion_rendered(generation, i, f))
+        except Exception as e:
+            print(f"Error al pre-renderizar sugerencias: {e}")
+    
+    def _on_suggestion_preview(self, generation, index, chip_rgb):
+        if generation != self._suggestion_generation:
+            return
+        suggestion = self.suggestions[index]
+        suggestion["photo"] = ImageTk.PhotoImage(Image.fromarray(chip_rgb))
+        suggestion["button"].config(image=suggestion["photo"])
+    
+    def _on_suggestion_rendered(self, generation, index, full_image):
+        if generation == self._suggestion_generation:
+            self.suggestions[index]["full"] = full_image
+    
+    def apply_suggestion(self, index):
+        """Aplica un chip: cambia a la imagen ya renderizada si está lista, si no la renderiza"""
+        if index >= len(self.suggestions) or self.original_image is None:
+            return
+        suggestion = self.suggestions[index]
+        self._set_control_vars(suggestion["states"])
+        ready = suggestion["full"]
+        if ready is not None and suggestion["source"] is self.original_image:
+            with perf_stats.stage("suggestions.apply"):
+                control_states = self.get_control_states()
+                self.processed_image = ready
+                self._record_edit(control_states)
+                self.display_images()
+                self.save_control_states()
+        else:
+            self.apply_all_edits()
+        for other in self.suggestions:
+            other["button"].config(relief=tk.SUNKEN if other is suggestion else tk.RAISED)
     
     def send_message(self):
         """Envía un mensaje del usuario al agente"""
@@ -934,77 +4257,62 @@ class ImageAnalyzerGUI:
             messagebox.showwarning("Advertencia", "Primero debes cargar una imagen")
             return
         
+        if not self.model_ready:
+            self.add_message("Sistema", "⏳ El asistente aún se está inicializando, intenta de nuevo en unos segundos", "system")
+            return
+        
+        if self._requests_in_flight:
+            self.add_message("Sistema", "⏳ Espera a que termine la respuesta en curso", "system")
+            return
+        
         # Mostrar mensaje del usuario
         self.add_message("Tú", message, "user")
         self.message_entry.delete(0, tk.END)
-        self.send_button.config(state=tk.DISABLED)
+        self._dispatch_message(message)
+    
+    def _dispatch_message(self, message):
+        """Envía un mensaje al agente en un hilo separado"""
+        self._begin_request()
         
         # Mostrar indicador de procesamiento
         self.add_message("Sistema", "⏳ Procesando mensaje...", "system")
         
-        # Procesar respuesta en hilo separado
-        thread = threading.Thread(target=self._process_message_thread, args=(message,))
+        # Procesar respuesta en hilo separado con una instantánea de la imagen actual
+        processed = self.processed_image if self.processed_image is not None else self.original_image
+        request = (message, self.dialog_context.current_image_id, self.dialog_context.current_image_data,
+                   processed, self.get_control_states())
+        thread = threading.Thread(target=self._process_message_thread, args=request)
         thread.daemon = True
         thread.start()
     
-    def _process_message_thread(self, user_message):
-        """Hilo para procesar el mensaje del usuario"""
+    def _process_message_thread(self, user_message, image_id, image_data, processed_image, control_states):
+        """Hilo para procesar el mensaje del usuario; la respuesta se guarda en la conversación de image_id"""
         try:
-            self.dialog_context.add_to_history(False, user_message)
-            
-            # Obtener valores actuales de los controles
-            control_info = f"""\n\nVALORES ACTUALES DE LOS CONTROLES DEL EDITOR:
-- Brillo: {self.brightness_var.get()}
-- Contraste: {self.contrast_var.get():.2f}
-- Desenfoque: {self.blur_var.get()}
-- Nitidez: {self.sharpen_var.get():.1f}
-- Rotación: {self.rotation_var.get()}°
-- Escala de grises: {'Activada' if self.grayscale_var.get() else 'Desactivada'}
-- Volteo horizontal: {'Sí' if self.flip_h else 'No'}
-- Volteo vertical: {'Sí' if self.flip_v else 'No'}
-"""
-            
-            # Usar solo el contexto de la imagen actual
-            # Usar replace en lugar de format para evitar problemas con llaves {} en el contexto
-            context_string = self.dialog_context.get_context_string()
-            prompt_with_context = DIALOG_PROMPT.replace("{context}", context_string).replace("{user_input}", user_message) + control_info
-            
-            # Codificar imagen original
-            img_base64_original = base64.b64encode(self.dialog_context.current_image_data).decode('utf-8')
+            self.dialog_context.add_to_history(False, user_message, image_id=image_id)
             
-            # Construir contenido del mensaje
-            content_parts = [{"type": "text", "text": prompt_with_context}]
+            # Adjuntar imágenes solo si la política lo pide; el resumen local acompaña siempre
+            attach_images = self.dialog_context.should_attach_images(control_states, user_message, image_id=image_id)
+            digest_text = format_image_digest(self.get_image_digest(image_id, processed_image, control_states))
             
-            # Agregar imagen original
-            content_parts.append({
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/jpeg;base64,{img_base64_original}"
-                }
-            })
-            
-            # Agregar imagen procesada si existe
-            if self.processed_image is not None:
-                _, buffer = cv2.imencode('.jpg', self.processed_image)
-                img_base64_processed = base64.b64encode(buffer).decode('utf-8')
-                content_parts.append({
-                    "type": "text",
-                    "text": "Esta es la versión editada actual:"
-                })
-                content_parts.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{img_base64_processed}"
-                    }
-                })
-            
-            message = HumanMessage(content=content_parts)
+            # Usar solo el contexto de la imagen de la petición
+            content_parts = build_dialog_content(
+                image_data,
+                processed_image,
+                control_states,
+                self.dialog_context.get_context_string(image_id),
+                user_message,
+                attach_images=attach_images,
+                digest_text=digest_text
+            )
             
-            response = llm.invoke([message])
+            kind = "chat_images" if attach_images else "chat_digest"
+            response_content, usage = invoke_model_with_usage(content_parts, kind=kind)
+            self.dialog_context.record_usage(image_id, usage)
+            self.dialog_context.record_image_turn(control_states, attached=attach_images, image_id=image_id)
             
-            if response.content:
-                self.dialog_context.add_to_history(True, response.content)
-                self.root.after(0, lambda: self._process_agent_response(response.content))
+            if response_content:
+                self.dialog_context.add_to_history(True, response_content, image_id=image_id)
+                self.root.after(0, lambda: self._on_model_reply(image_id, response_content))
             else:
                 self.root.after(0, lambda: self.add_message("Sistema", "No se pudo generar una respuesta", "system"))
         
@@ -1018,7 +4326,55 @@ class ImageAnalyzerGUI:
             self.root.after(0, lambda err=error_text: self.add_message("Sistema", f"❌ Error: {err}", "system"))
         
         finally:
-            self.root.after(0, lambda: self.send_button.config(state=tk.NORMAL))
+            self.root.after(0, self._finish_request)
+    
+    def show_usage_summary(self):
+        """Ventana con tokens, bytes de imagen y latencia por imagen y totales de la sesión"""
+        summary = self.dialog_context.get_usage_summary()
+        window = tk.Toplevel(self.root)
+        window.title("Consumo del modelo")
+        window.geometry("820x360")
+        
+        columns = ("calls", "prompt", "response", "images", "latency", "p50", "max")
+        headings = ("Llamadas", "Tokens entrada", "Tokens salida", "Imágenes (KB)", "Latencia total (s)", "p50 (ms)", "máx (ms)")
+        tree = ttk.Treeview(window, columns=columns, height=12)
+        tree.heading("#0", text="Imagen")
+        tree.column("#0", width=200)
+        for column, heading in zip(columns, headings):
+            tree.heading(column, text=heading)
+            tree.column(column, width=85, anchor=tk.E)
+        
+        def row(totals):
+            return (
+                totals["calls"], totals["prompt_tokens"], totals["response_tokens"],
+                f"{totals['image_bytes'] / 1024:.0f}", f"{totals['latency_ms'] / 1000:.1f}",
+                f"{totals['latency_p50_ms']:.0f}", f"{totals['latency_max_ms']:.0f}"
+            )
+        
+        # Las imágenes más caras primero
+        ranked = sorted(summary["images"].items(), key=lambda item: item[1]["prompt_tokens"] + item[1]["response_tokens"], reverse=True)
+        for image_name, totals in ranked:
+            tree.insert("", tk.END, text=image_name, values=row(totals))
+        tree.insert("", tk.END, text="TOTAL SESIÓN", values=row(summary["session"]), tags=("total",))
+        tree.tag_configure("total", font=('Arial', 9, 'bold'))
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 5))
+        
+        ttk.Button(window, text="📄 Exportar CSV", command=lambda: self.export_usage_csv(window)).pack(pady=(0, 10))
+    
+    def export_usage_csv(self, parent=None):
+        """Exporta el registro de llamadas al modelo a CSV"""
+        file_path = filedialog.asksaveasfilename(
+            parent=parent,
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+            title="Exportar Consumo"
+        )
+        if file_path:
+            success, message = self.dialog_context.export_usage_csv(file_path)
+            if success:
+                self.add_message("Sistema", f"✓ {message}", "system")
+            else:
+                messagebox.showerror("Error", message)
     
     def save_conversation(self):
         """Guarda la conversación en formato JSON"""
@@ -1052,18 +4408,26 @@ class ImageAnalyzerGUI:
             success, message = self.dialog_context.load_conversation_from_json(file_path)
             
             if success:
+                # Las imágenes anteriores ya no pertenecen a la sesión (ni su historial de deshacer)
+                self.image_cache.clear()
+                self.timelines.clear()
+                self.render_checkpoints.clear()
+                self.refresh_gallery()
                 self.add_message("Sistema", f"✓ {message}", "system")
-                self.add_message("Sistema", f"Imágenes cargadas: {', '.join(self.dialog_context.get_all_images())}", "system")
+                image_names = [self.dialog_context.get_display_name(image_id) for image_id in self.dialog_context.get_all_images()]
+                self.add_message("Sistema", f"Imágenes cargadas: {', '.join(image_names)}", "system")
                 
                 # Cargar la imagen actual si existe
                 if self.dialog_context.current_image_data:
                     # Convertir bytes a imagen OpenCV
-                    nparr = np.frombuffer(self.dialog_context.current_image_data, np.uint8)
-                    self.original_image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+                    self.original_image = decode_image_bytes(self.dialog_context.current_image_data)
                     
                     if self.original_image is not None:
+                        self._close_video()
                         # Cargar estados de controles
                         self.load_control_states()
+                        self._start_edit_session()
+                        self.refresh_gallery()
                         
                         # Mostrar ambas imágenes
                         self.display_images()
@@ -1077,22 +4441,378 @@ class ImageAnalyzerGUI:
                         # Mostrar historial de la imagen actual
                         messages = self.dialog_context.get_current_messages()
                         if messages:
-                            self.add_message("Sistema", f"--- Historial de {self.dialog_context.current_image_name} ---", "system")
+                            history = [("Sistema", f"--- Historial de {self.dialog_context.current_image_name} ---", "system")]
                             for msg in messages:
-                                if isinstance(msg, AIMessage):
-                                    self.add_message("Asistente", msg.content, "assistant")
+                                if msg.type == "ai":
+                                    history.append(("Asistente", msg.content, "assistant"))
                                 else:
-                                    self.add_message("Tú", msg.content, "user")
+                                    history.append(("Tú", msg.content, "user"))
+                            self.add_messages(history)
                 
                 messagebox.showinfo("Éxito", message)
             else:
                 self.add_message("Sistema", f"✗ {message}", "system")
                 messagebox.showerror("Error", message)
 
+# ===== MODO SERVIDOR HTTP (sin interfaz gráfica) =====
+class SessionLimitError(ValueError):
+    """La sesión excede los límites de memoria configurados"""
+
+class ServerSession:
+    """Estado de una conversación del servidor: imagen, controles y DialogContext propio"""
+    def __init__(self, session_id, image_bytes, image, name):
+        self.session_id = session_id
+        self.name = name
+        self.dialog_context = DialogContext()
+        self.dialog_context.set_current_image(image_bytes, name)
+        self.original_image = image
+        self.processed_image = None
+        self.control_states = dict(DEFAULT_CONTROL_STATES)
+        self.analysis_status = "pending"
+        self.analysis_error = None
+        self.analysis_message = None  # Respuesta del análisis inicial (no se recorta)
+        self._digest = None
+        self._digest_key = None
+        self.last_access = time.time()
+        self.state_lock = threading.Lock()  # Protege imagen procesada y controles
+        self.chat_lock = threading.Lock()   # Serializa los turnos de conversación
+
+    @staticmethod
+    def image_reservation(image_bytes, image):
+        """Memoria reservada para la imagen: bytes originales, decodificada y un render del mismo tamaño"""
+        return len(image_bytes) + 2 * image.nbytes
+
+    def history_bytes(self):
+        return sum(len(message.content.encode('utf-8')) for message in self.dialog_context.get_current_messages())
+
+    def memory_bytes(self):
+        """Memoria aproximada retenida por la sesión"""
+        total = len(self.dialog_context.current_image_data) + self.original_image.nbytes
+        if self.processed_image is not None:
+            total += self.processed_image.nbytes
+        return total + self.history_bytes()
+
+    def get_image_digest(self, processed_image, control_states):
+        """Resumen estadístico cacheado por estado de controles"""
+        key = tuple(sorted(control_states.items()))
+        if self._digest_key != key:
+            image = processed_image if processed_image is not None else self.original_image
+            with perf_stats.stage("digest.compute"):
+                self._digest = compute_image_digest(image)
+            self._digest_key = key
+        return self._digest
+
+    def trim_history(self, max_bytes):
+        """Descarta los mensajes más antiguos mientras el historial supere su parte del límite"""
+        # Las imágenes ya tienen su memoria reservada desde create_session: aquí solo cuenta el texto.
+        # El análisis inicial y el último intercambio se conservan siempre.
+        budget = max_bytes - self.image_reservation(self.dialog_context.current_image_data, self.original_image)
+        messages = self.dialog_context.get_current_messages()
+        removable = [m for m in messages[:-2] if m is not self.analysis_message]
+        excess = self.history_bytes() - budget
+        for message in removable:
+            if excess <= 0:
+                break
+            messages.remove(message)
+            excess -= len(message.content.encode('utf-8'))
+
+class AnalyzerService:
+    """Análisis y edición para muchos clientes; independiente de HTTP y del modelo concreto"""
+    def __init__(self, model=None, render_workers=4, model_workers=8, max_session_bytes=64 * 1024 * 1024,
+                 max_sessions=100, model_timeout=120.0):
+        self.model = model  # None = cliente global (get_llm)
+        self.render_pool = ThreadPoolExecutor(max_workers=render_workers, thread_name_prefix="render")
+        self.model_pool = ThreadPoolExecutor(max_workers=model_workers, thread_name_prefix="model")
+        self.max_session_bytes = max_session_bytes
+        self.max_sessions = max_sessions
+        self.model_timeout = model_timeout
+        self.sessions = OrderedDict()  # Orden LRU: la más reciente al final
+        self._lock = threading.Lock()
+
+    def _invoke(self, session, content_parts, kind):
+        response_content, usage = invoke_model_with_usage(content_parts, model=self.model, kind=kind)
+        session.dialog_context.record_usage(session.dialog_context.current_image_id, usage)
+        return response_content
+
+    def create_session(self, image_bytes, name="upload", analyze=True):
+        """Decodifica la imagen, crea la conversación y lanza el análisis inicial en segundo plano"""
+        image = decode_image_bytes(image_bytes)
+        if image is None:
+            raise ValueError("No se pudo decodificar la imagen")
+        if ServerSession.image_reservation(image_bytes, image) > self.max_session_bytes:
+            raise SessionLimitError("La imagen (original, decodificada y renderizada) excede el límite de memoria por sesión")
+        
+        session = ServerSession(uuid.uuid4().hex, image_bytes, image, name)
+        with self._lock:
+            self.sessions[session.session_id] = session
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        
+        if analyze:
+            self.model_pool.submit(self._analyze_session, session)
+        else:
+            session.analysis_status = "skipped"
+        return session.session_id
+
+    def _analyze_session(self, session):
+        """Análisis inicial con VISION_PROMPT (se ejecuta en el pool del modelo)"""
+        with session.chat_lock:
+            session.analysis_status = "running"
+            try:
+                content_parts = build_vision_content(
+                    session.dialog_context.current_image_data, None, session.control_states
+                )
+                response_content = self._invoke(session, content_parts, "analysis")
+                session.dialog_context.record_image_turn(session.control_states, attached=True)
+                if response_content:
+                    session.dialog_context.add_to_history(True, response_content)
+                    session.analysis_message = session.dialog_context.get_current_messages()[-1]
+                session.analysis_status = "done"
+            except Exception as e:
+                session.analysis_status = "error"
+                session.analysis_error = str(e)
+            session.trim_history(self.max_session_bytes)
+
+    def get_session(self, session_id):
+        """Devuelve la sesión y la marca como usada recientemente"""
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                raise KeyError(session_id)
+            self.sessions.move_to_end(session_id)
+        session.last_access = time.time()
+        return session
+
+    def delete_session(self, session_id):
+        with self._lock:
+            if self.sessions.pop(session_id, None) is None:
+                raise KeyError(session_id)
+
+    def describe_session(self, session_id):
+        session = self.get_session(session_id)
+        return {
+            "conversation_id": session.session_id,
+            "name": session.name,
+            "control_states": session.control_states,
+            "analysis_status": session.analysis_status,
+            "analysis_error": session.analysis_error,
+            "memory_bytes": session.memory_bytes(),
+            "usage": session.dialog_context.get_usage_summary()["session"],
+            "messages": [
+                {"type": message.type, "content": message.content}
+                for message in session.dialog_context.get_current_messages()
+            ]
+        }
+
+    def render(self, session_id, control_states, image_format="jpg", quality=90):
+        """Aplica un estado de controles en el pool de render y devuelve la imagen codificada"""
+        session = self.get_session(session_id)
+        if not isinstance(control_states, dict):
+            raise ValueError("El cuerpo debe ser un objeto JSON con los controles")
+        states = normalize_control_states(control_states)
+        if image_format not in ("jpg", "png"):
+            raise ValueError(f"Formato no soportado: {image_format}")
+        
+        def work():
+            img = render_edits(session.original_image, states)
+            if image_format == "png":
+                ok, buffer = cv2.imencode('.png', img)
+            else:
+                ok, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+            if not ok:
+                raise ValueError("No se pudo codificar la imagen")
+            return img, buffer.tobytes()
+        
+        img, encoded = self.render_pool.submit(work).result()
+        with session.state_lock:
+            session.processed_image = img
+            session.control_states = states
+        return encoded
+
+    def chat(self, session_id, user_message):
+        """Turno de conversación con DIALOG_PROMPT; la llamada al modelo corre en su propio pool"""
+        session = self.get_session(session_id)
+        if not isinstance(user_message, str) or not user_message.strip():
+            raise ValueError("El mensaje está vacío")
+        user_message = user_message.strip()
+        
+        def work():
+            with session.chat_lock:
+                session.dialog_context.add_to_history(False, user_message)
+                with session.state_lock:
+                    processed_image = session.processed_image
+                    control_states = dict(session.control_states)
+                attach_images = session.dialog_context.should_attach_images(control_states, user_message)
+                digest = session.get_image_digest(processed_image, control_states)
+                content_parts = build_dialog_content(
+                    session.dialog_context.current_image_data,
+                    processed_image,
+                    control_states,
+                    session.dialog_context.get_context_string(),
+                    user_message,
+                    attach_images=attach_images,
+                    digest_text=format_image_digest(digest)
+                )
+                kind = "chat_images" if attach_images else "chat_digest"
+                response_content = self._invoke(session, content_parts, kind)
+                session.dialog_context.record_image_turn(control_states, attached=attach_images)
+                if response_content:
+                    session.dialog_context.add_to_history(True, response_content)
+                session.trim_history(self.max_session_bytes)
+                return response_content
+        
+        return self.model_pool.submit(work).result(timeout=self.model_timeout)
+
+    def stats(self):
+        with self._lock:
+            sessions = list(self.sessions.values())
+        return {
+            "sessions": len(sessions),
+            "memory_bytes": sum(session.memory_bytes() for session in sessions)
+        }
+
+    def shutdown(self):
+        self.render_pool.shutdown(wait=False)
+        self.model_pool.shutdown(wait=False)
+
+class AnalyzerRequestHandler(BaseHTTPRequestHandler):
+    """Rutas HTTP del modo servidor sobre un AnalyzerService"""
+    service = None
+    max_upload_bytes = 32 * 1024 * 1024
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_bytes(self, content_type, body):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length > self.max_upload_bytes:
+            raise SessionLimitError("El cuerpo de la petición es demasiado grande")
+        return self.rfile.read(length)
+
+    def _read_json(self):
+        body = self._read_body()
+        payload = json.loads(body.decode('utf-8')) if body else {}
+        if not isinstance(payload, dict):
+            raise ValueError("El cuerpo debe ser un objeto JSON")
+        return payload
+
+    def _route(self, method):
+        parsed = urlparse(self.path)
+        parts = [part for part in parsed.path.split("/") if part]
+        query = parse_qs(parsed.query)
+        try:
+            if method == "GET" and parts == ["health"]:
+                return self._send_json(200, self.service.stats())
+            if method == "POST" and parts == ["sessions"]:
+                name = query.get("name", ["upload"])[0]
+                analyze = query.get("analyze", ["1"])[0] != "0"
+                session_id = self.service.create_session(self._read_body(), name, analyze)
+                return self._send_json(201, {"conversation_id": session_id})
+            if len(parts) >= 2 and parts[0] == "sessions":
+                session_id = parts[1]
+                if method == "GET" and len(parts) == 2:
+                    return self._send_json(200, self.service.describe_session(session_id))
+                if method == "DELETE" and len(parts) == 2:
+                    self.service.delete_session(session_id)
+                    return self._send_json(200, {"deleted": session_id})
+                if method == "POST" and parts[2:] == ["render"]:
+                    image_format = query.get("format", ["jpg"])[0]
+                    quality = int(query.get("quality", ["90"])[0])
+                    encoded = self.service.render(session_id, self._read_json(), image_format, quality)
+                    content_type = "image/png" if image_format == "png" else "image/jpeg"
+                    return self._send_bytes(content_type, encoded)
+                if method == "POST" and parts[2:] == ["chat"]:
+                    payload = self._read_json()
+                    response_content = self.service.chat(session_id, payload.get("message", ""))
+                    return self._send_json(200, {"response": response_content})
+            return self._send_json(404, {"error": "Ruta no encontrada"})
+        except KeyError:
+            return self._send_json(404, {"error": "Conversación no encontrada"})
+        except SessionLimitError as e:
+            return self._send_json(413, {"error": str(e)})
+        except (ValueError, TypeError) as e:
+            return self._send_json(400, {"error": str(e)})
+        except (TimeoutError, FutureTimeoutError):
+            return self._send_json(504, {"error": "El modelo no respondió a tiempo"})
+        except Exception as e:
+            return self._send_json(500, {"error": str(e)})
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+def create_server(service, host="127.0.0.1", port=8765):
+    """Crea el servidor HTTP enlazado a un AnalyzerService"""
+    handler = type("BoundAnalyzerRequestHandler", (AnalyzerRequestHandler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
+
+def run_server(args):
+    """Ejecuta el modo servidor hasta Ctrl+C"""
+    start_llm_warm_up()
+    service = AnalyzerService(
+        render_workers=args.render_workers,
+        model_workers=args.model_workers,
+        max_session_bytes=args.max_session_mb * 1024 * 1024,
+        max_sessions=args.max_sessions
+    )
+    server = create_server(service, args.host, args.port)
+    print(f"Servidor escuchando en http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+        perf_stats.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Editor de imágenes con asistente IA")
+    parser.add_argument("--server", action="store_true", help="Ejecutar como servicio HTTP sin interfaz gráfica")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--render-workers", type=int, default=4)
+    parser.add_argument("--model-workers", type=int, default=8)
+    parser.add_argument("--max-session-mb", type=int, default=64)
+    parser.add_argument("--max-sessions", type=int, default=100)
+    parser.add_argument("--retune", action="store_true", help="Repetir el ajuste de operadores aunque haya uno guardado")
+    parser.add_argument("--show-operators", action="store_true", help="Mostrar las implementaciones elegidas y salir")
+    return parser.parse_args(argv)
+
 def main():
+    startup_timer.mark("module_loaded")
+    args = parse_args()
+    if args.show_operators:
+        if args.retune or not operator_registry.is_tuned():
+            operator_registry.tune(force=True)
+        print(operator_registry.describe())
+        return
+    if AUTOTUNE_ENABLED or args.retune:
+        start_operator_autotune(force=args.retune)
+    if args.server:
+        run_server(args)
+        return
     root = tk.Tk()
     app = ImageAnalyzerGUI(root)
     root.mainloop()
+    perf_stats.close()
 
 if __name__ == "__main__":
     main()
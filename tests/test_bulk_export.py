@@ -0,0 +1,45 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DECODE_CACHE_MB", "0")
+
+import image_analyzer as ia
+
+
+def _png_bytes(value, h=40, w=50):
+    ok, buffer = cv2.imencode(".png", np.full((h, w, 3), value, np.uint8))
+    assert ok
+    return buffer.tobytes()
+
+
+def _export(items, output_dir):
+    exporter = ia.BulkExporter(items, output_dir, "png", workers=2)
+    exporter.start()
+    assert exporter.done_event.wait(60)
+    stats = exporter.stats()
+    assert stats["error"] is None and not stats["failed"]
+    return stats
+
+
+def test_export_deduplicates_names_and_skips_unchanged(tmp_path):
+    items = [
+        ("id-a", "a.jpg", _png_bytes(10), {}),
+        ("id-b", "a.png", _png_bytes(200), {"brightness": 20}),
+    ]
+    assert _export(items, str(tmp_path))["exported"] == 2
+    assert sorted(name for name in os.listdir(tmp_path) if not name.startswith(".")) == ["a.png", "a_2.png"]
+    assert cv2.imread(str(tmp_path / "a_2.png")).mean() == 220
+    
+    # Renombrar una imagen no cambia su salida ni obliga a exportarla de nuevo
+    renamed = [("id-b", "otro.png", items[1][2], items[1][3])]
+    stats = _export(renamed, str(tmp_path))
+    assert stats["skipped"] == 1 and stats["exported"] == 0
+    
+    # Cambiar los controles sí la vuelve a exportar, con el mismo nombre
+    changed = [("id-b", "otro.png", items[1][2], {"brightness": 30})]
+    assert _export(changed, str(tmp_path))["exported"] == 1
+    assert cv2.imread(str(tmp_path / "a_2.png")).mean() == 230
@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DECODE_CACHE_MB", "0")
+
+import image_analyzer as ia
+
+
+def _png_bytes(value, h=100, w=200):
+    ok, buffer = cv2.imencode(".png", np.full((h, w, 3), value, np.uint8))
+    assert ok
+    return buffer.tobytes()
+
+
+def _cached_keys(cache_dir):
+    return {name[:-4] for name in os.listdir(cache_dir) if name.endswith(".npy") and ".tmp" not in name}
+
+
+def test_second_decode_is_a_memory_mapped_hit(tmp_path):
+    cache = ia.DiskDecodeCache(str(tmp_path), 10 * 1024 * 1024)
+    data = _png_bytes(70)
+    first = cache.decode(data)
+    second = cache.decode(data)
+    assert isinstance(second, np.memmap)
+    assert not second.flags.writeable
+    assert np.array_equal(first, second)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_eviction_keeps_cache_within_byte_budget(tmp_path):
+    image_bytes = 100 * 200 * 3
+    cache = ia.DiskDecodeCache(str(tmp_path), int(2.5 * image_bytes))
+    keys = []
+    for value in (10, 20, 30, 40):
+        data = _png_bytes(value)
+        cache.decode(data)
+        keys.append(cache.content_key(data))
+        time.sleep(0.02)  # La fecha de modificación ordena la expulsión
+    
+    # Caben dos imágenes: se conservan las más recientes
+    assert _cached_keys(tmp_path) == set(keys[-2:])
+    total = sum(os.path.getsize(tmp_path / f"{key}.npy") for key in keys[-2:])
+    assert total <= cache.max_bytes
+
+
+def test_changed_source_file_drops_previous_entry(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache = ia.DiskDecodeCache(str(cache_dir), 10 * 1024 * 1024)
+    source = tmp_path / "foto.png"
+    
+    old_data = _png_bytes(50)
+    source.write_bytes(old_data)
+    cache.decode(source.read_bytes(), str(source))
+    old_key = cache.content_key(old_data)
+    assert old_key in _cached_keys(cache_dir)
+    
+    # El archivo se reescribe con otro contenido (cambian su tamaño y su fecha)
+    new_data = _png_bytes(50, h=120)
+    source.write_bytes(new_data)
+    image = cache.decode(source.read_bytes(), str(source))
+    assert image.shape[0] == 120
+    assert _cached_keys(cache_dir) == {cache.content_key(new_data)}
+
+
+def test_touched_source_with_same_content_keeps_entry(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache = ia.DiskDecodeCache(str(cache_dir), 10 * 1024 * 1024)
+    source = tmp_path / "foto.png"
+    data = _png_bytes(90)
+    source.write_bytes(data)
+    cache.decode(data, str(source))
+    
+    os.utime(source, (time.time() + 60, time.time() + 60))
+    cache.decode(source.read_bytes(), str(source))
+    assert _cached_keys(cache_dir) == {cache.content_key(data)}
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,94 @@
+import base64
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DECODE_CACHE_MB", "0")
+
+import image_analyzer as ia
+
+
+def _legacy_conversation(image_bytes, messages, control_states=None):
+    """Entrada de una sesión antigua: indexada por nombre de archivo, sin alias"""
+    return {
+        "messages": [{"type": kind, "content": content} for kind, content in messages],
+        "image_data": base64.b64encode(image_bytes).decode("utf-8"),
+        "image_path": None,
+        "cv2_operations": [],
+        "control_states": control_states or {},
+        "processed_image": None,
+        "usage": [{"kind": "analysis"}]
+    }
+
+
+def _load(tmp_path, data):
+    path = tmp_path / "sesion.json"
+    path.write_text(json.dumps(data), encoding="utf-8")
+    context = ia.DialogContext()
+    success, message = context.load_conversation_from_json(str(path))
+    assert success, message
+    return context
+
+
+def test_legacy_session_is_rekeyed_by_content(tmp_path):
+    data = {
+        "current_image": "gato.png",
+        "conversations": {
+            "gato.png": _legacy_conversation(b"gato", [("human", "hola"), ("ai", "un gato")]),
+            "perro.png": _legacy_conversation(b"perro", []),
+        }
+    }
+    context = _load(tmp_path, data)
+    cat_id, dog_id = ia.content_id(b"gato"), ia.content_id(b"perro")
+    assert set(context.get_all_images()) == {cat_id, dog_id}
+    assert context.image_conversations[cat_id]["aliases"] == ["gato.png"]
+    assert context.current_image_id == cat_id
+    assert [m.content for m in context.get_current_messages()] == ["hola", "un gato"]
+
+
+def test_legacy_duplicates_merge_into_one_conversation(tmp_path):
+    data = {
+        "current_image": "copia.png",
+        "conversations": {
+            "original.png": _legacy_conversation(b"mismo", [("ai", "análisis")], {"brightness": 5}),
+            "copia.png": _legacy_conversation(b"mismo", [("ai", "análisis"), ("human", "¿y el color?"),
+                                                          ("ai", "bien")], {"brightness": 30}),
+        }
+    }
+    context = _load(tmp_path, data)
+    image_id = ia.content_id(b"mismo")
+    assert context.get_all_images() == [image_id]
+    conv = context.image_conversations[image_id]
+    assert conv["aliases"] == ["original.png", "copia.png"]
+    # Se conserva la conversación más larga y se suman los consumos
+    assert len(conv["messages"]) == 3
+    assert conv["control_states"] == {"brightness": 30}
+    assert len(conv["usage"]) == 2
+    assert context.current_image_id == image_id
+
+
+def test_saved_session_round_trips_with_aliases(tmp_path):
+    context = ia.DialogContext()
+    context.set_current_image(b"contenido", "/fotos/a.png")
+    assert context.set_current_image(b"contenido", "/fotos/b.png")
+    context.add_to_history(True, "respuesta")
+    path = tmp_path / "guardada.json"
+    assert context.save_conversation_to_json(str(path))[0]
+    
+    loaded = ia.DialogContext()
+    assert loaded.load_conversation_from_json(str(path))[0]
+    image_id = ia.content_id(b"contenido")
+    assert loaded.image_conversations[image_id]["aliases"] == ["a.png", "b.png"]
+    assert loaded.find_image("b.png") == image_id
+    assert [m.content for m in loaded.get_current_messages()] == ["respuesta"]
+
+
+def test_reply_is_stored_in_the_requesting_conversation():
+    context = ia.DialogContext()
+    context.set_current_image(b"imagen a", "a.png")
+    image_a = context.current_image_id
+    context.set_current_image(b"imagen b", "b.png")
+    context.add_to_history(True, "análisis de a", image_id=image_a)
+    assert [m.content for m in context.image_conversations[image_a]["messages"]] == ["análisis de a"]
+    assert context.get_current_messages() == []
@@ -0,0 +1,72 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DECODE_CACHE_MB", "0")
+
+import image_analyzer as ia
+
+
+def _timeline():
+    timeline = ia.EditTimeline(dict(ia.DEFAULT_CONTROL_STATES))
+    timeline.COALESCE_SECONDS = 0  # Cada cambio es un paso propio
+    return timeline
+
+
+def test_steps_store_only_changed_controls():
+    timeline = _timeline()
+    assert timeline.push(dict(ia.DEFAULT_CONTROL_STATES, brightness=20))
+    assert timeline.push(dict(ia.DEFAULT_CONTROL_STATES, brightness=20, rotation=90))
+    assert not timeline.push(dict(ia.DEFAULT_CONTROL_STATES, brightness=20, rotation=90))
+    assert timeline.steps == [(("brightness", 0, 20),), (("rotation", 0, 90),)]
+
+
+def test_undo_redo_and_jump_replay_deltas():
+    timeline = _timeline()
+    timeline.push(dict(ia.DEFAULT_CONTROL_STATES, brightness=20))
+    timeline.push(dict(ia.DEFAULT_CONTROL_STATES, brightness=20, contrast=1.5))
+    
+    assert timeline.undo() == dict(ia.DEFAULT_CONTROL_STATES, brightness=20)
+    assert timeline.undo() == ia.DEFAULT_CONTROL_STATES
+    assert timeline.undo() is None
+    assert timeline.redo() == dict(ia.DEFAULT_CONTROL_STATES, brightness=20)
+    assert timeline.jump(2) == dict(ia.DEFAULT_CONTROL_STATES, brightness=20, contrast=1.5)
+    assert timeline.redo() is None
+    
+    # Un cambio nuevo tras deshacer descarta los pasos rehacibles
+    timeline.jump(1)
+    timeline.push(dict(ia.DEFAULT_CONTROL_STATES, brightness=20, grayscale=True))
+    assert len(timeline) == 2
+    assert timeline.redo() is None
+
+
+def test_consecutive_moves_of_one_slider_coalesce():
+    timeline = ia.EditTimeline(dict(ia.DEFAULT_CONTROL_STATES))
+    for value in (5, 10, 15):
+        timeline.push(dict(ia.DEFAULT_CONTROL_STATES, brightness=value))
+    assert timeline.steps == [(("brightness", 0, 15),)]
+
+
+def test_checkpoints_reuse_renders_and_respect_byte_budget():
+    image = np.random.default_rng(0).integers(0, 256, (120, 160, 3), dtype=np.uint8)
+    checkpoints = ia.RenderCheckpoints(max_bytes=3 * image.nbytes)
+    for brightness in (10, 20, 30, 40, 50):
+        result = checkpoints.render(image, {"brightness": brightness})
+        assert np.array_equal(result, ia.render_edits(image, {"brightness": brightness}))
+        assert checkpoints.current_bytes() <= 3 * image.nbytes
+    
+    # Los estados recientes siguen en caché; los más antiguos se expulsaron
+    hits = checkpoints.hits
+    checkpoints.render(image, {"brightness": 50})
+    assert checkpoints.hits == hits + 1
+    misses = checkpoints.misses
+    checkpoints.render(image, {"brightness": 10})
+    assert checkpoints.misses == misses + 1
+    
+    # Cambiar solo la rotación reutiliza el punto de control tonal
+    hits = checkpoints.hits
+    rotated = checkpoints.render(image, {"brightness": 10, "rotation": 90})
+    assert checkpoints.hits == hits + 1
+    assert np.array_equal(rotated, ia.render_edits(image, {"brightness": 10, "rotation": 90}))
@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DECODE_CACHE_MB", "0")
+
+import image_analyzer as ia
+
+
+class StatusError(Exception):
+    """Error con código de estado estructurado, como los de las librerías de Google"""
+    def __init__(self, message, code=None, status=None):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+
+
+class SlowStreamModel:
+    """Modelo falso cuyo streaming tarda más que el plazo en emitir el segundo fragmento"""
+    def stream(self, messages, **kwargs):
+        yield "hola"
+        time.sleep(1.0)
+        yield "tarde"
+
+
+class UnavailableModel:
+    """Modelo falso que siempre responde 503"""
+    def __init__(self):
+        self.calls = []
+
+    def invoke(self, messages, **kwargs):
+        self.calls.append(time.monotonic())
+        raise StatusError("servicio no disponible", code=503)
+
+
+def test_retryable_error_uses_status_fields_not_message_text():
+    assert ia.is_retryable_error(StatusError("cuota agotada", code=429))
+    assert ia.is_retryable_error(StatusError("fallo", status="UNAVAILABLE"))
+    assert ia.is_retryable_error(TimeoutError())
+    # Un "500" dentro del mensaje no convierte un error de validación en transitorio
+    assert not ia.is_retryable_error(ValueError("la imagen mide 500x502 píxeles"))
+    assert not ia.is_retryable_error(StatusError("petición inválida: 503 tokens", code=400))
+
+
+def test_retryable_error_follows_wrapped_cause():
+    try:
+        try:
+            raise StatusError("sobrecargado", code=503)
+        except StatusError as cause:
+            raise RuntimeError("fallo del cliente") from cause
+    except RuntimeError as wrapped:
+        assert ia.is_retryable_error(wrapped)
+
+
+def test_stream_respects_deadline():
+    model = ia.ResilientModel(SlowStreamModel(), timeout=0.2)
+    stream = model.stream([])
+    assert next(stream) == "hola"
+    with pytest.raises(ia.ModelCallError):
+        next(stream)
+    assert model.stats()["timeouts"] == 1
+
+
+def test_retries_stay_within_deadline_and_report_last_error():
+    inner = UnavailableModel()
+    model = ia.ResilientModel(inner, timeout=1.0, max_retries=10, backoff_initial=1.0, backoff_max=5.0)
+    start = time.monotonic()
+    with pytest.raises(ia.ModelCallError) as excinfo:
+        model.invoke([])
+    elapsed = time.monotonic() - start
+    assert elapsed < 1.2
+    assert all(call - start < 1.0 for call in inner.calls)
+    assert isinstance(excinfo.value.__cause__, StatusError)
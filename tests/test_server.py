@@ -0,0 +1,102 @@
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DECODE_CACHE_MB", "0")
+
+import image_analyzer as ia
+
+
+class StubModel:
+    """Modelo falso: responde al instante con un texto fijo"""
+    def __init__(self, reply="Sube el brillo a +20."):
+        self.reply = reply
+        self.calls = 0
+
+    def invoke(self, messages, **kwargs):
+        from langchain_core.messages import AIMessage
+        self.calls += 1
+        return AIMessage(content=f"{self.reply} ({self.calls})")
+
+
+def _image_bytes(h=300, w=400):
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    ok, buffer = cv2.imencode(".png", image)
+    assert ok
+    return buffer.tobytes(), image
+
+
+def _wait_for_analysis(service, session_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if service.get_session(session_id).analysis_status in ("done", "error"):
+            return
+        time.sleep(0.01)
+    raise AssertionError("El análisis no terminó a tiempo")
+
+
+def test_history_trim_keeps_analysis_and_latest_exchange():
+    image_bytes, image = _image_bytes()
+    # Espacio justo para la imagen, un render y muy poco texto
+    limit = ia.ServerSession.image_reservation(image_bytes, image) + 200
+    service = ia.AnalyzerService(model=StubModel("x" * 60), max_session_bytes=limit)
+    try:
+        session_id = service.create_session(image_bytes, "stub.png")
+        _wait_for_analysis(service, session_id)
+        service.render(session_id, {"brightness": 10})
+        for turn in range(5):
+            reply = service.chat(session_id, f"pregunta {turn}")
+        
+        session = service.get_session(session_id)
+        messages = session.dialog_context.get_current_messages()
+        assert messages[0] is session.analysis_message
+        assert messages[-2].content == "pregunta 4"
+        assert messages[-1].content == reply
+        assert len(messages) < 11  # Se recortaron los intercambios intermedios
+    finally:
+        service.shutdown()
+
+
+def test_create_session_rejects_images_without_room_for_a_render():
+    image_bytes, image = _image_bytes()
+    service = ia.AnalyzerService(model=StubModel(), max_session_bytes=len(image_bytes) + image.nbytes + 1)
+    try:
+        with pytest.raises(ia.SessionLimitError):
+            service.create_session(image_bytes, "grande.png", analyze=False)
+    finally:
+        service.shutdown()
+
+
+def test_http_rejects_json_bodies_that_are_not_objects():
+    image_bytes, _ = _image_bytes()
+    service = ia.AnalyzerService(model=StubModel())
+    server = ia.create_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        session_id = service.create_session(image_bytes, "stub.png", analyze=False)
+        for path in ("render", "chat"):
+            for body in ("[1, 2]", '"x"', "3"):
+                connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+                connection.request("POST", f"/sessions/{session_id}/{path}", body=body,
+                                   headers={"Content-Type": "application/json"})
+                response = connection.getresponse()
+                assert response.status == 400, (path, body)
+                assert "error" in json.loads(response.read())
+                connection.close()
+        
+        with pytest.raises(ValueError):
+            service.chat(session_id, {"message": "hola"})
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.shutdown()
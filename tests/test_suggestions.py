@@ -0,0 +1,53 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DECODE_CACHE_MB", "0")
+
+import image_analyzer as ia
+
+
+def _changes(text, **base):
+    """Cambios de la primera sugerencia (o None si la respuesta no sugiere nada)"""
+    suggestions = ia.extract_suggested_adjustments(text, dict(ia.DEFAULT_CONTROL_STATES, **base))
+    return suggestions[0]["changes"] if suggestions else None
+
+
+def test_absolute_values_for_several_controls():
+    assert _changes("Sube el brillo a +40 y el contraste a 1.3.") == {"brightness": 40, "contrast": 1.3}
+    assert _changes("**Brillo**: -25") == {"brightness": -25}
+    assert _changes("Aumenta el contraste de 1.0 a 1.3.") == {"contrast": 1.3}
+
+
+def test_current_value_is_not_taken_as_target():
+    assert _changes("El brillo está en 100 ahora; bájalo a 60.", brightness=100) == {"brightness": 60}
+    assert _changes("El contraste actual es 1.0, súbelo hasta 1.5.") == {"contrast": 1.5}
+
+
+def test_unrelated_numbers_are_ignored():
+    assert _changes("Tiene buen brillo y 3 personas en primer plano.") is None
+    assert _changes("La nitidez es correcta para una foto de 2019.") is None
+
+
+def test_relative_changes_use_current_value():
+    assert _changes("Sube el brillo en 20.", brightness=10) == {"brightness": 30}
+    assert _changes("Baja el brillo en 20.", brightness=10) == {"brightness": -10}
+
+
+def test_rotation_wraps_and_accepts_degrees():
+    assert _changes("Te recomiendo rotar la imagen -5 grados.") == {"rotation": 355}
+    assert _changes("Rota la imagen 90 grados.") == {"rotation": 90}
+
+
+def test_flip_is_absolute_and_skipped_when_applied():
+    assert _changes("Voltea la imagen horizontalmente.") == {"flip_h": True}
+    assert _changes("Voltea la imagen horizontalmente.", flip_h=True) is None
+
+
+def test_several_sentences_add_a_combined_suggestion():
+    suggestions = ia.extract_suggested_adjustments(
+        "Sube el brillo a 20. Después activa la escala de grises.", dict(ia.DEFAULT_CONTROL_STATES)
+    )
+    assert [s["changes"] for s in suggestions] == [
+        {"brightness": 20}, {"grayscale": True}, {"brightness": 20, "grayscale": True}
+    ]
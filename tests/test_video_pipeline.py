@@ -0,0 +1,38 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DECODE_CACHE_MB", "0")
+
+import image_analyzer as ia
+
+
+def _write_sequence(directory, count=5, h=48, w=64):
+    rng = np.random.default_rng(0)
+    frames = []
+    for index in range(count):
+        frame = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+        assert cv2.imwrite(os.path.join(directory, f"in_{index:04d}.png"), frame)
+        frames.append(frame)
+    return frames
+
+
+def test_pipeline_writes_readable_image_sequence(tmp_path):
+    frames = _write_sequence(str(tmp_path))
+    output_pattern = str(tmp_path / "out_%04d.png")
+    states = {"brightness": 30, "flip_h": True}
+    pipeline = ia.VideoPipeline(str(tmp_path / "in_0000.png"), output_pattern, states, workers=3, fps=10)
+    pipeline.start()
+    assert pipeline.done_event.wait(30)
+    stats = pipeline.stats()
+    assert stats["error"] is None
+    assert stats["encoded"] == len(frames)
+    
+    # Los fotogramas se escriben como PNG válidos, en orden y con las ediciones aplicadas
+    for index, frame in enumerate(frames):
+        written = cv2.imread(output_pattern % index)
+        assert written is not None
+        assert np.array_equal(written, ia.render_edits(frame, states))